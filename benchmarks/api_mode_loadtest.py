@@ -0,0 +1,97 @@
+"""
+Load test: API_GRPC_MODE=sync (blocking stubs on the threadpool) vs aio.
+
+Starts the API service once per mode with uvicorn (one worker), drives
+GET /products/{id} and GET /products from `--concurrency` closed-loop clients
+for `--duration` seconds, and prints requests/sec and latency percentiles.
+db_service (and ideally logging_service) must already be running:
+
+    DB_GRPC_HOST=localhost LOG_GRPC_HOST=localhost \
+    python benchmarks/api_mode_loadtest.py --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(BASE_DIR, "..", "src", "api_service")
+SHARED_DIR = os.path.join(BASE_DIR, "..", "src", "protos_shared")
+
+
+def start_api(mode, port):
+    env = dict(os.environ, API_GRPC_MODE=mode, PYTHONPATH=SHARED_DIR)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=API_DIR, env=env,
+    )
+
+
+async def wait_ready(client):
+    for _ in range(100):
+        try:
+            await client.get("/")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("API service did not start")
+
+
+async def worker(client, stop_at, latencies, errors):
+    while time.perf_counter() < stop_at:
+        path = "/products" if random.random() < 0.2 else f"/products/{random.randint(1, 3)}"
+        start = time.perf_counter()
+        try:
+            r = await client.get(path)
+            if r.status_code != 200:
+                errors.append(r.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(port, concurrency, duration):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits,
+                                 timeout=30) as client:
+        await wait_ready(client)
+        latencies, errors = [], []
+        stop_at = time.perf_counter() + duration
+        await asyncio.gather(*(worker(client, stop_at, latencies, errors)
+                               for _ in range(concurrency)))
+        return latencies, errors
+
+
+def pct(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", nargs="+", default=["sync", "aio"])
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--port", type=int, default=18081)
+    args = parser.parse_args()
+
+    print(f"{'mode':>6} {'req/s':>9} {'p50':>9} {'p99':>9} {'errors':>7}")
+    for mode in args.modes:
+        proc = start_api(mode, args.port)
+        try:
+            latencies, errors = asyncio.run(run(args.port, args.concurrency, args.duration))
+        finally:
+            proc.terminate()
+            proc.wait()
+        latencies.sort()
+        print(f"{mode:>6} {len(latencies) / args.duration:>9.0f} "
+              f"{pct(latencies, 0.50):>7.1f}ms {pct(latencies, 0.99):>7.1f}ms {len(errors):>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Client-side balancing over several local db_service replicas.
+
+Starts `--replicas` db_service processes on consecutive ports from `--port`
+and drives GetProduct through one DBClient from `--threads` threads:
+
+1. all replicas up: calls per replica, throughput and latency percentiles
+2. one replica killed: the failures it causes before it is ejected
+3. the replica restarted: it is taken back once --eject-seconds have passed
+
+Uses the same POSTGRES_* env vars as db_service, e.g.
+
+    POSTGRES_HOST=localhost POSTGRES_USER=dncc POSTGRES_PASSWORD=dncc \
+    POSTGRES_DB=goodsstore python benchmarks/db_replicas_check.py --policy least_outstanding
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import grpc
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_DIR = os.path.join(BASE_DIR, "..", "src", "db_service")
+sys.path.append(os.path.join(BASE_DIR, "..", "src", "api_service"))
+sys.path.append(os.path.join(BASE_DIR, "..", "src", "protos_shared"))
+
+import db_pb2
+from grpc_clients.db_client import DBClient
+
+
+def start_replica(port):
+    return subprocess.Popen(
+        [sys.executable, "server.py"], cwd=DB_DIR,
+        # replicas sharing a host cannot share a metrics port either
+        env=dict(os.environ, DB_GRPC_PORT=str(port), DB_METRICS_PORT="0"),
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def wait_ready(port):
+    channel = grpc.insecure_channel(f"localhost:{port}")
+    grpc.channel_ready_future(channel).result(timeout=10)
+    channel.close()
+
+
+def drive(client, threads, duration):
+    latencies, errors = [], []
+    stop_at = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                # bypass single-flight so every call reaches a replica
+                client._call("GetProduct", db_pb2.ById(id=1))
+            except grpc.RpcError as e:
+                errors.append(e.code().name)
+            latencies.append(time.perf_counter() - start)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return latencies, errors
+
+
+def report(title, client, latencies, errors, duration):
+    latencies = sorted(latencies)
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"== {title}")
+    print(f"   {len(latencies) / duration:8.0f} calls/s  p50 {p(0.5):6.2f} ms  p99 {p(0.99):6.2f} ms"
+          f"  errors {len(errors)} {sorted(set(errors))}")
+    for ep in client.balancer.stats()["endpoints"]:
+        print(f"   {ep['address']:>16}  healthy={ep['healthy']!s:5}  calls={ep['calls']:7}"
+              f"  errors={ep['errors']:4}  ejections={ep['ejections']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--port", type=int, default=50061)
+    parser.add_argument("--policy", default="round_robin")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--eject-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    ports = [args.port + i for i in range(args.replicas)]
+    replicas = {port: start_replica(port) for port in ports}
+    try:
+        for port in ports:
+            wait_ready(port)
+        client = DBClient(
+            ",".join(f"localhost:{port}" for port in ports),
+            policy=args.policy, eject_for=args.eject_seconds,
+        )
+
+        latencies, errors = drive(client, args.threads, args.duration)
+        report(f"{args.replicas} replicas, {args.policy}", client, latencies, errors, args.duration)
+
+        victim = ports[-1]
+        replicas[victim].kill()
+        replicas[victim].wait()
+        latencies, errors = drive(client, args.threads, args.duration)
+        report(f"replica :{victim} killed", client, latencies, errors, args.duration)
+
+        replicas[victim] = start_replica(victim)
+        wait_ready(victim)
+        time.sleep(args.eject_seconds)
+        latencies, errors = drive(client, args.threads, args.duration)
+        report(f"replica :{victim} restarted", client, latencies, errors, args.duration)
+        client.close()
+    finally:
+        for proc in replicas.values():
+            proc.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+db_service throughput and latency: DB_SERVER_MODE=sync (grpc thread pool and
+psycopg2) vs aio (grpc.aio and asyncpg), at 10, 100 and 1000 concurrent clients.
+
+Starts db_service once per mode, then for each `--concurrency` level runs
+that many closed-loop clients, each sending `--rpc` calls back to back for
+`--duration` seconds, and prints calls/sec, latency percentiles and errors
+(calls that failed or missed their `--timeout`).
+
+Uses the same POSTGRES_* env vars as db_service, e.g.
+
+    POSTGRES_HOST=localhost POSTGRES_USER=dncc POSTGRES_PASSWORD=dncc \
+    POSTGRES_DB=goodsstore python benchmarks/db_server_mode_bench.py
+
+The clients run in this process: on a small machine, give db_service and
+Postgres their own cores or the client becomes the bottleneck.
+"""
+import argparse
+import asyncio
+import collections
+import os
+import random
+import subprocess
+import sys
+import time
+
+import grpc
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_DIR = os.path.join(BASE_DIR, "..", "src", "db_service")
+sys.path.append(DB_DIR)
+
+import db_pb2, db_pb2_grpc
+
+
+def start_db(mode, port, extra):
+    env = dict(os.environ, DB_SERVER_MODE=mode, DB_GRPC_PORT=str(port),
+               DB_METRICS_PORT="0", TRACE_SAMPLE_RATE="0", **extra)
+    return subprocess.Popen([sys.executable, "server.py"], cwd=DB_DIR, env=env,
+                            stdout=subprocess.DEVNULL)
+
+
+def make_call(rpc, channel, args):
+    products = db_pb2_grpc.ProductServiceStub(channel)
+    users = db_pb2_grpc.UserServiceStub(channel)
+    if rpc == "get_product":
+        return lambda: products.GetProduct(db_pb2.ById(id=random.randint(1, 3)), timeout=args.timeout)
+    if rpc == "list_products":
+        return lambda: products.ListProducts(db_pb2.Empty(), timeout=args.timeout)
+    if rpc == "get_user":
+        # a miss is as much work as a hit: NOT_FOUND is not counted as an error
+        return lambda: users.GetUser(db_pb2.ById(id=random.randint(1, 100)), timeout=args.timeout)
+    raise ValueError(rpc)
+
+
+async def run_level(target, concurrency, args):
+    channels = [grpc.aio.insecure_channel(target) for _ in range(args.channels)]
+    calls = [make_call(args.rpc, ch, args) for ch in channels]
+    latencies, errors = [], collections.Counter()
+    stop = time.perf_counter() + args.duration
+
+    async def client(i):
+        call = calls[i % len(calls)]
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            try:
+                await call()
+            except grpc.aio.AioRpcError as e:
+                if e.code() != grpc.StatusCode.NOT_FOUND:
+                    errors[e.code().name] += 1
+                    continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    for ch in channels:
+        await ch.close()
+
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else float("nan")
+
+    return len(latencies) / elapsed, pct(0.5), pct(0.99), errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", default="sync,aio")
+    parser.add_argument("--concurrency", default="10,100,1000")
+    parser.add_argument("--rpc", default="get_product",
+                        choices=["get_product", "list_products", "get_user"])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--timeout", type=float, default=5, help="per-call deadline, seconds")
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--port", type=int, default=50094)
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE for db_service")
+    args = parser.parse_args()
+    extra = dict(kv.split("=", 1) for kv in args.env)
+    target = f"localhost:{args.port}"
+
+    print(f"{'mode':<5} {'clients':>7} {'calls/s':>9} {'p50 ms':>8} {'p99 ms':>8}  errors")
+    for mode in args.modes.split(","):
+        proc = start_db(mode, args.port, extra)
+        try:
+            channel = grpc.insecure_channel(target)
+            grpc.channel_ready_future(channel).result(timeout=15)
+            channel.close()
+            for concurrency in map(int, args.concurrency.split(",")):
+                rate, p50, p99, errors = asyncio.run(run_level(target, concurrency, args))
+                print(f"{mode:<5} {concurrency:>7} {rate:>9.0f} {p50:>8.2f} {p99:>8.2f}  "
+                      f"{dict(errors) or ''}")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+End-to-end load test of the API service, db_service and logging_service.
+
+Starts all three locally with stand-ins instead of the real backing services:
+db_service with DB_STORAGE=memory (or `--storage sqlite`, a fresh file in the
+run's work directory, or `--storage postgres`, using the same POSTGRES_* env
+vars as db_service) and logging_service with LOGGING_SINK=file, which appends
+to a file instead of Kafka. Then it registers `--users` users,
+logs them in, and sends an open-loop, Poisson-timed stream of `--rps` requests
+per second for `--duration` seconds, after `--warmup` seconds that are not
+counted. Each request picks an operation by the weights of `--mix`:
+
+    browse    GET /products (one time in four) or GET /products/{id}
+    register  POST /users/register of a new user
+    login     POST /users/login of a known user
+    order     POST /orders for one item
+    cancel    POST /orders/{id}/cancel of an order placed earlier in the run
+              (an order is placed instead while there is none to cancel)
+
+Latency is measured from when a request was due, not from when it was sent,
+so a saturated client or server shows up in the percentiles instead of
+silently lowering the offered load. The report has throughput, errors and
+p50/p95/p99 per endpoint; `--json` also writes it to a file for comparisons:
+
+    python benchmarks/e2e_loadtest.py --rps 300 --duration 30
+    python benchmarks/e2e_loadtest.py --env API_GRPC_MODE=sync --json sync.json
+    python benchmarks/e2e_loadtest.py --url http://localhost:18080   # a running stack
+
+`--env KEY=VALUE` is passed to all three services. Rate limiting is off
+(RATE_LIMITS="") unless set that way. logging_service listens on 50052,
+where the API expects it, so that port must be free.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict, deque
+
+import grpc
+import httpx
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BASE_DIR, "..", "src")
+API_DIR = os.path.join(SRC_DIR, "api_service")
+DB_DIR = os.path.join(SRC_DIR, "db_service")
+LOG_DIR = os.path.join(SRC_DIR, "logging_service")
+SHARED_DIR = os.path.join(SRC_DIR, "protos_shared")
+
+LOG_PORT = 50052
+PASSWORD = "loadtest-password"
+DEFAULT_MIX = "browse=75,login=5,register=1,order=13,cancel=6"
+
+
+# -------------------------
+# Local stack
+# -------------------------
+
+def start_stack(args, workdir):
+    extra = dict(item.split("=", 1) for item in args.env)
+    common = dict(os.environ, DB_METRICS_PORT="0", LOGGING_METRICS_PORT="0", TRACE_SAMPLE_RATE="0")
+
+    def spawn(name, command, cwd, env):
+        out = open(os.path.join(workdir, f"{name}.log"), "w")
+        return subprocess.Popen(command, cwd=cwd, env={**common, **env, **extra},
+                                stdout=out, stderr=subprocess.STDOUT)
+
+    procs = [
+        spawn("db_service", [sys.executable, "server.py"], DB_DIR, dict(
+            DB_STORAGE=args.storage, DB_GRPC_PORT=str(args.db_port),
+            DB_SQLITE_PATH=os.path.join(workdir, "db.sqlite3"),
+        )),
+        spawn("logging_service", [sys.executable, "server.py"], LOG_DIR, dict(
+            LOGGING_SINK="file", LOGGING_SINK_PATH=os.path.join(workdir, "kafka.log"),
+            LOGGING_SERVICE_PORT=str(LOG_PORT),
+        )),
+    ]
+    for port in (args.db_port, LOG_PORT):
+        channel = grpc.insecure_channel(f"localhost:{port}")
+        grpc.channel_ready_future(channel).result(timeout=15)
+        channel.close()
+    procs.append(spawn("api_service", [
+        sys.executable, "-m", "uvicorn", "server:app", "--port", str(args.api_port),
+        "--log-level", "warning",
+    ], API_DIR, dict(
+        PYTHONPATH=SHARED_DIR, DB_GRPC_HOSTS=f"localhost:{args.db_port}",
+        LOG_GRPC_HOST="localhost", RATE_LIMITS="",
+    )))
+    return procs
+
+
+async def wait_ready(client):
+    for _ in range(150):
+        try:
+            await client.get("/")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("API service did not start")
+
+
+# -------------------------
+# Workload
+# -------------------------
+
+class Results:
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def record(self, endpoint, seconds, status):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][status] += 1
+
+
+class Run:
+    """State shared by the requests of one run"""
+
+    def __init__(self, client, users, product_ids):
+        self.client = client
+        self.users = users  # [(username, token)]
+        self.product_ids = product_ids
+        self.placed = deque()  # (token, order id) that can be cancelled
+        self.new_names = (f"lt-{os.getpid()}-{int(time.time())}-{i}" for i in itertools.count())
+        self.results = None  # None while warming up
+
+    async def request(self, endpoint, due, method, url, **kwargs):
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        if self.results is not None:
+            self.results.record(endpoint, asyncio.get_running_loop().time() - due, status)
+        return response
+
+    async def browse(self, due):
+        if random.random() < 0.25:
+            await self.request("GET /products", due, "GET", "/products")
+        else:
+            pid = random.choice(self.product_ids)
+            await self.request("GET /products/{id}", due, "GET", f"/products/{pid}")
+
+    async def register(self, due):
+        await self.request("POST /users/register", due, "POST", "/users/register",
+                           json={"username": next(self.new_names), "password": PASSWORD})
+
+    async def login(self, due):
+        username, _ = random.choice(self.users)
+        await self.request("POST /users/login", due, "POST", "/users/login",
+                           json={"username": username, "password": PASSWORD})
+
+    async def order(self, due):
+        _, token = random.choice(self.users)
+        response = await self.request(
+            "POST /orders", due, "POST", "/orders",
+            json={"product_id": random.choice(self.product_ids), "quantity": 1},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        if response is not None and response.status_code == 200:
+            self.placed.append((token, response.json()["id"]))
+
+    async def cancel(self, due):
+        if not self.placed:
+            return await self.order(due)
+        token, order_id = self.placed.popleft()
+        await self.request("POST /orders/{id}/cancel", due, "POST", f"/orders/{order_id}/cancel",
+                           headers={"Authorization": f"Bearer {token}"})
+
+
+async def setup(client, n_users):
+    """Registers and logs in n_users users; returns [(username, token)] and the product ids"""
+    prefix = f"lt-{os.getpid()}-{int(time.time())}-user"
+    # a few at a time: the API answers 503 beyond PASSWORD_MAX_PENDING bcrypt calls
+    slots = asyncio.Semaphore(4)
+
+    async def one(i):
+        username = f"{prefix}{i}"
+        async with slots:
+            r = await client.post("/users/register", json={"username": username, "password": PASSWORD})
+            r.raise_for_status()
+            r = await client.post("/users/login", json={"username": username, "password": PASSWORD})
+            r.raise_for_status()
+        return username, r.json()["token"]
+
+    users = await asyncio.gather(*(one(i) for i in range(n_users)))
+    r = await client.get("/products", params={"limit": 1000})
+    r.raise_for_status()
+    product_ids = [p["id"] for p in r.json()]
+    return users, product_ids
+
+
+async def offer_load(run, mix, rps, duration, max_in_flight):
+    """Starts requests at Poisson-distributed times averaging rps per second;
+    returns how many were skipped because max_in_flight were still running"""
+    operations = [getattr(run, name) for name in mix]
+    weights = list(mix.values())
+    loop = asyncio.get_running_loop()
+    in_flight = set()
+    skipped = 0
+    due = loop.time()
+    end = due + duration
+    while True:
+        due += random.expovariate(rps)
+        if due >= end:
+            break
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= max_in_flight:
+            skipped += 1
+            continue
+        operation = random.choices(operations, weights)[0]
+        task = asyncio.ensure_future(operation(due))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    await asyncio.gather(*in_flight)
+    return skipped
+
+
+# -------------------------
+# Report
+# -------------------------
+
+def pct(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))] * 1000
+
+
+def summarize(results, duration):
+    summary = {}
+    for endpoint in sorted(results.latencies):
+        latencies = sorted(results.latencies[endpoint])
+        statuses = results.statuses[endpoint]
+        summary[endpoint] = {
+            "requests": len(latencies),
+            "rps": round(len(latencies) / duration, 1),
+            "errors": sum(n for status, n in statuses.items() if not (isinstance(status, int) and status < 400)),
+            "statuses": {str(status): n for status, n in statuses.items()},
+            "p50_ms": round(pct(latencies, 0.50), 2),
+            "p95_ms": round(pct(latencies, 0.95), 2),
+            "p99_ms": round(pct(latencies, 0.99), 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+        }
+    everything = sorted(l for latencies in results.latencies.values() for l in latencies)
+    if everything:
+        summary["total"] = {
+            "requests": len(everything),
+            "rps": round(len(everything) / duration, 1),
+            "errors": sum(s["errors"] for s in summary.values()),
+            "p50_ms": round(pct(everything, 0.50), 2),
+            "p95_ms": round(pct(everything, 0.95), 2),
+            "p99_ms": round(pct(everything, 0.99), 2),
+            "max_ms": round(everything[-1] * 1000, 2),
+        }
+    return summary
+
+
+def print_report(summary, args, skipped):
+    print(f"{'endpoint':<26} {'requests':>8} {'req/s':>8} {'errors':>6} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for endpoint, s in summary.items():
+        print(f"{endpoint:<26} {s['requests']:>8} {s['rps']:>8.1f} {s['errors']:>6} "
+              f"{s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f} {s['max_ms']:>8.2f}")
+    print(f"offered {args.rps} req/s for {args.duration:g}s, skipped {skipped} (over --max-in-flight)")
+    for endpoint, s in summary.items():
+        odd = {status: n for status, n in s.get("statuses", {}).items() if status != "200"}
+        if odd:
+            print(f"  {endpoint}: {odd}")
+
+
+async def main_async(args, mix):
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        await wait_ready(client)
+        users, product_ids = await setup(client, args.users)
+        run = Run(client, users, product_ids)
+        if args.warmup:
+            await offer_load(run, mix, args.rps, args.warmup, args.max_in_flight)
+        run.results = Results()
+        skipped = await offer_load(run, mix, args.rps, args.duration, args.max_in_flight)
+        return run.results, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rps", type=float, default=200)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="<operation>=<weight>,...")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--storage", default="memory", choices=["memory", "sqlite", "postgres"])
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE for every service")
+    parser.add_argument("--url", help="load a running API instead of starting the stack")
+    parser.add_argument("--api-port", type=int, default=18090)
+    parser.add_argument("--db-port", type=int, default=50091)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    unknown = set(mix) - {"browse", "register", "login", "order", "cancel"}
+    if unknown:
+        parser.error(f"unknown operations in --mix: {', '.join(sorted(unknown))}")
+
+    procs = []
+    if args.url is None:
+        workdir = tempfile.mkdtemp(prefix="e2e_loadtest_")
+        print(f"service logs in {workdir}")
+        procs = start_stack(args, workdir)
+        args.url = f"http://127.0.0.1:{args.api_port}"
+    try:
+        results, skipped = asyncio.run(main_async(args, mix))
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+
+    summary = summarize(results, args.duration)
+    print_report(summary, args, skipped)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "skipped": skipped, "endpoints": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
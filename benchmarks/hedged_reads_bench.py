@@ -0,0 +1,120 @@
+"""
+Tail latency of DBClient.get_product with and without hedging, and how
+retries behave when replicas fail.
+
+No Postgres needed: `--replicas` stand-in ProductService servers run in this
+process. Each call is slow (`--slow-ms`) with probability `--slow-fraction`
+and fails with UNAVAILABLE with probability `--unavailable`. `--threads`
+closed-loop clients call get_product (random ids, so single-flight never
+collapses them) for `--duration` seconds per run:
+
+    python benchmarks/hedged_reads_bench.py --slow-fraction 0.03 --slow-ms 100
+    python benchmarks/hedged_reads_bench.py --unavailable 0.05
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent import futures
+
+import grpc
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_DIR, "..", "src", "api_service"))
+sys.path.append(os.path.join(BASE_DIR, "..", "src", "protos_shared"))
+
+import db_pb2
+import db_pb2_grpc
+from grpc_clients.db_client import DBClient
+
+
+class StandInProducts(db_pb2_grpc.ProductServiceServicer):
+
+    def __init__(self, slow_fraction, slow_seconds, unavailable):
+        self.slow_fraction = slow_fraction
+        self.slow_seconds = slow_seconds
+        self.unavailable = unavailable
+        self.calls = 0
+
+    def GetProduct(self, request, context):
+        self.calls += 1
+        roll = random.random()
+        if roll < self.unavailable:
+            context.abort(grpc.StatusCode.UNAVAILABLE, "stand-in outage")
+        time.sleep(self.slow_seconds if roll < self.unavailable + self.slow_fraction else 0.001)
+        return db_pb2.Product(id=request.id, name="p", category="c", price=1.0, stock=1)
+
+
+def start_servers(n, port, servicer):
+    servers = []
+    for i in range(n):
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=64))
+        db_pb2_grpc.add_ProductServiceServicer_to_server(servicer, server)
+        server.add_insecure_port(f"localhost:{port + i}")
+        server.start()
+        servers.append(server)
+    return servers
+
+
+def drive(client, threads, duration):
+    latencies, errors = [], []
+    stop_at = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                client.get_product(random.randint(1, 10**9))
+            except grpc.RpcError as e:
+                errors.append(e.code().name)
+            latencies.append(time.perf_counter() - start)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return sorted(latencies), errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--port", type=int, default=50071)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--slow-fraction", type=float, default=0.03)
+    parser.add_argument("--slow-ms", type=float, default=100)
+    parser.add_argument("--unavailable", type=float, default=0.0)
+    args = parser.parse_args()
+
+    servicer = StandInProducts(args.slow_fraction, args.slow_ms / 1000, args.unavailable)
+    servers = start_servers(args.replicas, args.port, servicer)
+    hosts = ",".join(f"localhost:{args.port + i}" for i in range(args.replicas))
+    try:
+        for label, options in [
+            ("no retries, no hedging", dict(max_retries=0)),
+            ("retries", dict()),
+            ("retries + hedging", dict(hedge_reads=True)),
+        ]:
+            # ejection would hide the injected failures from the comparison
+            client = DBClient(hosts, eject_after=10**9, **options)
+            servicer.calls = 0
+            latencies, errors = drive(client, args.threads, args.duration)
+            p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+            stats = client.read_policy.stats()
+            print(f"{label:24} {len(latencies) / args.duration:7.0f} reads/s"
+                  f"  p50 {p(0.5):7.2f}  p95 {p(0.95):7.2f}  p99 {p(0.99):7.2f} ms"
+                  f"  errors {len(errors):5}  server calls/read {servicer.calls / max(1, len(latencies)):.3f}"
+                  f"  retries {stats['retries']}  hedges {stats['hedges']} (won {stats['hedge_wins']})"
+                  f"  budget rejected {stats['budget_rejected']}")
+            client.close()
+    finally:
+        for server in servers:
+            server.stop(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Per-request cost of the auth dependency (get_current_user_id) with and
+without the verified-token cache.
+
+Replays `--tokens` distinct tokens round-robin, so every request after the
+first pass is a cache hit, the same shape as a session re-sending its token.
+
+    python benchmarks/jwt_cache_bench.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_DIR, "..", "src", "api_service"))
+sys.path.append(os.path.join(BASE_DIR, "..", "src", "protos_shared"))
+
+import server
+from auth.jwt_utils import create_jwt, VerifiedTokenCache
+
+
+async def run(headers, requests):
+    start = time.perf_counter()
+    for i in range(requests):
+        await server.get_current_user_id(headers[i % len(headers)])
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--tokens", type=int, default=1000)
+    args = parser.parse_args()
+
+    headers = [f"Bearer {create_jwt(i + 1, server.JWT_SECRET)}" for i in range(args.tokens)]
+
+    server.jwt_cache = None
+    uncached = asyncio.run(run(headers, args.requests))
+
+    server.jwt_cache = VerifiedTokenCache(server.JWT_SECRET, maxsize=args.tokens)
+    cached = asyncio.run(run(headers, args.requests))
+
+    print(f"without cache: {uncached:7.2f} us/request")
+    print(f"with cache:    {cached:7.2f} us/request  ({server.jwt_cache.hits} hits, "
+          f"{server.jwt_cache.misses} misses)")
+
+
+if __name__ == "__main__":
+    main()
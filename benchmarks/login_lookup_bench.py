@@ -0,0 +1,98 @@
+"""
+Login lookup latency vs. users table size.
+
+Grows the users table from 100 to 1M rows and times
+DBManager.get_user_by_username (one indexed lookup) at each size, next to the
+old login path (get_user for id in 1..199) for reference.
+
+Uses the same POSTGRES_* env vars as db_service, e.g.
+
+    POSTGRES_HOST=localhost POSTGRES_USER=dncc POSTGRES_PASSWORD=dncc \
+    POSTGRES_DB=goodsstore python benchmarks/login_lookup_bench.py
+
+Rows inserted by the benchmark use the "bench_" username prefix and are
+deleted at the end.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_DIR, "..", "src", "db_service"))
+
+from db_manager import DBManager
+
+SIZES = [100, 1_000, 10_000, 100_000, 1_000_000]
+
+
+def grow_users(db, current, target):
+    conn = db._get_conn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO users (sid, username, password_hash)
+                SELECT 'b' || g, 'bench_' || g, 'x'
+                FROM generate_series(%s, %s) AS g;
+            """, (current + 1, target))
+            cur.execute("ANALYZE users;")
+        conn.commit()
+    finally:
+        db._put_conn(conn)
+
+
+def drop_bench_users(db):
+    conn = db._get_conn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM users WHERE username LIKE %s;", ("bench\\_%",))
+        conn.commit()
+    finally:
+        db._put_conn(conn)
+
+
+def time_ms(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def old_scan(db, username):
+    for i in range(1, 200):
+        row = db.get_user(i)
+        if row and row[1] == username:
+            return row
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=500)
+    args = parser.parse_args()
+
+    db = DBManager()
+    drop_bench_users(db)
+    print(f"{'rows':>10} {'indexed p50':>12} {'indexed p99':>12} {'scan p50':>10}")
+
+    current = 0
+    try:
+        for size in SIZES:
+            grow_users(db, current, size)
+            current = size
+
+            names = [f"bench_{random.randint(1, size)}" for _ in range(args.lookups)]
+            indexed = sorted(time_ms(db.get_user_by_username, n) for n in names)
+            scan = [time_ms(old_scan, db, n) for n in names[:20]]
+
+            print(f"{size:>10} {statistics.median(indexed):>10.3f}ms "
+                  f"{indexed[int(len(indexed) * 0.99) - 1]:>10.3f}ms "
+                  f"{statistics.median(scan):>8.2f}ms")
+    finally:
+        drop_bench_users(db)
+        db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Login password-check throughput vs. PasswordService worker count.
+
+For each worker count, keeps `--concurrency` bcrypt verifications in flight
+for `--duration` seconds and reports verifications/sec, how many were shed
+with PasswordServiceBusy, and the worst event-loop stall seen meanwhile
+(what every other request in the worker would have waited). "inline" is the
+old behaviour: verify_password called directly on the loop.
+
+    python benchmarks/password_pool_bench.py --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_DIR, "..", "src", "api_service"))
+
+from auth.password_utils import (
+    PasswordService, PasswordServiceBusy, hash_password, verify_password,
+)
+
+
+async def loop_lag(stop, worst):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.005)
+        worst[0] = max(worst[0], time.perf_counter() - start - 0.005)
+
+
+async def client(verify, hashed, stop_at, done, shed):
+    while time.perf_counter() < stop_at:
+        try:
+            await verify("correct horse", hashed)
+            done[0] += 1
+        except PasswordServiceBusy:
+            shed[0] += 1
+            await asyncio.sleep(0.01)
+
+
+async def run(workers, concurrency, duration, hashed):
+    service = None
+    if workers == "inline":
+        async def verify(password, h):
+            return verify_password(password, h)
+    else:
+        service = PasswordService(workers=int(workers))
+        await service.warm_up()
+        verify = service.verify
+
+    done, shed, worst = [0], [0], [0.0]
+    stop = asyncio.Event()
+    lag = asyncio.create_task(loop_lag(stop, worst))
+    stop_at = time.perf_counter() + duration
+    await asyncio.gather(*(client(verify, hashed, stop_at, done, shed)
+                           for _ in range(concurrency)))
+    stop.set()
+    await lag
+    if service:
+        service.shutdown()
+    return done[0] / duration, shed[0], worst[0] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", nargs="+", default=["inline", "1", "2", "4", "8"])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    hashed = hash_password("correct horse")
+    print(f"{'workers':>8} {'logins/s':>9} {'shed':>7} {'max loop stall':>15}")
+    for workers in args.workers:
+        rate, shed, stall = asyncio.run(run(workers, args.concurrency, args.duration, hashed))
+        print(f"{workers:>8} {rate:>9.1f} {shed:>7} {stall:>13.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
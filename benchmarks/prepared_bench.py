@@ -0,0 +1,106 @@
+"""
+DBManager hot queries with and without server-side prepared statements.
+
+Runs each query `--calls` times through one pooled connection, with plain SQL
+(DB_PREPARED_STATEMENTS=0) and then prepared, and reports the client-side
+latency and the CPU time the Postgres backend serving the connection spent
+per call. The CPU column comes from /proc/<backend pid>/stat, so it needs
+Postgres on this host (else "n/a").
+
+Uses the same POSTGRES_* env vars as db_service, e.g.
+
+    POSTGRES_HOST=localhost POSTGRES_USER=dncc POSTGRES_PASSWORD=dncc \
+    POSTGRES_DB=goodsstore python benchmarks/prepared_bench.py
+
+The user and orders it creates use the "bench_" username prefix and are
+deleted at the end.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_DIR, "..", "src", "db_service"))
+
+os.environ.setdefault("DB_METRICS_PORT", "0")
+os.environ.setdefault("TRACE_SAMPLE_RATE", "0")
+
+import prepared
+from db_manager import DBManager
+
+TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def backend_cpu(pid):
+    """user + system seconds of a local Postgres backend, or None"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / TICKS
+
+
+def run(db, pid, fn, args, calls):
+    for _ in range(min(calls, 50)):
+        fn(*args)
+    cpu_before = backend_cpu(pid)
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    cpu_after = backend_cpu(pid)
+    latencies.sort()
+    cpu = None if cpu_before is None or cpu_after is None else (cpu_after - cpu_before) / calls * 1e6
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1], cpu
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+
+    # one connection, so every call lands on the backend whose CPU is read
+    db = DBManager(maxconn=1)
+    conn = db.pool.getconn()
+    pid = conn.get_backend_pid()
+    db.pool.putconn(conn)
+
+    username = f"bench_prepared_{os.getpid()}"
+    user = db.create_user(username, "x")
+    order = db.create_order(user[0], 1, 1)
+    queries = [
+        ("get_product", db.get_product, (1,)),
+        ("list_products", db.list_products, ()),
+        ("get_user", db.get_user, (user[0],)),
+        ("get_user_by_username", db.get_user_by_username, (username,)),
+        ("get_order", db.get_order, (order[0],)),
+        ("create_order", db.create_order, (user[0], 2, 1)),
+    ]
+
+    print(f"{'query':<22} {'mode':<9} {'p50 us':>8} {'p99 us':>8} {'db cpu us/call':>15}")
+    try:
+        for name, fn, fn_args in queries:
+            for enabled in (False, True):
+                prepared.ENABLED = enabled
+                p50, p99, cpu = run(db, pid, fn, fn_args, args.calls)
+                cpu = "n/a" if cpu is None else f"{cpu:.1f}"
+                print(f"{name:<22} {'prepared' if enabled else 'plain':<9} "
+                      f"{p50:>8.1f} {p99:>8.1f} {cpu:>15}")
+    finally:
+        conn = db.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                # orders go with the user (ON DELETE CASCADE)
+                cur.execute("DELETE FROM users WHERE username = %s;", (username,))
+            conn.commit()
+        finally:
+            db.pool.putconn(conn)
+        db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Print the traces exported by the three services as trees.
+
+Each service writes its sampled spans as JSON lines to TRACE_FILE (or stdout).
+Pass all the files; spans are joined by trace id and printed under their
+parents, each with its start offset in the trace and its duration:
+
+    python benchmarks/show_traces.py api.jsonl db.jsonl logging.jsonl --slowest 5
+    python benchmarks/show_traces.py *.jsonl --trace 4bf92f3577b34da6a3ce929d0e0e4736
+
+Lines that are not spans (the services' own prints on a shared stdout) are skipped.
+"""
+import argparse
+import json
+from collections import defaultdict
+
+
+def load(paths):
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and "trace_id" in record:
+                    traces[record["trace_id"]].append(record)
+    return traces
+
+
+def trace_ms(spans):
+    """From the first span's start to the last span's end"""
+    return max(s["start"] * 1000 + s["duration_ms"] for s in spans) - min(s["start"] for s in spans) * 1000
+
+
+def print_trace(trace_id, spans):
+    children = defaultdict(list)
+    ids = {s["span_id"] for s in spans}
+    for s in spans:
+        # a parent that was not exported (e.g. the caller's) makes this a root here
+        children[s["parent_id"] if s["parent_id"] in ids else None].append(s)
+    start = min(s["start"] for s in spans)
+    print(f"trace {trace_id}  {trace_ms(spans):.2f} ms  {len(spans)} spans")
+
+    def walk(parent_id, depth):
+        for s in sorted(children[parent_id], key=lambda s: s["start"]):
+            offset = (s["start"] - start) * 1000
+            label = f"{'  ' * depth}{s['name']}"
+            attributes = " ".join(f"{k}={v}" for k, v in s["attributes"].items())
+            error = f"  ERROR {s['error']}" if s["error"] else ""
+            print(f"  {offset:9.2f} {s['duration_ms']:9.2f} ms  {s['service']:<16} {label:<40} {attributes}{error}")
+            walk(s["span_id"], depth + 1)
+    walk(None, 0)
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--trace", help="only this trace id")
+    parser.add_argument("--slowest", type=int, default=0, help="only the N longest traces")
+    args = parser.parse_args()
+
+    traces = load(args.files)
+    if args.trace:
+        traces = {args.trace: traces.get(args.trace, [])}
+    ordered = sorted(
+        ((trace_id, spans) for trace_id, spans in traces.items() if spans),
+        key=lambda item: trace_ms(item[1]), reverse=True,
+    )
+    if args.slowest:
+        ordered = ordered[:args.slowest]
+    for trace_id, spans in ordered:
+        print_trace(trace_id, spans)
+
+
+if __name__ == "__main__":
+    main()
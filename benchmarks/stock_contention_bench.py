@@ -0,0 +1,171 @@
+"""
+Flash-sale contention: `--buyers` concurrent CreateOrder calls for one SKU.
+
+Creates a product with `--stock` units, starts db_service (once per
+DB_SERVER_MODE in `--modes`), releases all buyers at once, each ordering
+`--quantity` units, and reports how long the sale took, the latency of the
+calls, how many orders went through or were turned away, and whether the
+database agrees: stock left + units sold must equal the starting stock, and
+the stock may never go below zero. Then it cancels every order, concurrently
+as well, and checks that all units went back.
+
+Uses the same POSTGRES_* env vars as db_service, e.g.
+
+    POSTGRES_HOST=localhost POSTGRES_USER=dncc POSTGRES_PASSWORD=dncc \
+    POSTGRES_DB=goodsstore python benchmarks/stock_contention_bench.py
+
+The product and user it creates use the "bench_" prefix and are deleted at
+the end, with their orders.
+"""
+import argparse
+import asyncio
+import collections
+import os
+import subprocess
+import sys
+import time
+
+import grpc
+import psycopg2
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_DIR = os.path.join(BASE_DIR, "..", "src", "db_service")
+sys.path.append(DB_DIR)
+
+import db_pb2, db_pb2_grpc
+
+
+def connect():
+    conn = psycopg2.connect(
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST", "postgres"),
+        database=os.getenv("POSTGRES_DB"),
+        port=os.getenv("POSTGRES_PORT", "5432"),
+    )
+    conn.autocommit = True
+    return conn
+
+
+def start_db(mode, port):
+    env = dict(os.environ, DB_SERVER_MODE=mode, DB_GRPC_PORT=str(port),
+               DB_METRICS_PORT="0", TRACE_SAMPLE_RATE="0")
+    return subprocess.Popen([sys.executable, "server.py"], cwd=DB_DIR, env=env,
+                            stdout=subprocess.DEVNULL)
+
+
+def pct(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float("nan")
+
+
+async def stampede(target, calls, channels):
+    """Runs calls(stub) all at once; (seconds, sorted latencies ms, results, codes)"""
+    chans = [grpc.aio.insecure_channel(target) for _ in range(channels)]
+    stubs = [db_pb2_grpc.OrderServiceStub(ch) for ch in chans]
+    for ch in chans:
+        await ch.channel_ready()
+    go = asyncio.Event()
+    latencies, results, codes = [], [], collections.Counter()
+
+    async def one(i, call):
+        await go.wait()
+        started = time.perf_counter()
+        try:
+            results.append(await call(stubs[i % len(stubs)]))
+            codes["OK"] += 1
+        except grpc.aio.AioRpcError as e:
+            codes[e.code().name] += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    tasks = [asyncio.create_task(one(i, call)) for i, call in enumerate(calls)]
+    await asyncio.sleep(0.1)
+    started = time.perf_counter()
+    go.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    for ch in chans:
+        await ch.close()
+    return elapsed, sorted(latencies), results, codes
+
+
+def report(label, elapsed, latencies, codes):
+    print(f"  {label:<7} {elapsed:7.2f}s  p50 {pct(latencies, 0.5):8.1f}ms  "
+          f"p99 {pct(latencies, 0.99):8.1f}ms  max {latencies[-1]:8.1f}ms  {dict(codes)}")
+
+
+def check(cur, product_id, start_stock):
+    cur.execute("SELECT stock FROM products WHERE id = %s;", (product_id,))
+    stock = cur.fetchone()[0]
+    cur.execute("""
+        SELECT COALESCE(SUM(quantity), 0) FROM orders
+        WHERE product_id = %s AND NOT canceled;
+    """, (product_id,))
+    sold = cur.fetchone()[0]
+    ok = stock >= 0 and stock + sold == start_stock
+    print(f"  stock left {stock}, units sold {sold}: {'consistent' if ok else 'INCONSISTENT'}")
+    return stock
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buyers", type=int, default=1000)
+    parser.add_argument("--stock", type=int, default=500)
+    parser.add_argument("--quantity", type=int, default=1, choices=[1, 2, 3])
+    parser.add_argument("--modes", default="sync,aio")
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=30, help="per-call deadline, seconds")
+    parser.add_argument("--port", type=int, default=50097)
+    args = parser.parse_args()
+    target = f"localhost:{args.port}"
+
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO products (name, category, price, stock)
+        VALUES (%s, 'Bench', 9.99, 0)
+        RETURNING id;
+    """, (f"bench_flash_{os.getpid()}",))
+    product_id = cur.fetchone()[0]
+    cur.execute("""
+        INSERT INTO users (username, password_hash)
+        VALUES (%s, 'x')
+        RETURNING id;
+    """, (f"bench_flash_{os.getpid()}",))
+    user_id = cur.fetchone()[0]
+
+    order = db_pb2.NewOrder(user_id=user_id, product_id=product_id, quantity=args.quantity)
+    print(f"{args.buyers} buyers x {args.quantity} unit(s), {args.stock} in stock")
+    try:
+        for mode in args.modes.split(","):
+            cur.execute("DELETE FROM orders WHERE product_id = %s;", (product_id,))
+            cur.execute("UPDATE products SET stock = %s WHERE id = %s;", (args.stock, product_id))
+            proc = start_db(mode, args.port)
+            try:
+                channel = grpc.insecure_channel(target)
+                grpc.channel_ready_future(channel).result(timeout=15)
+                channel.close()
+                print(f"DB_SERVER_MODE={mode}")
+
+                buy = [lambda s: s.CreateOrder(order, timeout=args.timeout)] * args.buyers
+                elapsed, latencies, orders, codes = asyncio.run(stampede(target, buy, args.channels))
+                report("buy", elapsed, latencies, codes)
+                check(cur, product_id, args.stock)
+
+                cancel = [lambda s, o=o: s.CancelOrder(db_pb2.ById(id=o.id), timeout=args.timeout)
+                          for o in orders]
+                elapsed, latencies, _, codes = asyncio.run(stampede(target, cancel, args.channels))
+                report("cancel", elapsed, latencies, codes)
+                if check(cur, product_id, args.stock) != args.stock:
+                    print("  cancel did not restock every unit")
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        # orders go with the product and the user (ON DELETE CASCADE)
+        cur.execute("DELETE FROM products WHERE id = %s;", (product_id,))
+        cur.execute("DELETE FROM users WHERE id = %s;", (user_id,))
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,10 @@
 -- numeric types and SERIAL: https://www.postgresql.org/docs/current/datatype-numeric.html
 -- CHECK (): https://www.postgresql.org/docs/17/ddl-constraints.html#DDL-CONSTRAINTS-CHECK-CONSTRAINTS
 -- REFERENCES table_name(column_name) ON DELETE CASCADE: https://www.postgresql.org/docs/17/ddl-constraints.html#DDL-CONSTRAINTS-FK
+-- Every insert/update of a product takes a fresh number from this sequence,
+-- which the API service turns into the ETag of that product and of the list.
+-- nextval() is non-transactional, so concurrent updates never wait on it.
+CREATE SEQUENCE product_version_seq;
 -- Create the products table
 CREATE TABLE products (
   id SERIAL PRIMARY KEY,
@@ -11,8 +15,17 @@ CREATE TABLE products (
   price DECIMAL(10, 2) NOT NULL,
   slogan VARCHAR(255),
   stock INT NOT NULL DEFAULT 500,
+  version BIGINT NOT NULL DEFAULT nextval('product_version_seq'),
   created_at TIMESTAMP DEFAULT NOW()
 );
+CREATE FUNCTION bump_product_version() RETURNS trigger AS $$
+BEGIN
+  NEW.version := nextval('product_version_seq');
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER products_bump_version BEFORE UPDATE ON products
+  FOR EACH ROW EXECUTE FUNCTION bump_product_version();
 -- Insert initial product data for limited SUSTech goods
 INSERT INTO products (
     name,
@@ -49,10 +62,11 @@ VALUES (
 -- Create the users table
 CREATE TABLE users (
   id SERIAL PRIMARY KEY,
-  sid VARCHAR(15) UNIQUE NOT NULL,
+  sid VARCHAR(15) UNIQUE,
   username VARCHAR(50) UNIQUE NOT NULL,
   email VARCHAR(255) UNIQUE,
   password_hash VARCHAR(255) NOT NULL,
+  active BOOLEAN NOT NULL DEFAULT TRUE,
   created_at TIMESTAMP DEFAULT NOW()
 );
 -- Create the orders table
@@ -67,5 +81,16 @@ CREATE TABLE orders (
   -- Limit order quantity to max 3 per product
   total_price DECIMAL(10, 2) NOT NULL,
   -- Total price calculated in application logic
+  canceled BOOLEAN NOT NULL DEFAULT FALSE,
   created_at TIMESTAMP DEFAULT NOW()
 );
+-- Idempotency-Key of POST /orders -> the order it created. The key is claimed
+-- in the same transaction as the order insert, so a retry on any API replica
+-- gets the original order back instead of a duplicate.
+CREATE TABLE idempotency_keys (
+  user_id INT NOT NULL,
+  idem_key VARCHAR(255) NOT NULL,
+  order_id INT REFERENCES orders(id) ON DELETE CASCADE,
+  created_at TIMESTAMP DEFAULT NOW(),
+  PRIMARY KEY (user_id, idem_key)
+);
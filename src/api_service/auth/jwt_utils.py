@@ -1,5 +1,8 @@
+import hashlib
+import threading
 import time
 import jwt
+from collections import OrderedDict
 from typing import Optional
 
 
@@ -17,3 +20,49 @@ def verify_jwt(token: str, secret: str) -> Optional[int]:
         return data["user_id"]
     except Exception:
         return None
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of tokens that already passed verify_jwt, keyed by the token's
+    SHA-256 digest and holding (user_id, exp). A hit is only returned while
+    time.time() < int(exp), the same check pyjwt makes, so caching never
+    extends a token's life. Invalid tokens are not cached.
+    """
+
+    def __init__(self, secret: str, maxsize: int = 10000):
+        self.secret = secret
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # digest -> (user_id, exp)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def verify(self, token: str) -> Optional[int]:
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                user_id, exp = entry
+                if now < exp:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return user_id
+                del self._entries[key]
+            self.misses += 1
+
+        try:
+            data = jwt.decode(token, self.secret, algorithms=["HS256"])
+            user_id = data["user_id"]
+        except Exception:
+            return None
+
+        with self._lock:
+            exp = int(data["exp"]) if "exp" in data else float("inf")
+            self._entries[key] = (user_id, exp)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return user_id
@@ -1,3 +1,7 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -21,3 +25,52 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     password = _sanitize(password)
     return pwd_context.verify(password, hashed)
+
+
+class PasswordServiceBusy(Exception):
+    """Raised instead of queueing when max_pending operations are already in flight"""
+
+
+class PasswordService:
+    """
+    Runs hash_password / verify_password on a process pool so bcrypt never holds
+    the serving process's GIL. At most max_pending operations may be submitted
+    or running at once; beyond that calls fail fast with PasswordServiceBusy.
+    Use from a single event loop.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        # spawn, not fork: the API process already has gRPC threads running
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._pending = 0
+        self.rejected = 0
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(hash_password, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._submit(verify_password, password, hashed)
+
+    async def warm_up(self):
+        """Start every worker now instead of on the first logins"""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self.executor, _sanitize, "") for _ in range(self.workers)
+        ))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _submit(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordServiceBusy()
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self._pending -= 1
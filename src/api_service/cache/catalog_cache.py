@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+
+class CatalogCache:
+    """
+    In-process cache for ListProducts / GetProduct.
+
+    - age < ttl:                 served from cache (hit)
+    - ttl <= age < ttl + stale:  served from cache (stale hit) and refreshed
+                                 in the background, one refresh per key
+    - older, or not cached:      fetched from db_service before returning (miss)
+
+    Stock in cached products may lag by up to ttl + stale seconds, which is fine
+    for browsing. Ordering must never read from here: CreateOrder prices and
+    checks the product inside db_service.
+    """
+
+    LIST_KEY = "list"
+
+    def __init__(self, db_client, ttl: float = 5.0, stale: float = 60.0):
+        self.db_client = db_client
+        self.ttl = ttl
+        self.stale = stale
+
+        self._entries = {}      # key -> (value, fetched_at)
+        self._refreshing = {}   # key -> background refresh task
+        self._generation = 0    # bumped by invalidate() so in-flight fetches don't store old data
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+
+    async def list_products(self):
+        return await self._get(self.LIST_KEY, self.db_client.list_products)
+
+    async def get_product(self, product_id: int):
+        return await self._get(product_id, lambda: self.db_client.get_product(product_id))
+
+    def invalidate(self, product_id: int = None):
+        """Drop one product (and the list that contains it), or everything"""
+        self._generation += 1
+        if product_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(product_id, None)
+            self._entries.pop(self.LIST_KEY, None)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refresh_errors": self.refresh_errors,
+            "entries": len(self._entries),
+        }
+
+    # --------------------
+    # Internal helpers
+    # --------------------
+    async def _get(self, key, fetch):
+        if self.ttl <= 0:
+            return await fetch()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                return value
+            if age < self.ttl + self.stale:
+                self.stale_hits += 1
+                if key not in self._refreshing:
+                    self._refreshing[key] = asyncio.create_task(self._refresh(key, fetch))
+                return value
+
+        self.misses += 1
+        generation = self._generation
+        value = await fetch()
+        self._store(key, value, generation)
+        return value
+
+    def _store(self, key, value, generation):
+        if generation == self._generation:
+            self._entries[key] = (value, time.monotonic())
+
+    async def _refresh(self, key, fetch):
+        generation = self._generation
+        try:
+            self._store(key, await fetch(), generation)
+        except Exception:
+            # keep serving the stale value until it expires
+            self.refresh_errors += 1
+        finally:
+            del self._refreshing[key]
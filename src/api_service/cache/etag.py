@@ -0,0 +1,34 @@
+"""
+ETags for catalog responses. They are built from the versions db_service
+attaches to ListProducts / GetProduct, so they describe exactly the (possibly
+cached) data being served and never require hashing the body.
+"""
+
+
+def product_etag(product) -> str:
+    return f'"p{product.id}-{product.version}"'
+
+
+def list_etag(product_list) -> str:
+    return f'"c{product_list.version}"'
+
+
+def page_etag(after_id: int, products) -> str:
+    # a keyset page is identified by where it starts, which rows it holds and their versions
+    last_id = products[-1].id if products else after_id
+    return f'"g{after_id}-{last_id}-{len(products)}-{sum(p.version for p in products)}"'
+
+
+def not_modified(if_none_match, etag: str) -> bool:
+    """If-None-Match uses the weak comparison, so a W/ prefix is ignored"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
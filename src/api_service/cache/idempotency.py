@@ -0,0 +1,69 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class IdempotencyStore:
+    """
+    Remembers the result of a request per idempotency key for `ttl` seconds,
+    keeping at most `max_entries` (oldest dropped first).
+
+    - completed key:  the stored result is returned without running anything
+    - key in flight:  the caller waits for the running call and gets its result
+    - otherwise:      fn() runs; only a successful result is stored, so a failed
+                      request can be retried with the same key
+
+    This is only the fast path of one replica: db_service keeps the key with the
+    order, so a retry that lands on another replica still gets the same order.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # key -> (value, expires_at), oldest first
+        self._inflight = {}            # key -> Task
+
+        self.hits = 0
+        self.waits = 0
+        self.misses = 0
+
+    async def run(self, key, fn):
+        """Returns (value, replayed)"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if time.monotonic() < expires_at:
+                self.hits += 1
+                return value, True
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.waits += 1
+            # shielded: a waiter going away must not cancel the order for the others
+            return await asyncio.shield(task), True
+
+        self.misses += 1
+        task = self._inflight[key] = asyncio.ensure_future(fn())
+        task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task), False
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "waits": self.waits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "in_flight": len(self._inflight),
+        }
+
+    def _finish(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._entries[key] = (task.result(), time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
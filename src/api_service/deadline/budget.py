@@ -0,0 +1,34 @@
+"""
+Per-request time budget. The API sets a deadline when a request starts and
+every gRPC call made on behalf of that request passes time_remaining() as its
+timeout, so db_service (and Postgres behind it) gives up when the caller does.
+
+The deadline lives in a ContextVar: tasks and threadpool calls started by the
+request inherit it, the log shipper and other background work do not.
+"""
+import time
+from contextvars import ContextVar
+
+_deadline = ContextVar("deadline", default=None)  # time.monotonic() value, or None
+
+
+def set_budget(seconds):
+    """Starts the budget of the current request (None or <= 0: no deadline)"""
+    _deadline.set(time.monotonic() + seconds if seconds and seconds > 0 else None)
+
+
+def time_remaining():
+    """Seconds left for the current request, or None when it has no deadline"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def parse_budgets(spec: str) -> dict:
+    """Parses 'list_products=10,place_orders=8' into {"list_products": 10.0, ...}"""
+    budgets = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, seconds = item.split("=")
+        budgets[route.strip()] = float(seconds)
+    return budgets
@@ -0,0 +1,42 @@
+import asyncio
+
+
+class CancelOnDisconnect:
+    """
+    ASGI middleware that cancels an HTTP request's handler when the client
+    disconnects before the response is complete. Cancelling the handler cancels
+    the gRPC call it is awaiting, which in turn cancels the query in db_service.
+
+    This middleware is the only reader of `receive`: messages are forwarded to
+    the app through a queue, and http.disconnect also cancels the app.
+    Work shielded from cancellation (idempotent orders, coalesced reads) still
+    completes for whoever else is waiting on it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        messages = asyncio.Queue()
+        app_task = asyncio.ensure_future(self.app(scope, messages.get, send))
+
+        async def watch():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    app_task.cancel()
+                    return
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            # cancelled by watch(): the client is gone, nothing left to send
+            if not watcher.done():
+                raise
+        finally:
+            watcher.cancel()
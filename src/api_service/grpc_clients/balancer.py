@@ -0,0 +1,130 @@
+"""
+Client-side load balancing over several db_service replicas.
+
+Each replica is an Endpoint with its own channel and stubs. Balancer.acquire()
+picks one per call:
+
+- round_robin:         the next healthy endpoint in turn
+- least_outstanding:   the healthy endpoint with the fewest calls in flight
+                       (ties go round-robin)
+
+Health is tracked passively: after `eject_after` consecutive UNAVAILABLE
+failures an endpoint is ejected for `eject_for` seconds. Once that passes it is
+tried again, and a single further failure ejects it again, until a call
+succeeds. If every endpoint is ejected, the one due back first is used anyway
+rather than failing without trying.
+"""
+import threading
+import time
+
+import grpc
+
+import db_pb2_grpc
+
+# failures that say something about the replica rather than about the request
+UNHEALTHY_CODES = {grpc.StatusCode.UNAVAILABLE}
+
+
+def parse_addresses(spec: str, default_port: int = 50051) -> list:
+    """Parses 'db1:50051,db2:50052,db3' into ["db1:50051", "db2:50052", "db3:50051"]"""
+    addresses = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        addresses.append(item if ":" in item else f"{item}:{default_port}")
+    return addresses
+
+
+class Endpoint:
+
+    def __init__(self, address: str, channel):
+        self.address = address
+        self.channel = channel
+        # method name -> callable, e.g. rpcs["GetProduct"](request, timeout=...)
+        self.rpcs = {
+            **vars(db_pb2_grpc.ProductServiceStub(channel)),
+            **vars(db_pb2_grpc.UserServiceStub(channel)),
+            **vars(db_pb2_grpc.OrderServiceStub(channel)),
+        }
+
+        self.outstanding = 0
+        self.failures = 0          # consecutive unhealthy failures
+        self.ejected_until = 0.0   # time.monotonic()
+
+        self.calls = 0
+        self.errors = 0
+        self.ejections = 0
+
+    def stats(self, now):
+        return {
+            "address": self.address,
+            "healthy": self.ejected_until <= now,
+            "outstanding": self.outstanding,
+            "calls": self.calls,
+            "errors": self.errors,
+            "ejections": self.ejections,
+        }
+
+
+class Balancer:
+
+    POLICIES = ("round_robin", "least_outstanding")
+
+    def __init__(self, endpoints: list, policy: str = "round_robin",
+                 eject_after: int = 3, eject_for: float = 10.0):
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown balancing policy {policy!r}")
+        self.endpoints = endpoints
+        self.policy = policy
+        self.eject_after = eject_after
+        self.eject_for = eject_for
+
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def acquire(self) -> Endpoint:
+        """Picks an endpoint and counts a call in flight on it; pair with release()"""
+        with self._lock:
+            now = time.monotonic()
+            n = len(self.endpoints)
+            start = self._next
+            self._next = (self._next + 1) % n
+            ordered = [self.endpoints[(start + i) % n] for i in range(n)]
+
+            healthy = [ep for ep in ordered if ep.ejected_until <= now]
+            if not healthy:
+                endpoint = min(ordered, key=lambda ep: ep.ejected_until)
+            elif self.policy == "least_outstanding":
+                endpoint = min(healthy, key=lambda ep: ep.outstanding)
+            else:
+                endpoint = healthy[0]
+
+            endpoint.outstanding += 1
+            endpoint.calls += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, code=None):
+        """code: the grpc.StatusCode the call failed with, None on success"""
+        with self._lock:
+            endpoint.outstanding -= 1
+            if code == grpc.StatusCode.CANCELLED:
+                # given up by the caller (lost hedge, client gone): says nothing about the replica
+                return
+            if code is None:
+                endpoint.failures = 0
+                return
+            endpoint.errors += 1
+            if code not in UNHEALTHY_CODES:
+                return
+            endpoint.failures += 1
+            if endpoint.failures >= self.eject_after:
+                endpoint.ejected_until = time.monotonic() + self.eject_for
+                endpoint.ejections += 1
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "endpoints": [ep.stats(now) for ep in self.endpoints],
+            }
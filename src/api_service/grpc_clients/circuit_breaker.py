@@ -0,0 +1,109 @@
+"""
+Circuit breaker for calls to a dependency that may be down.
+
+- closed:     calls go through; the outcomes of the last `window` calls are kept,
+              and once at least `min_calls` of them are known and the failure
+              rate reaches `failure_threshold` the circuit opens
+- open:       allow() is False without touching the network, for `cooldown` seconds
+- half_open:  after the cooldown, `half_open_calls` trial calls are let through;
+              a success closes the circuit, a failure opens it for another cooldown
+
+Callers ask allow() before a call and report record(success) after it.
+The state, transitions and refused calls are exported to Prometheus labelled
+with `target`, the dependency the breaker guards (see metrics/registry.py).
+"""
+import threading
+import time
+from collections import deque
+
+from metrics.registry import BREAKER_SHORT_CIRCUITED, BREAKER_STATE, BREAKER_TRANSITIONS
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# the value of circuit_breaker_state for each state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of making a call while the circuit is open"""
+
+
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold: float = 0.5, window: int = 20, min_calls: int = 5,
+                 cooldown: float = 10.0, half_open_calls: int = 1, target: str = "unknown"):
+        self.target = target
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.half_open_calls = half_open_calls
+
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)  # True = success
+        self._changed_at = 0.0
+        self._trials = 0
+        self._lock = threading.Lock()
+
+        self.short_circuited = 0
+        self.transitions = {}  # "closed->open" -> count
+
+        self._state_gauge = BREAKER_STATE.labels(target)
+        self._state_gauge.set(STATE_VALUES[CLOSED])
+        self._short_circuited_counter = BREAKER_SHORT_CIRCUITED.labels(target)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self._changed_at >= self.cooldown:
+                # open: the cooldown is over; half-open: a trial never reported back
+                self._move(HALF_OPEN)
+            if self.state == HALF_OPEN and self._trials < self.half_open_calls:
+                self._trials += 1
+                return True
+            self.short_circuited += 1
+            self._short_circuited_counter.inc()
+            return False
+
+    def rejecting(self) -> bool:
+        """Whether allow() would be False now; unlike allow(), changes nothing"""
+        with self._lock:
+            if self.state == CLOSED or time.monotonic() - self._changed_at >= self.cooldown:
+                return False
+            return self.state == OPEN or self._trials >= self.half_open_calls
+
+    def record(self, success: bool):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._move(CLOSED if success else OPEN)
+                return
+            if self.state == OPEN:
+                # a call let through before the circuit opened
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_threshold):
+                self._move(OPEN)
+
+    def _move(self, state):
+        name = f"{self.state}->{state}"
+        self.transitions[name] = self.transitions.get(name, 0) + 1
+        BREAKER_TRANSITIONS.labels(self.target, name).inc()
+        self._state_gauge.set(STATE_VALUES[state])
+        self.state = state
+        self._changed_at = time.monotonic()
+        self._trials = 0
+        self._outcomes.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "target": self.target,
+                "state": self.state,
+                "short_circuited": self.short_circuited,
+                "transitions": dict(self.transitions),
+            }
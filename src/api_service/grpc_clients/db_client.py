@@ -1,6 +1,13 @@
+import asyncio
 import grpc
 import os
+import queue
 import sys
+import time
+from starlette.concurrency import run_in_threadpool
+
+from deadline.budget import time_remaining
+from grpc_clients.single_flight import AsyncSingleFlight, SingleFlight
 
 # 导入 gRPC 生成文件
 # from protos_shared import db_pb2, db_pb2_grpc
@@ -8,44 +15,391 @@ import sys
 sys.path.append("/app/protos_shared")
 
 import db_pb2
-import db_pb2_grpc
+
+from grpc_clients.balancer import Balancer, Endpoint, parse_addresses
+from grpc_clients.retry import ReadPolicy
+from metrics.registry import observe_rpc
+from tracing.spans import span, start_span
+
+
+def _end_span(s, endpoint, code):
+    s.set("peer", endpoint.address)
+    if code is not None:
+        s.error = code.name
+    s.end()
+
 
 class DBClient:
-    def __init__(self, host: str):
-        channel = grpc.insecure_channel(host)
-        self.product_stub = db_pb2_grpc.ProductServiceStub(channel)
-        self.user_stub = db_pb2_grpc.UserServiceStub(channel)
-        self.order_stub = db_pb2_grpc.OrderServiceStub(channel)
+    """
+    host: "addr:port", or several separated by commas, one per db_service
+    replica; calls are spread over them by a Balancer (see balancer.py).
+    Every call gets the calling request's remaining budget as its deadline,
+    and the current trace context as `traceparent` metadata.
+    Reads are retried, and optionally hedged, by a ReadPolicy (see retry.py);
+    writes are sent exactly once.
+    """
+
+    def __init__(self, host: str, policy: str = "round_robin",
+                 eject_after: int = 3, eject_for: float = 10.0,
+                 hedge_reads: bool = False, max_retries: int = 2, retry_ratio: float = 0.1):
+        self.balancer = Balancer(
+            [Endpoint(address, grpc.insecure_channel(address)) for address in parse_addresses(host)],
+            policy=policy, eject_after=eject_after, eject_for=eject_for,
+        )
+        self.read_policy = ReadPolicy(hedge=hedge_reads, max_retries=max_retries, retry_ratio=retry_ratio)
+        # concurrent identical reads share one RPC (and the deadline of whoever started it);
+        # update_user and cancel_order make later reads of what they wrote start afresh.
+        # Orders change product stock without that: product reads go through
+        # CatalogCache, which serves them up to CATALOG_CACHE_TTL old anyway
+        self.single_flight = SingleFlight()
+
+    def close(self):
+        for endpoint in self.balancer.endpoints:
+            endpoint.channel.close()
+
+    def _call(self, method: str, request):
+        endpoint = self.balancer.acquire()
+        code = None
+        started = time.perf_counter()
+        s = start_span(f"call {method}")
+        try:
+            return endpoint.rpcs[method](request, timeout=time_remaining(), metadata=s.metadata())
+        except grpc.RpcError as e:
+            code = e.code()
+            raise
+        finally:
+            observe_rpc("db", method, code, time.perf_counter() - started)
+            _end_span(s, endpoint, code)
+            self.balancer.release(endpoint, code)
+
+    def _read(self, method: str, request):
+        policy = self.read_policy
+        policy.budget.deposit()
+        attempt = 0
+        # one span over every attempt, retries and hedges included
+        with span(f"read {method}"):
+            while True:
+                try:
+                    return self._hedged(method, request)
+                except grpc.RpcError as e:
+                    pause = policy.retry_pause(attempt, e)
+                    if pause is None:
+                        raise
+                attempt += 1
+                time.sleep(pause)
+
+    def _hedged(self, method: str, request):
+        delay = self.read_policy.hedge_delay(method)
+        if delay is None:
+            started = time.monotonic()
+            response = self._call(method, request)
+            self.read_policy.latency[method].record(time.monotonic() - started)
+            return response
+
+        finished = queue.SimpleQueue()
+        attempts = [self._start(method, request, finished)]
+        try:
+            done = finished.get(timeout=delay)
+        except queue.Empty:
+            if self.read_policy.start_hedge():
+                attempts.append(self._start(method, request, finished))
+            done = finished.get()
+        # the first success wins; if the first to finish failed, wait for the other
+        for _ in attempts[1:]:
+            if done.exception() is None:
+                break
+            done = finished.get()
+        for future in attempts:
+            if future is not done:
+                future.cancel()
+        if done is not attempts[0]:
+            self.read_policy.hedge_won()
+        return done.result()
+
+    def _start(self, method: str, request, finished):
+        """One attempt as a grpc future, put on `finished` once it is done"""
+        endpoint = self.balancer.acquire()
+        started = time.monotonic()
+        s = start_span(f"call {method}")
+        future = endpoint.rpcs[method].future(request, timeout=time_remaining(), metadata=s.metadata())
+
+        def on_done(f):
+            elapsed = time.monotonic() - started
+            code = f.code()
+            if code == grpc.StatusCode.OK:
+                self.read_policy.latency[method].record(elapsed)
+                code = None
+            observe_rpc("db", method, code, elapsed)
+            _end_span(s, endpoint, code)
+            self.balancer.release(endpoint, code)
+            finished.put(f)
+        future.add_done_callback(on_done)
+        return future
+
+    def _stream(self, method: str, request):
+        endpoint = self.balancer.acquire()
+        code = None
+        started = time.perf_counter()
+        s = start_span(f"call {method}")
+        try:
+            yield from endpoint.rpcs[method](request, timeout=time_remaining(), metadata=s.metadata())
+        except grpc.RpcError as e:
+            code = e.code()
+            raise
+        finally:
+            observe_rpc("db", method, code, time.perf_counter() - started)
+            _end_span(s, endpoint, code)
+            self.balancer.release(endpoint, code)
 
     # ========== Product ==========
     def list_products(self):
-        return self.product_stub.ListProducts(db_pb2.Empty())
+        return self._read("ListProducts", db_pb2.Empty())
 
     def get_product(self, product_id: int):
-        return self.product_stub.GetProduct(db_pb2.ById(id=product_id))
+        return self.single_flight.do(
+            ("product", product_id),
+            lambda: self._read("GetProduct", db_pb2.ById(id=product_id)),
+        )
+
+    def stream_products(self, after_id: int = 0, limit: int = 0):
+        return self._stream("StreamProducts", db_pb2.ProductQuery(after_id=after_id, limit=limit))
+
+    def list_products_page(self, after_id: int, limit: int):
+        return list(self.stream_products(after_id, limit))
 
     # ========== User ==========
     def create_user(self, username: str, password_hash: str):
-        return self.user_stub.CreateUser(
-            db_pb2.RegisterRequest(username=username, password_hash=password_hash)
+        return self._call(
+            "CreateUser", db_pb2.RegisterRequest(username=username, password_hash=password_hash)
         )
 
     def get_user(self, user_id: int):
-        return self.user_stub.GetUser(db_pb2.ById(id=user_id))
+        return self.single_flight.do(
+            ("user", user_id),
+            lambda: self._read("GetUser", db_pb2.ById(id=user_id)),
+        )
+
+    def get_user_by_username(self, username: str):
+        return self._read("GetUserByUsername", db_pb2.ByUsername(username=username))
 
     def update_user(self, user_id: int, username: str, active: bool):
-        return self.user_stub.UpdateUser(
-            db_pb2.UpdateUserRequest(id=user_id, username=username, active=active)
-        )
+        try:
+            return self._call(
+                "UpdateUser", db_pb2.UpdateUserRequest(id=user_id, username=username, active=active)
+            )
+        finally:
+            # even a failed call may have written
+            self.single_flight.forget(("user", user_id))
 
     # ========== Order ==========
-    def create_order(self, user_id: int, product_id: int, quantity: int):
-        return self.order_stub.CreateOrder(
+    def create_order(self, user_id: int, product_id: int, quantity: int, idempotency_key: str = ""):
+        return self._call("CreateOrder", db_pb2.NewOrder(
+            user_id=user_id, product_id=product_id, quantity=quantity,
+            idempotency_key=idempotency_key,
+        ))
+
+    def create_orders(self, user_id: int, items):
+        """items: list of (product_id, quantity)"""
+        return self._call("CreateOrders", db_pb2.NewOrderBatch(orders=[
             db_pb2.NewOrder(user_id=user_id, product_id=product_id, quantity=quantity)
-        )
+            for product_id, quantity in items
+        ]))
 
     def get_order(self, order_id: int):
-        return self.order_stub.GetOrder(db_pb2.ById(id=order_id))
+        return self.single_flight.do(
+            ("order", order_id),
+            lambda: self._read("GetOrder", db_pb2.ById(id=order_id)),
+        )
 
     def cancel_order(self, order_id: int):
-        return self.order_stub.CancelOrder(db_pb2.ById(id=order_id))
+        try:
+            return self._call("CancelOrder", db_pb2.ById(id=order_id))
+        finally:
+            self.single_flight.forget(("order", order_id))
+
+
+class AsyncDBClient:
+    """Same calls as DBClient on grpc.aio channels; every method is a coroutine.
+    Must be created inside the running event loop."""
+
+    def __init__(self, host: str, policy: str = "round_robin",
+                 eject_after: int = 3, eject_for: float = 10.0,
+                 hedge_reads: bool = False, max_retries: int = 2, retry_ratio: float = 0.1):
+        self.balancer = Balancer(
+            [Endpoint(address, grpc.aio.insecure_channel(address)) for address in parse_addresses(host)],
+            policy=policy, eject_after=eject_after, eject_for=eject_for,
+        )
+        self.read_policy = ReadPolicy(hedge=hedge_reads, max_retries=max_retries, retry_ratio=retry_ratio)
+        # concurrent identical reads share one RPC; see DBClient
+        self.single_flight = AsyncSingleFlight()
+
+    async def close(self):
+        for endpoint in self.balancer.endpoints:
+            await endpoint.channel.close()
+
+    async def _call(self, method: str, request):
+        endpoint = self.balancer.acquire()
+        code = None
+        started = time.perf_counter()
+        s = start_span(f"call {method}")
+        try:
+            return await endpoint.rpcs[method](request, timeout=time_remaining(), metadata=s.metadata())
+        except grpc.RpcError as e:
+            code = e.code()
+            raise
+        except asyncio.CancelledError:
+            code = grpc.StatusCode.CANCELLED
+            raise
+        finally:
+            observe_rpc("db", method, code, time.perf_counter() - started)
+            _end_span(s, endpoint, code)
+            self.balancer.release(endpoint, code)
+
+    async def _read(self, method: str, request):
+        policy = self.read_policy
+        policy.budget.deposit()
+        attempt = 0
+        # one span over every attempt, retries and hedges included
+        with span(f"read {method}"):
+            while True:
+                try:
+                    return await self._hedged(method, request)
+                except grpc.RpcError as e:
+                    pause = policy.retry_pause(attempt, e)
+                    if pause is None:
+                        raise
+                attempt += 1
+                await asyncio.sleep(pause)
+
+    async def _attempt(self, method: str, request):
+        started = time.monotonic()
+        response = await self._call(method, request)
+        self.read_policy.latency[method].record(time.monotonic() - started)
+        return response
+
+    async def _hedged(self, method: str, request):
+        delay = self.read_policy.hedge_delay(method)
+        if delay is None:
+            return await self._attempt(method, request)
+
+        attempts = [asyncio.ensure_future(self._attempt(method, request))]
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if not done and self.read_policy.start_hedge():
+                attempts.append(asyncio.ensure_future(self._attempt(method, request)))
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    if succeeded[0] is not attempts[0]:
+                        self.read_policy.hedge_won()
+                    return succeeded[0].result()
+            # every attempt failed
+            return attempts[0].result()
+        finally:
+            for task in attempts:
+                task.cancel()
+
+    async def _stream(self, method: str, request):
+        endpoint = self.balancer.acquire()
+        code = None
+        started = time.perf_counter()
+        s = start_span(f"call {method}")
+        try:
+            async for response in endpoint.rpcs[method](request, timeout=time_remaining(), metadata=s.metadata()):
+                yield response
+        except grpc.RpcError as e:
+            code = e.code()
+            raise
+        finally:
+            observe_rpc("db", method, code, time.perf_counter() - started)
+            _end_span(s, endpoint, code)
+            self.balancer.release(endpoint, code)
+
+    # ========== Product ==========
+    async def list_products(self):
+        return await self._read("ListProducts", db_pb2.Empty())
+
+    async def get_product(self, product_id: int):
+        return await self.single_flight.do(
+            ("product", product_id),
+            lambda: self._read("GetProduct", db_pb2.ById(id=product_id)),
+        )
+
+    def stream_products(self, after_id: int = 0, limit: int = 0):
+        """Async iterator of Product"""
+        return self._stream("StreamProducts", db_pb2.ProductQuery(after_id=after_id, limit=limit))
+
+    async def list_products_page(self, after_id: int, limit: int):
+        return [p async for p in self.stream_products(after_id, limit)]
+
+    # ========== User ==========
+    async def create_user(self, username: str, password_hash: str):
+        return await self._call(
+            "CreateUser", db_pb2.RegisterRequest(username=username, password_hash=password_hash)
+        )
+
+    async def get_user(self, user_id: int):
+        return await self.single_flight.do(
+            ("user", user_id),
+            lambda: self._read("GetUser", db_pb2.ById(id=user_id)),
+        )
+
+    async def get_user_by_username(self, username: str):
+        return await self._read("GetUserByUsername", db_pb2.ByUsername(username=username))
+
+    async def update_user(self, user_id: int, username: str, active: bool):
+        try:
+            return await self._call(
+                "UpdateUser", db_pb2.UpdateUserRequest(id=user_id, username=username, active=active)
+            )
+        finally:
+            # even a failed call may have written
+            self.single_flight.forget(("user", user_id))
+
+    # ========== Order ==========
+    async def create_order(self, user_id: int, product_id: int, quantity: int, idempotency_key: str = ""):
+        return await self._call("CreateOrder", db_pb2.NewOrder(
+            user_id=user_id, product_id=product_id, quantity=quantity,
+            idempotency_key=idempotency_key,
+        ))
+
+    async def create_orders(self, user_id: int, items):
+        """items: list of (product_id, quantity)"""
+        return await self._call("CreateOrders", db_pb2.NewOrderBatch(orders=[
+            db_pb2.NewOrder(user_id=user_id, product_id=product_id, quantity=quantity)
+            for product_id, quantity in items
+        ]))
+
+    async def get_order(self, order_id: int):
+        return await self.single_flight.do(
+            ("order", order_id),
+            lambda: self._read("GetOrder", db_pb2.ById(id=order_id)),
+        )
+
+    async def cancel_order(self, order_id: int):
+        try:
+            return await self._call("CancelOrder", db_pb2.ById(id=order_id))
+        finally:
+            self.single_flight.forget(("order", order_id))
+
+
+class ThreadedDBClient:
+    """Blocking DBClient behind the AsyncDBClient interface (API_GRPC_MODE=sync).
+    Every call holds a threadpool worker for the whole RPC, like a sync route does."""
+
+    def __init__(self, host: str, **options):
+        self._client = DBClient(host, **options)
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            return await run_in_threadpool(method, *args, **kwargs)
+        return call
+
+    async def close(self):
+        self._client.close()
@@ -1,7 +1,17 @@
+import asyncio
 import os
 import sys
+import queue
+import threading
+import time
 import grpc
+from collections import deque
 from datetime import datetime
+from starlette.concurrency import run_in_threadpool
+
+from grpc_clients.circuit_breaker import CircuitBreaker, CircuitOpen
+from metrics.registry import observe_rpc
+from tracing.spans import start_span
 
 
 sys.path.append("/app/protos_shared")
@@ -15,13 +25,126 @@ import logging_pb2
 import logging_pb2_grpc
 
 
+class FallbackBuffer:
+    """
+    Messages logging_service did not take (circuit open, or the RPC failed),
+    kept in memory up to `size`; the oldest are dropped first. They are sent
+    ahead of new messages once calls go through again.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._messages = deque()
+        self._lock = threading.Lock()
+        self.kept = 0
+        self.dropped = 0
+        self.replayed = 0
+
+    def put(self, messages):
+        with self._lock:
+            for message in messages:
+                if len(self._messages) >= self.size:
+                    self._messages.popleft()
+                    self.dropped += 1
+                self._messages.append(message)
+                self.kept += 1
+
+    def __len__(self):
+        return len(self._messages)
+
+    def take(self, n: int) -> list:
+        with self._lock:
+            taken = [self._messages.popleft() for _ in range(min(n, len(self._messages)))]
+            self.replayed += len(taken)
+            return taken
+
+    def stats(self):
+        with self._lock:
+            return {
+                "buffered": len(self._messages),
+                "kept": self.kept,
+                "dropped": self.dropped,
+                "replayed": self.replayed,
+            }
+
+
 class LogClient:
-    def __init__(self, host: str):
+    """
+    background=False: every push_logs call is one PushLog RPC on the caller's thread.
+    background=True:  enqueue() puts messages on a bounded queue and returns at once;
+                      a worker thread ships them in batches of up to batch_size,
+                      or whatever arrived within flush_interval seconds.
+
+    Every PushLog goes through a CircuitBreaker: while logging_service keeps
+    failing, push_logs raises CircuitOpen at once instead of waiting on it, and
+    with fallback_size > 0 the messages are buffered for later instead of lost.
+    """
+
+    def __init__(self, host: str, background: bool = False, queue_size: int = 10000,
+                 batch_size: int = 500, flush_interval: float = 0.5, rpc_timeout: float = 5.0,
+                 breaker: CircuitBreaker = None, fallback_size: int = 0):
         self.channel = grpc.insecure_channel(host)
         self.stub = logging_pb2_grpc.LoggingServiceStub(self.channel)
 
+        self.background = background
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rpc_timeout = rpc_timeout  # a stuck logging_service must not hold a batch forever
+        self.breaker = breaker or CircuitBreaker(target="logging_service")
+        self.fallback = FallbackBuffer(fallback_size) if fallback_size > 0 else None
+
+        # counters, read them through stats(); "sent" includes buffered messages
+        # sent later, "lost" counts those that could be neither sent nor buffered
+        self._lock = threading.Lock()
+        self._enqueued = 0
+        self._dropped = 0
+        self._sent = 0
+        self._lost = 0
+        self._rpcs = 0
+
+        self._queue = None
+        self._closed = threading.Event()
+        if background:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._worker = threading.Thread(target=self._run, name="log-shipper", daemon=True)
+            self._worker.start()
+
     def push_logs(self, logs):  # logs 是 LogMessage 的迭代器
-        return self.stub.PushLog(logs)
+        return self._send(self._admit(logs))
+
+    def _send(self, logs: list):
+        started = time.perf_counter()
+        # the background worker has no current span: each batch starts its own trace
+        s = start_span("call PushLog")
+        s.set("messages", len(logs))
+        try:
+            response = self.stub.PushLog(iter(logs), timeout=self.rpc_timeout, metadata=s.metadata())
+        except grpc.RpcError as e:
+            observe_rpc("logging", "PushLog", e.code(), time.perf_counter() - started)
+            s.error = e.code().name
+            self._rejected(logs)
+            raise
+        finally:
+            s.end()
+        observe_rpc("logging", "PushLog", None, time.perf_counter() - started)
+        self.breaker.record(True)
+        return response
+
+    def _admit(self, logs) -> list:
+        """The messages to send now, buffered ones first; raises CircuitOpen instead"""
+        logs = list(logs)
+        if not self.breaker.allow():
+            if self.fallback is not None:
+                self.fallback.put(logs)
+            raise CircuitOpen("logging_service circuit is open")
+        if self.fallback is not None:
+            logs = self.fallback.take(self.batch_size) + logs
+        return logs
+
+    def _rejected(self, logs):
+        self.breaker.record(False)
+        if self.fallback is not None:
+            self.fallback.put(logs)
 
     def create_message(self, service_name: str, level: str, message: str):
         return logging_pb2.LogMessage(
@@ -30,3 +153,244 @@ class LogClient:
             message=message,
             timestamp=datetime.utcnow().isoformat()
         )
+
+    # --------------------
+    # Background mode
+    # --------------------
+    def enqueue(self, message) -> bool:
+        """Never blocks; returns False (and counts a drop) when the queue is full"""
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            return False
+        with self._lock:
+            self._enqueued += 1
+        return True
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._closed.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch and not (self.fallback is not None and len(self.fallback)):
+                continue
+            if self.breaker.rejecting():
+                # no call until the cooldown is over; new messages wait in the fallback
+                self._hold(batch)
+                continue
+            logs = batch
+            try:
+                logs = self._admit(batch)
+                self._send(logs)
+            except (grpc.RpcError, CircuitOpen):
+                # back in the fallback, if there is one
+                if self.fallback is None:
+                    with self._lock:
+                        self._lost += len(logs)
+                continue
+            with self._lock:
+                self._sent += len(logs)
+                self._rpcs += 1
+
+    def _hold(self, batch):
+        if self.fallback is not None:
+            self.fallback.put(batch)
+        else:
+            with self._lock:
+                self._lost += len(batch)
+
+    def close(self, timeout: float = 5.0):
+        """Stop the worker after it has shipped what is already queued"""
+        self._closed.set()
+        if self.background:
+            self._worker.join(timeout)
+        self.channel.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enqueued": self._enqueued,
+                "dropped": self._dropped,
+                "sent": self._sent,
+                "lost": self._lost,
+                "rpcs": self._rpcs,
+                "queued": self._queue.qsize() if self._queue else 0,
+                "breaker": self.breaker.stats(),
+                "fallback": self.fallback.stats() if self.fallback is not None else None,
+            }
+
+
+class AsyncLogClient:
+    """
+    LogClient on a grpc.aio channel. In background mode the shipper is an
+    asyncio task on the serving loop instead of a thread; call start() from
+    inside the loop and await close() on shutdown.
+    """
+
+    def __init__(self, host: str, background: bool = False, queue_size: int = 10000,
+                 batch_size: int = 500, flush_interval: float = 0.5, rpc_timeout: float = 5.0,
+                 breaker: CircuitBreaker = None, fallback_size: int = 0):
+        self.channel = grpc.aio.insecure_channel(host)
+        self.stub = logging_pb2_grpc.LoggingServiceStub(self.channel)
+
+        self.background = background
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rpc_timeout = rpc_timeout  # a stuck logging_service must not hold a batch forever
+        self.breaker = breaker or CircuitBreaker(target="logging_service")
+        self.fallback = FallbackBuffer(fallback_size) if fallback_size > 0 else None
+
+        # single event loop, so the counters need no lock; see LogClient
+        self._enqueued = 0
+        self._dropped = 0
+        self._sent = 0
+        self._lost = 0
+        self._rpcs = 0
+
+        self._queue = asyncio.Queue(maxsize=queue_size) if background else None
+        self._closed = asyncio.Event()
+        self._worker = None
+
+    create_message = LogClient.create_message
+
+    async def push_logs(self, logs):
+        return await self._send(self._admit(logs))
+
+    async def _send(self, logs: list):
+        started = time.perf_counter()
+        # the background worker has no current span: each batch starts its own trace
+        s = start_span("call PushLog")
+        s.set("messages", len(logs))
+        try:
+            response = await self.stub.PushLog(iter(logs), timeout=self.rpc_timeout, metadata=s.metadata())
+        except grpc.RpcError as e:
+            observe_rpc("logging", "PushLog", e.code(), time.perf_counter() - started)
+            s.error = e.code().name
+            self._rejected(logs)
+            raise
+        finally:
+            s.end()
+        observe_rpc("logging", "PushLog", None, time.perf_counter() - started)
+        self.breaker.record(True)
+        return response
+
+    _admit = LogClient._admit
+    _rejected = LogClient._rejected
+
+    def start(self):
+        if self.background and self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    def enqueue(self, message) -> bool:
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self._dropped += 1
+            return False
+        self._enqueued += 1
+        return True
+
+    async def _next_batch(self):
+        try:
+            batch = [await asyncio.wait_for(self._queue.get(), self.flush_interval)]
+        except asyncio.TimeoutError:
+            return []
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while not (self._closed.is_set() and self._queue.empty()):
+            batch = await self._next_batch()
+            if not batch and not (self.fallback is not None and len(self.fallback)):
+                continue
+            if self.breaker.rejecting():
+                self._hold(batch)
+                continue
+            logs = batch
+            try:
+                logs = self._admit(batch)
+                await self._send(logs)
+            except (grpc.RpcError, CircuitOpen):
+                if self.fallback is None:
+                    self._lost += len(logs)
+                continue
+            self._sent += len(logs)
+            self._rpcs += 1
+
+    def _hold(self, batch):
+        if self.fallback is not None:
+            self.fallback.put(batch)
+        else:
+            self._lost += len(batch)
+
+    async def close(self, timeout: float = 5.0):
+        self._closed.set()
+        if self._worker is not None:
+            try:
+                await asyncio.wait_for(self._worker, timeout)
+            except asyncio.TimeoutError:
+                pass
+        await self.channel.close()
+
+    def stats(self):
+        return {
+            "enqueued": self._enqueued,
+            "dropped": self._dropped,
+            "sent": self._sent,
+            "lost": self._lost,
+            "rpcs": self._rpcs,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "breaker": self.breaker.stats(),
+            "fallback": self.fallback.stats() if self.fallback is not None else None,
+        }
+
+
+class ThreadedLogClient:
+    """Blocking LogClient behind the AsyncLogClient interface (API_GRPC_MODE=sync):
+    the background shipper is LogClient's thread, and direct pushes hold a
+    threadpool worker for the whole RPC, like a sync route does."""
+
+    def __init__(self, host: str, **options):
+        self._client = LogClient(host, **options)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def start(self):
+        """LogClient starts its worker thread itself"""
+
+    async def push_logs(self, logs):
+        return await run_in_threadpool(self._client.push_logs, logs)
+
+    async def close(self, timeout: float = 5.0):
+        await run_in_threadpool(self._client.close, timeout)
@@ -0,0 +1,139 @@
+"""
+Retries and hedging for idempotent DB reads.
+
+- retry:  a read failing with UNAVAILABLE is tried again (on the next replica
+          the balancer picks) after a jittered exponential backoff, up to
+          max_retries times and never past the request's deadline
+- hedge:  (opt-in) if a read has not answered within the p95 latency observed
+          for that method, a second copy is sent and the first answer wins
+- budget: every read deposits `ratio` of a token and every retry or hedge
+          spends a whole one, so together they add at most ~ratio extra load
+          and cannot multiply traffic into a replica that is already down
+
+Writes never go through here: they are sent exactly once.
+"""
+import random
+import threading
+from collections import defaultdict, deque
+
+import grpc
+
+from deadline.budget import time_remaining
+
+RETRYABLE_CODES = {grpc.StatusCode.UNAVAILABLE}
+
+
+def backoff_delay(attempt: int, base: float = 0.025, cap: float = 1.0) -> float:
+    """'Full jitter': uniform between 0 and base * 2^attempt, at most cap"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class LatencyTracker:
+    """p95 over the last `window` successful calls, recomputed every `refresh_every`"""
+
+    def __init__(self, window: int = 1000, min_samples: int = 20, refresh_every: int = 50):
+        self.min_samples = min_samples
+        self.refresh_every = refresh_every
+        self._samples = deque(maxlen=window)
+        self._since_refresh = 0
+        self._p95 = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._since_refresh += 1
+            if self._since_refresh >= self.refresh_every or self._p95 is None:
+                self._since_refresh = 0
+                if len(self._samples) >= self.min_samples:
+                    ordered = sorted(self._samples)
+                    self._p95 = ordered[int(len(ordered) * 0.95) - 1]
+
+    def p95(self):
+        """None until min_samples calls have been seen"""
+        return self._p95
+
+
+class RetryBudget:
+
+    def __init__(self, ratio: float = 0.1, max_tokens: float = 20.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            self.rejected += 1
+            return False
+
+
+class ReadPolicy:
+
+    def __init__(self, hedge: bool = False, max_retries: int = 2, retry_ratio: float = 0.1):
+        self.hedge = hedge
+        self.max_retries = max_retries
+        self.budget = RetryBudget(ratio=retry_ratio)
+        self.latency = defaultdict(LatencyTracker)  # method name -> LatencyTracker
+
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0  # the hedge answered first
+
+    def hedge_delay(self, method: str):
+        """Seconds to wait before hedging `method`, or None not to hedge"""
+        if not self.hedge:
+            return None
+        delay = self.latency[method].p95()
+        remaining = time_remaining()
+        # a hedge that cannot start before the deadline is pointless
+        if delay is None or (remaining is not None and remaining <= delay):
+            return None
+        return delay
+
+    def start_hedge(self) -> bool:
+        if not self.budget.withdraw():
+            return False
+        with self._lock:
+            self.hedges += 1
+        return True
+
+    def hedge_won(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def retry_pause(self, attempt: int, error: grpc.RpcError):
+        """Seconds to sleep before retry number attempt + 1, or None to give up"""
+        if error.code() not in RETRYABLE_CODES or attempt >= self.max_retries:
+            return None
+        pause = backoff_delay(attempt)
+        remaining = time_remaining()
+        if remaining is not None and remaining <= pause:
+            return None
+        if not self.budget.withdraw():
+            return None
+        with self._lock:
+            self.retries += 1
+        return pause
+
+    def stats(self):
+        return {
+            "hedging": self.hedge,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "budget_rejected": self.budget.rejected,
+            "p95_ms": {
+                method: round(tracker.p95() * 1000, 3)
+                for method, tracker in list(self.latency.items()) if tracker.p95() is not None
+            },
+        }
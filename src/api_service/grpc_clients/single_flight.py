@@ -0,0 +1,85 @@
+"""
+Request coalescing: while a call for a key is in flight, identical calls wait
+for its result (or exception) instead of issuing their own RPC. Every waiter
+gets the same response object, so callers must treat it as read-only.
+
+A write to what a key reads must call forget(key) once it is done: a read
+that started before the write may still be in flight, and callers arriving
+after the write must not be handed its result.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """For blocking callers on many threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Future
+        self.calls = 0       # calls that actually ran
+        self.collapsed = 0   # calls answered by someone else's in-flight call
+
+    def do(self, key, fn):
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = Future()
+                self.calls += 1
+            else:
+                self.collapsed += 1
+        if not leader:
+            return fut.result()
+
+        try:
+            fut.set_result(fn())
+        except BaseException as e:
+            fut.set_exception(e)
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is fut:
+                    del self._inflight[key]
+        return fut.result()
+
+    def forget(self, key):
+        """Later calls for key start a new flight; current waiters keep theirs"""
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def stats(self):
+        return {"calls": self.calls, "collapsed": self.collapsed}
+
+
+class AsyncSingleFlight:
+    """For coroutines on one event loop"""
+
+    def __init__(self):
+        self._inflight = {}  # key -> Task
+        self.calls = 0
+        self.collapsed = 0
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.collapsed += 1
+        else:
+            task = self._inflight[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.calls += 1
+        # shielded: one waiter going away must not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def forget(self, key):
+        """Later calls for key start a new flight; current waiters keep theirs"""
+        self._inflight.pop(key, None)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every waiter was cancelled
+
+    def stats(self):
+        return {"calls": self.calls, "collapsed": self.collapsed}
@@ -0,0 +1,42 @@
+import time
+
+from metrics.registry import observe_request
+
+
+class RouteMetrics:
+    """
+    ASGI middleware timing every HTTP request, labelled with the name of the
+    route function that handled it (the names API_ROUTE_DEADLINES uses).
+    Paths no route matched share the label "unmatched", so scanners cannot
+    create a new series per URL.
+    A request whose handler is cancelled because the client left is
+    counted with status 499.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 499
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_and_record)
+        except Exception:
+            if status == 499:
+                # answered with a 500 by Starlette's error middleware, outside this one
+                status = 500
+            raise
+        finally:
+            # the router has put the matched endpoint in scope by now
+            route = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            observe_request(route, scope["method"], status, time.perf_counter() - started)
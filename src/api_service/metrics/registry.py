@@ -0,0 +1,73 @@
+"""
+Latency histograms and counters of the API service, served by GET /metrics in
+the Prometheus text format.
+
+- http_request_duration_seconds{route, method}     per route function
+- http_requests_total{route, method, status}
+- grpc_client_duration_seconds{service, method}    one observation per RPC attempt,
+  so retries and hedges are counted separately from the read that caused them
+- grpc_client_calls_total{service, method, code}
+- circuit_breaker_state{target}                    0 closed, 1 half open, 2 open
+- circuit_breaker_transitions_total{target, transition}   e.g. transition="closed->open"
+- circuit_breaker_short_circuited_total{target}    calls refused while open
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+from tracing.spans import latency_buckets
+
+LATENCY_BUCKETS = latency_buckets()
+
+HTTP_DURATION = Histogram(
+    "http_request_duration_seconds", "Time to answer an HTTP request",
+    ["route", "method"], buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests answered",
+    ["route", "method", "status"],
+)
+GRPC_CLIENT_DURATION = Histogram(
+    "grpc_client_duration_seconds", "Time from sending an RPC to its outcome",
+    ["service", "method"], buckets=LATENCY_BUCKETS,
+)
+GRPC_CLIENT_CALLS = Counter(
+    "grpc_client_calls_total", "RPCs sent, by outcome",
+    ["service", "method", "code"],
+)
+
+BREAKER_STATE = Gauge(
+    "circuit_breaker_state", "State of a circuit breaker: 0 closed, 1 half open, 2 open",
+    ["target"],
+)
+BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes",
+    ["target", "transition"],
+)
+BREAKER_SHORT_CIRCUITED = Counter(
+    "circuit_breaker_short_circuited_total", "Calls a circuit breaker refused",
+    ["target"],
+)
+
+
+# labels -> (histogram child, counter child); .labels() costs more than the
+# observation itself, so each combination is looked up once
+_http_series = {}
+_rpc_series = {}
+
+
+def observe_request(route: str, method: str, status: int, seconds: float):
+    key = (route, method, status)
+    series = _http_series.get(key)
+    if series is None:
+        series = _http_series[key] = (HTTP_DURATION.labels(route, method), HTTP_REQUESTS.labels(*key))
+    series[0].observe(seconds)
+    series[1].inc()
+
+
+def observe_rpc(service: str, method: str, code, seconds: float):
+    """code: the grpc.StatusCode the call ended with, None for OK"""
+    key = (service, method, code.name if code is not None else "OK")
+    series = _rpc_series.get(key)
+    if series is None:
+        series = _rpc_series[key] = (GRPC_CLIENT_DURATION.labels(service, method), GRPC_CLIENT_CALLS.labels(*key))
+    series[0].observe(seconds)
+    series[1].inc()
@@ -0,0 +1,172 @@
+"""
+Per-key token buckets. A rule (rate, burst) lets a key make `burst` calls at
+once and then `rate` calls per second. The buckets live in a store:
+
+- MemoryBucketStore: this process only
+- SQLiteBucketStore: a SQLite file shared by every API replica on the host,
+  a local stand-in for a shared store such as Redis
+
+A store with `blocking = True` does I/O in take(), so async callers must run
+it off the event loop.
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def _refill(tokens, last, now, rate, burst):
+    return min(burst, tokens + max(0.0, now - last) * rate)
+
+
+class StoreBusy(Exception):
+    """The store could not be locked in time; the call was neither allowed nor denied"""
+
+
+class MemoryBucketStore:
+    blocking = False
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last), least recently used first
+        self._lock = threading.Lock()
+
+    def take(self, key, rate: float, burst: float):
+        """Returns (allowed, seconds until a token is available)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (burst, now))
+            tokens = _refill(tokens, last, now, rate, burst)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # idle keys have usually refilled, and a full bucket is the same as none
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return (True, 0.0) if allowed else (False, (1 - tokens) / rate)
+
+
+class SQLiteBucketStore:
+    """
+    Waits at most busy_timeout seconds for the file's write lock, which other
+    replicas hold for one read-modify-write at a time, then raises StoreBusy.
+    """
+    blocking = True
+
+    def __init__(self, path: str, busy_timeout: float = 0.05):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                last REAL NOT NULL
+            )
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate: float, burst: float):
+        conn = self._conn()
+        # wall clock: the buckets are shared between processes
+        now = time.time()
+        # IMMEDIATE takes the write lock up front, so read-modify-write is atomic across replicas
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            raise StoreBusy(str(e)) from e
+        try:
+            row = conn.execute("SELECT tokens, last FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, last = row if row else (burst, now)
+            tokens = _refill(tokens, last, now, rate, burst)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, last) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, last = excluded.last",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return (True, 0.0) if allowed else (False, (1 - tokens) / rate)
+
+
+class TokenBucketLimiter:
+    """
+    rules: route name -> (rate per second, burst). Routes without a rule are
+    never limited. Calls the store cannot decide in time (StoreBusy) are
+    allowed and counted as "store_busy": a slow shared store must not turn
+    into 429s, nor hold up the request.
+    """
+
+    def __init__(self, store, rules: dict):
+        self.store = store
+        self.rules = rules
+        self.allowed = {route: 0 for route in rules}
+        self.rejected = {route: 0 for route in rules}
+        self.store_busy = {route: 0 for route in rules}
+        self._lock = threading.Lock()  # take() may run on several threadpool workers
+
+    def take(self, route: str, key):
+        rule = self.rules.get(route)
+        if rule is None:
+            return True, 0.0
+        rate, burst = rule
+        try:
+            allowed, retry_after = self.store.take(f"{route}:{key}", rate, burst)
+        except StoreBusy:
+            with self._lock:
+                self.store_busy[route] += 1
+            return True, 0.0
+        with self._lock:
+            if allowed:
+                self.allowed[route] += 1
+            else:
+                self.rejected[route] += 1
+        return allowed, retry_after
+
+    def stats(self):
+        with self._lock:
+            return {
+                route: {
+                    "allowed": self.allowed[route],
+                    "rejected": self.rejected[route],
+                    "store_busy": self.store_busy[route],
+                }
+                for route in self.rules
+            }
+
+
+def parse_rules(spec: str) -> dict:
+    """
+    Parses 'place_order=2:10,place_orders=0.5:3' into {"place_order": (2.0, 10.0), ...}.
+    Raises ValueError for a malformed rule, a rate that is not above 0 or a
+    burst below 1 (a bucket that never holds a whole token denies every call).
+    """
+    rules = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            route, limits = item.split("=")
+            rate, burst = (float(x) for x in limits.split(":"))
+        except ValueError:
+            raise ValueError(f"rate limit rule {item!r} is not <route>=<rate>:<burst>") from None
+        if not rate > 0:
+            raise ValueError(f"rate limit rule {item!r}: rate must be > 0")
+        if not burst >= 1:
+            raise ValueError(f"rate limit rule {item!r}: burst must be >= 1")
+        rules[route.strip()] = (rate, burst)
+    return rules
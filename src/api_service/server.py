@@ -1,201 +1,508 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response
+from fastapi.responses import JSONResponse
+import hmac
+import math
 from pydantic import BaseModel
-from google.protobuf.json_format import MessageToDict
 import grpc
 import os
-
-from auth.jwt_utils import create_jwt, verify_jwt
-from auth.password_utils import hash_password, verify_password
-
-from grpc_clients.db_client import DBClient
-from grpc_clients.log_client import LogClient
-
-app = FastAPI(title="SUSTech Merch Store API", version="1.0.0")
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.concurrency import run_in_threadpool
+
+from auth.jwt_utils import create_jwt, verify_jwt, VerifiedTokenCache
+from auth.password_utils import PasswordService, PasswordServiceBusy
+
+from grpc_clients.db_client import AsyncDBClient, ThreadedDBClient
+from grpc_clients.circuit_breaker import CircuitBreaker
+from grpc_clients.log_client import AsyncLogClient, ThreadedLogClient
+from cache.catalog_cache import CatalogCache
+from cache.idempotency import IdempotencyStore
+from cache.etag import list_etag, not_modified, page_etag, product_etag
+from deadline.budget import parse_budgets, set_budget
+from deadline.disconnect import CancelOnDisconnect
+from metrics.middleware import RouteMetrics
+from tracing.middleware import TraceRequests
+from tracing.spans import span
+from ratelimit.token_bucket import (
+    MemoryBucketStore, SQLiteBucketStore, TokenBucketLimiter, parse_rules,
+)
+from serializers.pb_json import (
+    JSONBytesResponse, dumps, order_to_dict, product_to_dict, user_to_dict,
+)
 
 DB_GRPC_HOST = f"{os.getenv('DB_GRPC_HOST', 'db_service')}:50051"
+# several db_service replicas: DB_GRPC_HOSTS="db1:50051,db2:50051,..." replaces DB_GRPC_HOST;
+# DB_LB_POLICY is round_robin or least_outstanding, and a replica failing with
+# UNAVAILABLE DB_EJECT_AFTER times in a row is skipped for DB_EJECT_SECONDS
+DB_GRPC_HOSTS = os.getenv("DB_GRPC_HOSTS") or DB_GRPC_HOST
+DB_LB_POLICY = os.getenv("DB_LB_POLICY", "round_robin")
+DB_EJECT_AFTER = int(os.getenv("DB_EJECT_AFTER", "3"))
+DB_EJECT_SECONDS = float(os.getenv("DB_EJECT_SECONDS", "10"))
+# reads failing with UNAVAILABLE are retried up to DB_READ_RETRIES times; with
+# DB_HEDGE_READS=true a read slower than its p95 is also sent a second time.
+# Both draw on one budget of DB_RETRY_BUDGET extra calls per read
+DB_READ_RETRIES = int(os.getenv("DB_READ_RETRIES", "2"))
+DB_HEDGE_READS = os.getenv("DB_HEDGE_READS", "false").lower() == "true"
+DB_RETRY_BUDGET = float(os.getenv("DB_RETRY_BUDGET", "0.1"))
 LOG_GRPC_HOST = f"{os.getenv('LOG_GRPC_HOST', 'logging_service')}:50052"
 JWT_SECRET = os.getenv("JWT_SECRET", "secret")
 
-db_client = DBClient(DB_GRPC_HOST)
-log_client = LogClient(LOG_GRPC_HOST)
+# verified tokens are remembered until they expire (JWT_CACHE_SIZE=0 disables)
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+jwt_cache = VerifiedTokenCache(JWT_SECRET, maxsize=JWT_CACHE_SIZE) if JWT_CACHE_SIZE > 0 else None
+
+# logs are shipped by a background worker unless LOG_BACKGROUND=false
+LOG_BACKGROUND = os.getenv("LOG_BACKGROUND", "true").lower() == "true"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+# when at least LOG_BREAKER_THRESHOLD of the last LOG_BREAKER_WINDOW log RPCs failed,
+# logging is skipped for LOG_BREAKER_COOLDOWN seconds; up to LOG_FALLBACK_SIZE
+# messages (0: none) are kept meanwhile and sent once logging_service is back
+LOG_BREAKER_THRESHOLD = float(os.getenv("LOG_BREAKER_THRESHOLD", "0.5"))
+LOG_BREAKER_WINDOW = int(os.getenv("LOG_BREAKER_WINDOW", "20"))
+LOG_BREAKER_COOLDOWN = float(os.getenv("LOG_BREAKER_COOLDOWN", "10"))
+LOG_FALLBACK_SIZE = int(os.getenv("LOG_FALLBACK_SIZE", "10000"))
+
+# catalog reads are cached for CATALOG_CACHE_TTL seconds (0 disables the cache)
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "5"))
+CATALOG_CACHE_STALE = float(os.getenv("CATALOG_CACHE_STALE", "60"))
+# POST /cache/invalidate is for operators only: it needs the X-Admin-Token header
+# to equal CACHE_ADMIN_TOKEN, and answers 404 while CACHE_ADMIN_TOKEN is unset
+CACHE_ADMIN_TOKEN = os.getenv("CACHE_ADMIN_TOKEN", "")
+
+# per-user token buckets, "<route>=<rate per second>:<burst>,...";
+# RATE_LIMIT_STORE=sqlite shares the buckets between replicas through RATE_LIMIT_SQLITE_PATH,
+# waiting up to RATE_LIMIT_SQLITE_BUSY_MS for the file's lock before letting the request through
+RATE_LIMITS = parse_rules(os.getenv("RATE_LIMITS", "place_order=1:5,place_orders=0.2:2"))
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "/tmp/api_rate_limits.db")
+RATE_LIMIT_SQLITE_BUSY_MS = float(os.getenv("RATE_LIMIT_SQLITE_BUSY_MS", "50"))
+
+if RATE_LIMIT_STORE == "sqlite":
+    rate_limiter = TokenBucketLimiter(
+        SQLiteBucketStore(RATE_LIMIT_SQLITE_PATH, busy_timeout=RATE_LIMIT_SQLITE_BUSY_MS / 1000),
+        RATE_LIMITS,
+    )
+else:
+    rate_limiter = TokenBucketLimiter(MemoryBucketStore(), RATE_LIMITS)
+
+# POST /orders responses are kept per (user, Idempotency-Key) for IDEMPOTENCY_TTL seconds;
+# db_service also stores the key, so replays past this cache still return the first order
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+idempotency_store = IdempotencyStore(max_entries=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL)
+
+# bcrypt runs on PASSWORD_WORKERS processes; beyond PASSWORD_MAX_PENDING
+# concurrent register/login calls the API answers 503 instead of queueing
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "0")) or None
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", "0")) or None
+
+# every request gets API_DEADLINE seconds (0: unbounded) for its gRPC calls, or the
+# route's own budget from API_ROUTE_DEADLINES ("<route function>=<seconds>,...");
+# db_service turns what is left into the Postgres statement_timeout
+API_DEADLINE = float(os.getenv("API_DEADLINE", "5"))
+API_ROUTE_DEADLINES = parse_budgets(os.getenv("API_ROUTE_DEADLINES", ""))
+
+# handlers of clients that hang up are cancelled, and with them their gRPC calls
+CANCEL_ON_DISCONNECT = os.getenv("CANCEL_ON_DISCONNECT", "true").lower() == "true"
+
+# "aio": grpc.aio stubs awaited on the event loop
+# "sync": the blocking DBClient and LogClient of the old code, every RPC run on the
+#         threadpool (kept for comparison). The routes stay async def either way;
+#         the threadpool hop is what FastAPI did for the old sync routes
+API_GRPC_MODE = os.getenv("API_GRPC_MODE", "aio")
+
+# grpc.aio channels bind to the running loop, so the clients are created in lifespan
+db_client = None
+log_client = None
+catalog_cache = None
+password_service = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global db_client, log_client, catalog_cache, password_service
+    password_service = PasswordService(workers=PASSWORD_WORKERS, max_pending=PASSWORD_MAX_PENDING)
+    await password_service.warm_up()
+    options = dict(
+        policy=DB_LB_POLICY, eject_after=DB_EJECT_AFTER, eject_for=DB_EJECT_SECONDS,
+        hedge_reads=DB_HEDGE_READS, max_retries=DB_READ_RETRIES, retry_ratio=DB_RETRY_BUDGET,
+    )
+    if API_GRPC_MODE == "sync":
+        db_client = ThreadedDBClient(DB_GRPC_HOSTS, **options)
+    else:
+        db_client = AsyncDBClient(DB_GRPC_HOSTS, **options)
+    catalog_cache = CatalogCache(db_client, ttl=CATALOG_CACHE_TTL, stale=CATALOG_CACHE_STALE)
+    log_client_class = ThreadedLogClient if API_GRPC_MODE == "sync" else AsyncLogClient
+    log_client = log_client_class(
+        LOG_GRPC_HOST,
+        background=LOG_BACKGROUND,
+        queue_size=LOG_QUEUE_SIZE,
+        batch_size=LOG_BATCH_SIZE,
+        flush_interval=LOG_FLUSH_INTERVAL,
+        breaker=CircuitBreaker(
+            failure_threshold=LOG_BREAKER_THRESHOLD,
+            window=LOG_BREAKER_WINDOW,
+            cooldown=LOG_BREAKER_COOLDOWN,
+            target="logging_service",
+        ),
+        fallback_size=LOG_FALLBACK_SIZE,
+    )
+    log_client.start()
+    yield
+    await log_client.close()
+    await db_client.close()
+    password_service.shutdown()
+
+async def request_budget(request: Request):
+    """App-wide dependency: starts the deadline of the matched route"""
+    route = getattr(request.scope.get("endpoint"), "__name__", None)
+    set_budget(API_ROUTE_DEADLINES.get(route, API_DEADLINE))
+
+app = FastAPI(
+    title="SUSTech Merch Store API",
+    version="1.0.0",
+    lifespan=lifespan,
+    dependencies=[Depends(request_budget)],
+)
+if CANCEL_ON_DISCONNECT:
+    app.add_middleware(CancelOnDisconnect)
+# TRACE_SAMPLE_RATE of the requests are traced into db_service and logging_service,
+# spans go to TRACE_FILE or stdout (see tracing/spans.py)
+app.add_middleware(TraceRequests)
+# outermost, so the time includes the middlewares above
+app.add_middleware(RouteMetrics)
+
+def raise_for_deadline(e: grpc.RpcError):
+    """An exhausted budget is a 504, whatever the route would report for other failures"""
+    if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+        raise HTTPException(504, "Request timed out")
+
+@app.exception_handler(grpc.RpcError)
+async def rpc_error_handler(request: Request, e: grpc.RpcError):
+    if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+        return JSONResponse({"detail": "Request timed out"}, status_code=504)
+    if e.code() == grpc.StatusCode.RESOURCE_EXHAUSTED:
+        # db_service waited DB_POOL_TIMEOUT for a connection
+        return JSONResponse({"detail": "Server busy, retry later"}, status_code=503,
+                            headers={"Retry-After": "1"})
+    raise e
+
+async def log_event(msg: str, level="INFO"):
+    with span("log_event"):
+        message = log_client.create_message(
+            service_name="api_service",
+            level=level,
+            message=msg,
+        )
+        if log_client.background:
+            log_client.enqueue(message)
+            return
+        try:
+            await log_client.push_logs(iter([message]))
+        except Exception:
+            pass
 
-def pb_to_dict(pb_obj):
-    return MessageToDict(pb_obj, preserving_proto_field_name=True)
+async def hash_password(password: str) -> str:
+    try:
+        return await password_service.hash(password)
+    except PasswordServiceBusy:
+        raise HTTPException(503, "Server busy, retry later", headers={"Retry-After": "1"})
 
-def log_event(msg: str, level="INFO"):
-    message = log_client.create_message(
-        service_name="api_service",
-        level=level,
-        message=msg,
-    )
+async def verify_password(password: str, hashed: str) -> bool:
     try:
-        log_client.push_logs(iter([message]))
-    except:
-        pass 
+        return await password_service.verify(password, hashed)
+    except PasswordServiceBusy:
+        raise HTTPException(503, "Server busy, retry later", headers={"Retry-After": "1"})
 
-def get_current_user_id(authorization: str = Header(None)):
+async def get_current_user_id(authorization: str = Header(None)):
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(401, "Missing token")
 
     token = authorization.split(" ")[1]
-    user_id = verify_jwt(token, JWT_SECRET)
+    if jwt_cache is not None:
+        user_id = jwt_cache.verify(token)
+    else:
+        user_id = verify_jwt(token, JWT_SECRET)
 
     if not user_id:
         raise HTTPException(401, "Invalid or expired token")
 
     return user_id
 
+def rate_limited(route: str):
+    """Dependency: the current user, after taking a token from their bucket for route"""
+    async def dependency(current_user: int = Depends(get_current_user_id)):
+        if rate_limiter.store.blocking:
+            # a shared file may be locked by another replica: wait for it off the loop
+            allowed, retry_after = await run_in_threadpool(rate_limiter.take, route, current_user)
+        else:
+            allowed, retry_after = rate_limiter.take(route, current_user)
+        if not allowed:
+            raise HTTPException(429, "Too many requests",
+                                headers={"Retry-After": str(math.ceil(retry_after))})
+        return current_user
+    return dependency
+
 @app.get("/")
-def greeting():
-    log_event("Greeting called")
+async def greeting():
+    await log_event("Greeting called")
     return {"message": "Welcome to SUSTech Merch Store"}
 
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
 @app.get("/products")
-def list_products():
-    res = db_client.list_products()
-    products = [pb_to_dict(p) for p in res.products]
-    log_event("List products")
-    return products
+async def list_products(after_id: int | None = None, limit: int | None = None,
+                        if_none_match: str | None = Header(None)):
+    if after_id is not None or limit is not None:
+        return await list_products_page(
+            after_id or 0, DEFAULT_PAGE_LIMIT if limit is None else limit, if_none_match
+        )
+
+    res = await catalog_cache.list_products()
+    await log_event("List products")
+    etag = list_etag(res)
+    if not_modified(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONBytesResponse(dumps([product_to_dict(p) for p in res.products]), headers={"ETag": etag})
+
+async def list_products_page(after_id: int, limit: int, if_none_match: str | None):
+    """Keyset page; X-Next-After-Id is set when there may be more products"""
+    if after_id < 0 or not 0 < limit <= MAX_PAGE_LIMIT:
+        raise HTTPException(400, f"after_id must be >= 0 and limit between 1 and {MAX_PAGE_LIMIT}")
+
+    products = await db_client.list_products_page(after_id, limit)
+    await log_event(f"List products after {after_id}")
+
+    headers = {"ETag": page_etag(after_id, products)}
+    if len(products) == limit:
+        headers["X-Next-After-Id"] = str(products[-1].id)
+    if not_modified(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return JSONBytesResponse(dumps([product_to_dict(p) for p in products]), headers=headers)
 
 @app.get("/products/{product_id}")
-def get_product(product_id: int):
+async def get_product(product_id: int, if_none_match: str | None = Header(None)):
     try:
-        p = db_client.get_product(product_id)
-    except grpc.RpcError:
+        p = await catalog_cache.get_product(product_id)
+    except grpc.RpcError as e:
+        raise_for_deadline(e)
         raise HTTPException(404, "Product not found")
-    return pb_to_dict(p)
+    etag = product_etag(p)
+    if not_modified(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONBytesResponse(dumps(product_to_dict(p)), headers={"ETag": etag})
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        **catalog_cache.stats(),
+        "single_flight": db_client.single_flight.stats(),
+        "idempotency": idempotency_store.stats(),
+    }
+
+@app.post("/cache/invalidate")
+async def invalidate_cache(product_id: int | None = None, x_admin_token: str | None = Header(None)):
+    if not CACHE_ADMIN_TOKEN:
+        raise HTTPException(404, "Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), CACHE_ADMIN_TOKEN.encode()):
+        raise HTTPException(403, "Admin token required")
+    catalog_cache.invalidate(product_id)
+    await log_event("Catalog cache invalidated")
+    return catalog_cache.stats()
+
+@app.get("/db/stats")
+async def db_stats():
+    return {**db_client.balancer.stats(), "reads": db_client.read_policy.stats()}
+
+@app.get("/logs/stats")
+async def log_stats():
+    return log_client.stats()
+
+@app.get("/ratelimit/stats")
+async def rate_limit_stats():
+    return rate_limiter.stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Latency histograms and counters (see metrics/registry.py) in the Prometheus text format"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 class RegisterRequest(BaseModel):
     username: str
     password: str
     
 @app.post("/users/register")
-def register(req: RegisterRequest):
-    print("DEBUG password =", req.password)
-    print("TYPE =", type(req.password))
-    hashed = hash_password(req.password)
+async def register(req: RegisterRequest):
+    hashed = await hash_password(req.password)
     try:
-        user = db_client. create_user(req.username, hashed)
-    except:
+        user = await db_client.create_user(req.username, hashed)
+    except grpc.RpcError as e:
+        raise_for_deadline(e)
+        if e.code() == grpc.StatusCode.ALREADY_EXISTS:
+            raise HTTPException(409, "Username is taken")
         raise HTTPException(500, "Cannot create user")
-    log_event(f"Registered user {req.username}")
-    return {
-        "id": user.id,
-        "username": user.username,
-        "active": user.active
-    }
+    await log_event(f"Registered user {req.username}")
+    return JSONBytesResponse(dumps(user_to_dict(user)))
 
 class LoginRequest(BaseModel):
     username: str
     password: str
 
 @app.post("/users/login")
-def login(req: LoginRequest):
-    found = None
-    for i in range(1, 200):
-        try:
-            user = db_client.get_user(i)
-            if user.username == req.username:
-                found = user
-                break
-        except:
-            continue
-
-    if not found:
+async def login(req: LoginRequest):
+    try:
+        found = await db_client.get_user_by_username(req.username)
+    except grpc.RpcError as e:
+        raise_for_deadline(e)
         raise HTTPException(404, "User not found")
 
-    if not verify_password(req.password, found.password_hash):
+    if not await verify_password(req.password, found.password_hash):
         raise HTTPException(403, "Wrong password")
 
     token = create_jwt(found.id, JWT_SECRET)
-    log_event(f"User {req.username} logged in")
+    await log_event(f"User {req.username} logged in")
     return {"token": token}
 
 @app.get("/users/{user_id}")
-def get_user(user_id: int, current_user: int = Depends(get_current_user_id)):
+async def get_user(user_id: int, current_user: int = Depends(get_current_user_id)):
     try:
-        user = db_client.get_user(user_id)
-    except:
+        user = await db_client.get_user(user_id)
+    except grpc.RpcError as e:
+        raise_for_deadline(e)
         raise HTTPException(404, "User not found")
 
-    log_event(f"Fetched user {user_id}")
-    return {
-        "id": user.id,
-        "username": user.username,
-        "active": user.active
-    }
+    await log_event(f"Fetched user {user_id}")
+    return JSONBytesResponse(dumps(user_to_dict(user)))
 
 class UpdateMeRequest(BaseModel):
     username: str | None = None
     active: bool | None = None
 
 @app.put("/users/me")
-def update_me(req: UpdateMeRequest, current_user: int = Depends(get_current_user_id)):
+async def update_me(req: UpdateMeRequest, current_user: int = Depends(get_current_user_id)):
 
-    old = db_client.get_user(current_user)
+    old = await db_client.get_user(current_user)
     new_username = req.username if req.username else old.username
     new_active = old.active if req.active is None else req.active
 
-    updated = db_client.update_user(current_user, new_username, new_active)
-    log_event(f"Updated user {current_user}")
+    try:
+        updated = await db_client.update_user(current_user, new_username, new_active)
+    except grpc.RpcError as e:
+        raise_for_deadline(e)
+        if e.code() == grpc.StatusCode.ALREADY_EXISTS:
+            raise HTTPException(409, "Username is taken")
+        raise
+    await log_event(f"Updated user {current_user}")
 
-    return {
-        "id": updated.id,
-        "username": updated.username,
-        "active": updated.active
-    }
+    return JSONBytesResponse(dumps(user_to_dict(updated)))
 
 @app.post("/users/{user_id}/deactivate")
-def deactivate_user(user_id: int, current_user: int = Depends(get_current_user_id)):
+async def deactivate_user(user_id: int, current_user: int = Depends(get_current_user_id)):
     try:
-        user = db_client.get_user(user_id)
-    except:
+        user = await db_client.get_user(user_id)
+    except grpc.RpcError as e:
+        raise_for_deadline(e)
         raise HTTPException(404, "User not found")
 
-    updated = db_client.update_user(user_id, user.username, False)
-    log_event(f"Deactivated user {user_id}")
+    updated = await db_client.update_user(user_id, user.username, False)
+    await log_event(f"Deactivated user {user_id}")
     
-    return {
-        "id": updated.id,
-        "username": updated.username,
-        "active": updated.active
-    }
+    return JSONBytesResponse(dumps(user_to_dict(updated)))
 
 class PlaceOrderRequest(BaseModel):
     product_id: int
     quantity: int
 
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
 @app.post("/orders")
-def place_order(req: PlaceOrderRequest, current_user: int = Depends(get_current_user_id)):
+async def place_order(
+    req: PlaceOrderRequest,
+    current_user: int = Depends(rate_limited("place_order")),
+    idempotency_key: str | None = Header(None),
+):
 
     if req.quantity <= 0 or req.quantity > 3:
         raise HTTPException(400, "Quantity must be <= 3")
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise HTTPException(400, f"Idempotency-Key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters")
 
-    try:
-        order = db_client.create_order(current_user, req.product_id, req.quantity)
-    except:
-        raise HTTPException(500, "Cannot create order")
+    async def create():
+        try:
+            order = await db_client.create_order(
+                current_user, req.product_id, req.quantity, idempotency_key or ""
+            )
+        except grpc.RpcError as e:
+            raise_for_deadline(e)
+            if e.code() == grpc.StatusCode.NOT_FOUND:
+                raise HTTPException(404, "Product not found")
+            if e.code() == grpc.StatusCode.FAILED_PRECONDITION:
+                raise HTTPException(409, "Out of stock")
+            raise HTTPException(500, "Cannot create order")
+        await log_event(f"Order placed by user {current_user}")
+        return order
+
+    if idempotency_key is None:
+        return JSONBytesResponse(dumps(order_to_dict(await create())))
+
+    order, replayed = await idempotency_store.run((current_user, idempotency_key), create)
+    # db_service may also hand back an earlier order for this key
+    if order.product_id != req.product_id or order.quantity != req.quantity:
+        raise HTTPException(422, "Idempotency-Key was already used for a different order")
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return JSONBytesResponse(dumps(order_to_dict(order)), headers=headers)
+
+class PlaceOrdersRequest(BaseModel):
+    items: list[PlaceOrderRequest]
+
+MAX_BATCH_ITEMS = 20
+
+@app.post("/orders/batch")
+async def place_orders(req: PlaceOrdersRequest, current_user: int = Depends(rate_limited("place_orders"))):
+
+    if not req.items or len(req.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(400, f"A batch must have 1 to {MAX_BATCH_ITEMS} items")
 
-    log_event(f"Order placed by user {current_user}")
-    return pb_to_dict(order)
+    try:
+        res = await db_client.create_orders(
+            current_user, [(item.product_id, item.quantity) for item in req.items]
+        )
+    except grpc.RpcError as e:
+        raise_for_deadline(e)
+        raise HTTPException(500, "Cannot create orders")
+
+    if not res.success:
+        raise HTTPException(400, {
+            "message": "No order was placed",
+            "lines": [{"line": r.line, "error": r.error} for r in res.lines],
+        })
+
+    await log_event(f"{len(res.lines)} orders placed by user {current_user}")
+    return JSONBytesResponse(dumps([order_to_dict(r.order) for r in res.lines]))
 
 @app.post("/orders/{order_id}/cancel")
-def cancel_order(order_id: int, current_user: int = Depends(get_current_user_id)):
+async def cancel_order(order_id: int, current_user: int = Depends(get_current_user_id)):
 
     try:
-        order = db_client.cancel_order(order_id)
-    except:
+        order = await db_client.cancel_order(order_id)
+    except grpc.RpcError as e:
+        raise_for_deadline(e)
+        if e.code() == grpc.StatusCode.NOT_FOUND:
+            raise HTTPException(404, "Order not found")
         raise HTTPException(500, "Cannot cancel order")
 
-    log_event(f"Order {order_id} canceled")
-    return pb_to_dict(order)
+    await log_event(f"Order {order_id} canceled")
+    return JSONBytesResponse(dumps(order_to_dict(order)))
 
 @app.get("/orders/{order_id}")
-def get_order(order_id: int, current_user: int = Depends(get_current_user_id)):
+async def get_order(order_id: int, current_user: int = Depends(get_current_user_id)):
     try:
-        order = db_client.get_order(order_id)
-    except:
+        order = await db_client.get_order(order_id)
+    except grpc.RpcError as e:
+        raise_for_deadline(e)
         raise HTTPException(404, "Order not found")
 
-    log_event(f"Fetched order {order_id}")
-    return pb_to_dict(order)
+    await log_event(f"Fetched order {order_id}")
+    return JSONBytesResponse(dumps(order_to_dict(order)))
@@ -0,0 +1,29 @@
+"""
+Unit tests of api_service; no db_service or logging_service is needed:
+
+    python -m pytest src/api_service/tests
+
+db_service has its own tests (src/db_service/tests): run the two suites
+separately, as both services have top-level `metrics` and `tracing` modules.
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# the modules import each other from the service root, and db_pb2 from protos_shared
+for path in (API_DIR, os.path.join(API_DIR, "..", "protos_shared")):
+    if path not in sys.path:
+        sys.path.append(path)
+
+
+@pytest.fixture(scope="session")
+def api_server():
+    """api_service's server.py, loaded by path: the repository root has a server.py too"""
+    spec = importlib.util.spec_from_file_location("api_server", os.path.join(API_DIR, "server.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,128 @@
+import grpc
+import pytest
+
+from grpc_clients import balancer
+from grpc_clients.balancer import Balancer, Endpoint, parse_addresses
+
+UNAVAILABLE = grpc.StatusCode.UNAVAILABLE
+
+
+class Clock:
+    """Stands in for the module's `time`, leaving the real one (and asyncio's) alone"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(balancer, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def endpoints():
+    # channels connect lazily, so nothing is listening on these
+    eps = [Endpoint(f"db{i}:50051", grpc.insecure_channel(f"localhost:{1 + i}")) for i in range(3)]
+    yield eps
+    for ep in eps:
+        ep.channel.close()
+
+
+def pick(b, n):
+    picked = []
+    for _ in range(n):
+        ep = b.acquire()
+        b.release(ep)
+        picked.append(ep.address)
+    return picked
+
+
+def fail(b, endpoint, times, code=UNAVAILABLE):
+    """`times` calls on endpoint that ended with code"""
+    for _ in range(times):
+        endpoint.outstanding += 1
+        b.release(endpoint, code)
+
+
+def test_parse_addresses():
+    assert parse_addresses(" db1:50051,db2:50052, db3 ,") == ["db1:50051", "db2:50052", "db3:50051"]
+
+
+def test_round_robin(clock, endpoints):
+    b = Balancer(endpoints)
+    assert pick(b, 6) == ["db0:50051", "db1:50051", "db2:50051"] * 2
+
+
+def test_least_outstanding_prefers_the_idle_endpoint(clock, endpoints):
+    b = Balancer(endpoints, policy="least_outstanding")
+    busy = [b.acquire(), b.acquire()]
+    assert b.acquire() is endpoints[2]
+    assert [ep.outstanding for ep in endpoints] == [1, 1, 1]
+    for ep in busy:
+        b.release(ep)
+
+
+def test_unavailable_endpoint_is_ejected_then_tried_again(clock, endpoints):
+    b = Balancer(endpoints, eject_after=3, eject_for=10)
+    fail(b, endpoints[0], 2)
+    assert b.stats()["endpoints"][0]["healthy"]
+
+    fail(b, endpoints[0], 1)
+    assert not b.stats()["endpoints"][0]["healthy"]
+    assert endpoints[0].ejections == 1
+    assert "db0:50051" not in pick(b, 6)
+
+    clock.now += 10
+    assert b.stats()["endpoints"][0]["healthy"]
+    # on probation until a call succeeds: one more failure ejects it again
+    fail(b, endpoints[0], 1)
+    assert "db0:50051" not in pick(b, 6)
+    assert endpoints[0].ejections == 2
+
+    clock.now += 10
+    assert "db0:50051" in pick(b, 3)
+    fail(b, endpoints[0], 1)
+    assert "db0:50051" in pick(b, 3)
+
+
+def test_success_resets_the_failure_count(clock, endpoints):
+    b = Balancer(endpoints, eject_after=3)
+    fail(b, endpoints[0], 2)
+    endpoints[0].outstanding += 1
+    b.release(endpoints[0])
+    fail(b, endpoints[0], 2)
+    assert endpoints[0].ejections == 0
+
+
+@pytest.mark.parametrize("code", [grpc.StatusCode.NOT_FOUND, grpc.StatusCode.DEADLINE_EXCEEDED,
+                                  grpc.StatusCode.CANCELLED])
+def test_other_failures_do_not_eject(clock, endpoints, code):
+    b = Balancer(endpoints, eject_after=1)
+    fail(b, endpoints[0], 5, code)
+    assert endpoints[0].ejections == 0
+    # a cancelled call is not even an error of the replica
+    assert endpoints[0].errors == (0 if code == grpc.StatusCode.CANCELLED else 5)
+
+
+def test_all_ejected_uses_the_one_due_back_first(clock, endpoints):
+    b = Balancer(endpoints, eject_after=1, eject_for=10)
+    for i in (1, 0, 2):
+        fail(b, endpoints[i], 1)
+        clock.now += 1
+    assert pick(b, 3) == ["db1:50051"] * 3
+    assert all(ep.outstanding == 0 for ep in endpoints)
+
+
+def test_rejects_bad_arguments(endpoints):
+    with pytest.raises(ValueError):
+        Balancer([])
+    with pytest.raises(ValueError):
+        Balancer(endpoints, policy="random")
@@ -0,0 +1,110 @@
+import pytest
+
+from grpc_clients import circuit_breaker
+from grpc_clients.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class Clock:
+    """Stands in for the module's `time`, leaving the real one (and asyncio's) alone"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker, "time", clock)
+    return clock
+
+
+def tripped(clock, **kwargs):
+    breaker = CircuitBreaker(failure_threshold=0.5, window=4, min_calls=4, cooldown=10, target="test",
+                             **kwargs)
+    for success in (True, False, True, False):
+        breaker.record(success)
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_opens_only_once_min_calls_are_known(clock):
+    breaker = CircuitBreaker(failure_threshold=0.5, window=4, min_calls=4, target="test")
+    for _ in range(3):
+        breaker.record(False)
+    assert breaker.state == CLOSED
+    breaker.record(False)
+    assert breaker.state == OPEN
+
+
+def test_stays_closed_below_the_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=0.5, window=4, min_calls=4, target="test")
+    for success in (True, True, True, False, True, True, True, False):
+        breaker.record(success)
+    assert breaker.state == CLOSED
+
+
+def test_open_circuit_refuses_calls_until_the_cooldown(clock):
+    breaker = tripped(clock)
+    assert not breaker.allow()
+    clock.now += 9.9
+    assert not breaker.allow()
+    assert breaker.short_circuited == 2
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success(clock):
+    breaker = tripped(clock)
+    clock.now += 10
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # the probe has not reported back yet
+    assert not breaker.allow()
+
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+    assert breaker.transitions == {"closed->open": 1, "open->half_open": 1, "half_open->closed": 1}
+
+
+def test_failed_probe_opens_for_another_cooldown(clock):
+    breaker = tripped(clock)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == OPEN
+    clock.now += 5
+    assert not breaker.allow()
+    clock.now += 5
+    assert breaker.allow()
+
+
+def test_probe_that_never_reports_back_is_replaced_after_a_cooldown(clock):
+    breaker = tripped(clock)
+    clock.now += 10
+    assert breaker.allow()
+    clock.now += 10
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+
+def test_rejecting_changes_nothing(clock):
+    breaker = tripped(clock)
+    assert breaker.rejecting()
+    clock.now += 10
+    assert not breaker.rejecting()
+    # a probe is still available: rejecting() did not take it, nor leave OPEN
+    assert breaker.state == OPEN
+    assert breaker.short_circuited == 0
+    assert breaker.allow()
+    assert breaker.rejecting()
+
+
+def test_outcomes_of_calls_let_through_before_opening_are_ignored(clock):
+    breaker = tripped(clock)
+    breaker.record(True)
+    assert breaker.state == OPEN
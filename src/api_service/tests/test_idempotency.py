@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import db_pb2
+from auth.jwt_utils import create_jwt
+from cache import idempotency
+from cache.idempotency import IdempotencyStore
+from ratelimit.token_bucket import MemoryBucketStore, TokenBucketLimiter
+
+
+class Clock:
+    """Stands in for the module's `time`, leaving the real one (and asyncio's) alone"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(idempotency, "time", clock)
+    return clock
+
+
+def test_completed_key_is_replayed(clock):
+    async def main():
+        store = IdempotencyStore()
+        calls = []
+
+        async def place():
+            calls.append(1)
+            return "order 1"
+
+        assert await store.run("k", place) == ("order 1", False)
+        assert await store.run("k", place) == ("order 1", True)
+        assert len(calls) == 1
+        assert store.stats()["hits"] == 1
+
+    asyncio.run(main())
+
+
+def test_concurrent_requests_with_one_key_place_one_order(clock):
+    async def main():
+        store = IdempotencyStore()
+        calls = []
+
+        async def place():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "order 1"
+
+        results = await asyncio.gather(*(store.run("k", place) for _ in range(3)))
+        assert results == [("order 1", False), ("order 1", True), ("order 1", True)]
+        assert len(calls) == 1
+
+    asyncio.run(main())
+
+
+def test_failure_is_not_kept(clock):
+    async def main():
+        store = IdempotencyStore()
+
+        async def fail():
+            raise RuntimeError("db down")
+
+        async def place():
+            return "order 1"
+
+        with pytest.raises(RuntimeError):
+            await store.run("k", fail)
+        assert await store.run("k", place) == ("order 1", False)
+
+    asyncio.run(main())
+
+
+def test_entries_expire_and_are_bounded(clock):
+    async def main():
+        store = IdempotencyStore(max_entries=2, ttl=60)
+
+        def result(value):
+            async def fn():
+                return value
+            return fn
+
+        await store.run("a", result(1))
+        clock.now += 61
+        assert await store.run("a", result(2)) == (2, False)
+
+        await store.run("b", result(3))
+        await store.run("c", result(4))
+        assert store.stats()["entries"] == 2
+        # "a" was the oldest
+        assert await store.run("a", result(5)) == (5, False)
+
+    asyncio.run(main())
+
+
+class FakeDBClient:
+
+    def __init__(self):
+        self.orders = []
+
+    async def create_order(self, user_id, product_id, quantity, idempotency_key=""):
+        order = db_pb2.Order(id=len(self.orders) + 1, user_id=user_id, product_id=product_id,
+                             quantity=quantity, total_price=9.99 * quantity)
+        self.orders.append(order)
+        return order
+
+
+@pytest.fixture
+def api(monkeypatch, api_server):
+    server = api_server
+
+    async def no_log(*args, **kwargs):
+        pass
+
+    db = FakeDBClient()
+    monkeypatch.setattr(server, "db_client", db)
+    monkeypatch.setattr(server, "log_event", no_log)
+    monkeypatch.setattr(server, "idempotency_store", IdempotencyStore())
+    # no rules: the tests place more orders than the default limits allow
+    monkeypatch.setattr(server, "rate_limiter", TokenBucketLimiter(MemoryBucketStore(), {}))
+    client = TestClient(server.app)
+    client.headers["Authorization"] = f"Bearer {create_jwt(7, server.JWT_SECRET)}"
+    return client, db
+
+
+def test_replayed_key_returns_the_first_order(api):
+    client, db = api
+    headers = {"Idempotency-Key": "k1"}
+    first = client.post("/orders", json={"product_id": 1, "quantity": 2}, headers=headers)
+    again = client.post("/orders", json={"product_id": 1, "quantity": 2}, headers=headers)
+    assert first.status_code == again.status_code == 200
+    assert again.json() == first.json()
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert len(db.orders) == 1
+
+
+@pytest.mark.parametrize("body", [{"product_id": 2, "quantity": 2}, {"product_id": 1, "quantity": 1}])
+def test_key_reused_for_a_different_order_is_422(api, body):
+    client, db = api
+    headers = {"Idempotency-Key": "k1"}
+    assert client.post("/orders", json={"product_id": 1, "quantity": 2}, headers=headers).status_code == 200
+    response = client.post("/orders", json=body, headers=headers)
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Idempotency-Key was already used for a different order"
+    assert len(db.orders) == 1
@@ -0,0 +1,68 @@
+import time
+
+import jwt
+
+from auth import jwt_utils
+from auth.jwt_utils import VerifiedTokenCache, create_jwt
+
+SECRET = "a-test-secret-of-at-least-32-bytes"
+
+
+def test_hit_after_the_first_verification():
+    cache = VerifiedTokenCache(SECRET)
+    token = create_jwt(7, SECRET)
+    assert cache.verify(token) == 7
+    assert cache.verify(token) == 7
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_invalid_tokens_are_refused_and_not_cached():
+    cache = VerifiedTokenCache(SECRET)
+    forged = create_jwt(7, "another-secret-of-at-least-32-bytes")
+    assert cache.verify(forged) is None
+    assert cache.verify(forged) is None
+    assert cache.verify("not a token") is None
+    assert cache.hits == 0
+    assert len(cache._entries) == 0
+
+
+def test_cached_token_expires_with_its_exp():
+    cache = VerifiedTokenCache(SECRET)
+    exp = int(time.time()) + 1
+    token = jwt.encode({"user_id": 7, "exp": exp}, SECRET, algorithm="HS256")
+    assert cache.verify(token) == 7
+    assert cache.verify(token) == 7
+
+    while time.time() < exp:
+        time.sleep(0.05)
+    # not served from the cache, and pyjwt refuses it too
+    assert cache.verify(token) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert len(cache._entries) == 0
+
+
+def test_expiry_is_checked_on_hits(monkeypatch):
+    cache = VerifiedTokenCache(SECRET)
+    token = create_jwt(7, SECRET, expire_seconds=60)
+    assert cache.verify(token) == 7
+
+    # the entry's exp has passed for the cache; pyjwt still accepts the token,
+    # so it is verified again rather than served
+    later = time.time() + 120
+    monkeypatch.setattr(jwt_utils, "time", type("Later", (), {"time": staticmethod(lambda: later)}))
+    assert cache.verify(token) == 7
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_least_recently_used_tokens_are_dropped():
+    cache = VerifiedTokenCache(SECRET, maxsize=2)
+    a, b, c = (create_jwt(i, SECRET) for i in (1, 2, 3))
+    cache.verify(a)
+    cache.verify(b)
+    cache.verify(a)
+    cache.verify(c)
+    assert len(cache._entries) == 2
+    cache.verify(a)
+    assert cache.hits == 2
+    cache.verify(b)
+    assert cache.misses == 4
@@ -0,0 +1,99 @@
+import contextvars
+
+import grpc
+import pytest
+
+from deadline.budget import set_budget
+from grpc_clients import retry
+from grpc_clients.retry import LatencyTracker, ReadPolicy, RetryBudget, backoff_delay
+
+
+class FakeRpcError(grpc.RpcError):
+
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+
+UNAVAILABLE = FakeRpcError(grpc.StatusCode.UNAVAILABLE)
+
+
+def in_request(budget, fn):
+    """fn() with the deadline of a request given `budget` seconds, leaving this context alone"""
+    def run():
+        set_budget(budget)
+        return fn()
+    return contextvars.copy_context().run(run)
+
+
+def test_budget_is_spent_and_refilled_by_deposits():
+    budget = RetryBudget(ratio=0.5, max_tokens=2)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    assert budget.rejected == 1
+
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def test_budget_never_holds_more_than_max_tokens():
+    budget = RetryBudget(ratio=1, max_tokens=2)
+    for _ in range(10):
+        budget.deposit()
+    assert [budget.withdraw() for _ in range(3)] == [True, True, False]
+
+
+def test_retry_pause_gives_up_once_the_budget_is_spent(monkeypatch):
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: high)
+    policy = ReadPolicy(max_retries=100)
+    policy.budget = RetryBudget(ratio=0.1, max_tokens=3)
+
+    pauses = [policy.retry_pause(0, UNAVAILABLE) for _ in range(4)]
+    assert pauses == [0.025, 0.025, 0.025, None]
+    assert policy.retries == 3
+    assert policy.stats()["budget_rejected"] == 1
+
+
+def test_retry_pause_only_for_unavailable_and_up_to_max_retries():
+    policy = ReadPolicy(max_retries=2)
+    assert policy.retry_pause(0, FakeRpcError(grpc.StatusCode.NOT_FOUND)) is None
+    assert policy.retry_pause(0, FakeRpcError(grpc.StatusCode.DEADLINE_EXCEEDED)) is None
+    assert policy.retry_pause(1, UNAVAILABLE) is not None
+    assert policy.retry_pause(2, UNAVAILABLE) is None
+
+
+def test_retry_pause_never_sleeps_past_the_deadline(monkeypatch):
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: high)
+    policy = ReadPolicy(max_retries=5)
+    assert in_request(0.01, lambda: policy.retry_pause(1, UNAVAILABLE)) is None
+    assert in_request(5, lambda: policy.retry_pause(1, UNAVAILABLE)) == 0.05
+    # giving up for lack of time spends no token
+    assert policy.retries == 1
+
+
+def test_backoff_is_capped():
+    assert all(0 <= backoff_delay(attempt, base=0.1, cap=0.3) <= 0.3 for attempt in range(10))
+
+
+def test_latency_tracker_p95():
+    tracker = LatencyTracker(window=100, min_samples=20, refresh_every=1)
+    for i in range(19):
+        tracker.record(i / 1000)
+    assert tracker.p95() is None
+    for i in range(19, 100):
+        tracker.record(i / 1000)
+    assert tracker.p95() == pytest.approx(0.094)
+
+
+def test_hedge_delay_needs_hedging_samples_and_time_left():
+    policy = ReadPolicy(hedge=True)
+    assert policy.hedge_delay("GetProduct") is None
+    for _ in range(20):
+        policy.latency["GetProduct"].record(0.2)
+    assert policy.hedge_delay("GetProduct") == 0.2
+    assert in_request(0.1, lambda: policy.hedge_delay("GetProduct")) is None
+    assert ReadPolicy(hedge=False).hedge_delay("GetProduct") is None
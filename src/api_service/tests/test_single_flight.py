@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from grpc_clients.single_flight import AsyncSingleFlight, SingleFlight
+
+
+def run_threads(n, target):
+    results = [None] * n
+
+    def call(i):
+        try:
+            results[i] = ("ok", target())
+        except Exception as e:
+            results[i] = ("error", e)
+
+    threads = [threading.Thread(target=call, args=(i,), daemon=True) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_calls_share_one_flight():
+    sf = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(2)
+        return object()
+
+    leader, leader_result = run_threads(1, lambda: sf.do("k", fetch))
+    assert started.wait(2)
+    followers, results = run_threads(4, lambda: sf.do("k", fetch))
+    # let the followers find the flight in progress
+    deadline = time.monotonic() + 2
+    while sf.collapsed < 4 and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+    release.set()
+    for thread in leader + followers:
+        thread.join(2)
+    assert len(calls) == 1
+    assert {id(r[1]) for r in leader_result + results} == {id(leader_result[0][1])}
+    assert sf.stats() == {"calls": 1, "collapsed": 4}
+
+
+def test_an_error_reaches_every_waiter_and_is_not_kept():
+    sf = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(2)
+        raise RuntimeError("db down")
+
+    leader, leader_result = run_threads(1, lambda: sf.do("k", fail))
+    assert started.wait(2)
+    followers, results = run_threads(3, lambda: sf.do("k", fail))
+    deadline = time.monotonic() + 2
+    while sf.collapsed < 3 and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+    release.set()
+    for thread in leader + followers:
+        thread.join(2)
+    assert all(kind == "error" and str(e) == "db down" for kind, e in leader_result + results)
+    # the next call starts over
+    assert sf.do("k", lambda: "fresh") == "fresh"
+
+
+def test_forget_starts_a_new_flight_for_later_callers():
+    sf = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def stale_read():
+        started.set()
+        release.wait(2)
+        return "before the write"
+
+    leader, leader_result = run_threads(1, lambda: sf.do("k", stale_read))
+    assert started.wait(2)
+
+    sf.forget("k")
+    assert sf.do("k", lambda: "after the write") == "after the write"
+
+    release.set()
+    leader[0].join(2)
+    assert leader_result == [("ok", "before the write")]
+    # the old leader finishing must not remove a newer flight's entry
+    assert sf.stats() == {"calls": 2, "collapsed": 0}
+
+
+def test_async_concurrent_calls_share_one_flight():
+    async def main():
+        sf = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return object()
+
+        results = await asyncio.gather(*(sf.do("k", fetch) for _ in range(5)))
+        assert len(calls) == 1
+        assert len({id(r) for r in results}) == 1
+        assert sf.stats() == {"calls": 1, "collapsed": 4}
+
+    asyncio.run(main())
+
+
+def test_async_error_reaches_every_waiter():
+    async def main():
+        sf = AsyncSingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("db down")
+
+        results = await asyncio.gather(*(sf.do("k", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert await sf.do("k", lambda: asyncio.sleep(0, "fresh")) == "fresh"
+
+    asyncio.run(main())
+
+
+def test_async_cancelled_waiter_does_not_cancel_the_others():
+    async def main():
+        sf = AsyncSingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "value"
+
+        first = asyncio.ensure_future(sf.do("k", fetch))
+        second = asyncio.ensure_future(sf.do("k", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "value"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(main())
+
+
+def test_async_forget_starts_a_new_flight_for_later_callers():
+    async def main():
+        sf = AsyncSingleFlight()
+        release = asyncio.Event()
+
+        async def stale_read():
+            await release.wait()
+            return "before the write"
+
+        async def fresh_read():
+            return "after the write"
+
+        old = asyncio.ensure_future(sf.do("k", stale_read))
+        await asyncio.sleep(0)
+        sf.forget("k")
+        assert await sf.do("k", fresh_read) == "after the write"
+        release.set()
+        assert await old == "before the write"
+
+    asyncio.run(main())
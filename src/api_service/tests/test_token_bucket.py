@@ -0,0 +1,104 @@
+import sqlite3
+
+import pytest
+
+from ratelimit import token_bucket
+from ratelimit.token_bucket import (
+    MemoryBucketStore, SQLiteBucketStore, StoreBusy, TokenBucketLimiter, parse_rules,
+)
+
+
+class Clock:
+    """Stands in for the module's `time`, leaving the real one (and asyncio's) alone"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(token_bucket, "time", clock)
+    return clock
+
+
+@pytest.mark.parametrize("store_class", ["memory", "sqlite"])
+def test_burst_then_refill_at_rate(clock, tmp_path, store_class):
+    store = MemoryBucketStore() if store_class == "memory" else SQLiteBucketStore(str(tmp_path / "b.db"))
+
+    assert [store.take("k", 2.0, 3.0)[0] for _ in range(3)] == [True] * 3
+    allowed, retry_after = store.take("k", 2.0, 3.0)
+    assert not allowed
+    assert retry_after == pytest.approx(0.5)
+
+    # half a second at 2/s is one token
+    clock.now += 0.5
+    assert store.take("k", 2.0, 3.0)[0]
+    assert not store.take("k", 2.0, 3.0)[0]
+
+    # never more than burst, however long the key was idle
+    clock.now += 3600
+    assert [store.take("k", 2.0, 3.0)[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_keys_have_their_own_buckets(clock):
+    store = MemoryBucketStore()
+    assert store.take("a", 1.0, 1.0)[0]
+    assert not store.take("a", 1.0, 1.0)[0]
+    assert store.take("b", 1.0, 1.0)[0]
+
+
+def test_memory_store_drops_least_recently_used_keys(clock):
+    store = MemoryBucketStore(max_keys=2)
+    store.take("a", 1.0, 1.0)
+    store.take("b", 1.0, 1.0)
+    store.take("a", 1.0, 1.0)
+    store.take("c", 1.0, 1.0)
+    # "a" was used after "b", so "b" was dropped and comes back as a full bucket
+    assert not store.take("a", 1.0, 1.0)[0]
+    assert store.take("b", 1.0, 1.0)[0]
+
+
+def test_limiter_counts_per_route_and_ignores_unlimited_routes(clock):
+    limiter = TokenBucketLimiter(MemoryBucketStore(), {"place_order": (1.0, 1.0)})
+    assert limiter.take("place_order", 7) == (True, 0.0)
+    assert not limiter.take("place_order", 7)[0]
+    assert limiter.take("list_products", 7) == (True, 0.0)
+    assert limiter.stats() == {"place_order": {"allowed": 1, "rejected": 1, "store_busy": 0}}
+
+
+def test_sqlite_store_busy_lets_the_call_through(tmp_path):
+    path = str(tmp_path / "b.db")
+    limiter = TokenBucketLimiter(SQLiteBucketStore(path, busy_timeout=0.01), {"place_order": (1.0, 1.0)})
+
+    # another replica holding the write lock
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        with pytest.raises(StoreBusy):
+            limiter.store.take("place_order:7", 1.0, 1.0)
+        assert limiter.take("place_order", 7) == (True, 0.0)
+    finally:
+        other.execute("ROLLBACK")
+    assert limiter.stats()["place_order"] == {"allowed": 0, "rejected": 0, "store_busy": 1}
+
+
+def test_parse_rules():
+    assert parse_rules(" place_order=2:10, place_orders=0.5:3 ,") == {
+        "place_order": (2.0, 10.0),
+        "place_orders": (0.5, 3.0),
+    }
+    assert parse_rules("") == {}
+
+
+@pytest.mark.parametrize("spec", ["place_order", "place_order=2", "place_order=a:1",
+                                  "place_order=0:5", "place_order=-1:5", "place_order=1:0.5"])
+def test_parse_rules_rejects(spec):
+    with pytest.raises(ValueError):
+        parse_rules(spec)
@@ -0,0 +1,41 @@
+from tracing.spans import span
+
+
+class TraceRequests:
+    """
+    ASGI middleware running every HTTP request in a root span (or a child of
+    the caller's `traceparent` header), named after the route function once
+    the router has matched one. Sampled requests answer with a `traceparent`
+    header, so a slow response can be looked up in the exported spans.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+
+        with span("http", traceparent) as s:
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    s.set("status", message["status"])
+                    if s.sampled:
+                        message["headers"] = [
+                            *message.get("headers", []),
+                            (b"traceparent", s.traceparent().encode("latin-1")),
+                        ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                route = getattr(scope.get("endpoint"), "__name__", "unmatched")
+                s.name = f"{scope['method']} {route}"
+                s.set("path", scope["path"])
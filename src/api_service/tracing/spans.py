@@ -0,0 +1,23 @@
+"""
+Spans of one request across api_service, db_service and logging_service; the
+span code itself is protos_shared/telemetry.py, shared by all three services.
+Each HTTP request starts a trace, or joins the caller's `traceparent` header
+(see middleware.py); DBClient and LogClient pass it on in gRPC metadata.
+"""
+import os
+import sys
+
+# telemetry.py lives in protos_shared: /app/protos_shared in the images,
+# src/protos_shared when run from the source tree. The metrics module takes
+# latency_buckets from here too, so the path is set up in one place
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "protos_shared")
+for path in ("/app/protos_shared", SHARED_DIR):
+    if os.path.isdir(path) and path not in sys.path:
+        sys.path.append(path)
+
+from telemetry import latency_buckets, set_service, span, start_span
+
+# what the rest of api_service takes from here
+__all__ = ["latency_buckets", "span", "start_span"]
+
+set_service("api_service")
@@ -0,0 +1,259 @@
+import asyncio
+import collections
+import os
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+import db_manager
+from metrics import POOL_IN_USE, POOL_TIMEOUTS, POOL_WAIT, statement_timer
+from pool import PoolTimeout
+from prepared import _numbered
+from storage import OutOfStock, UsernameTaken
+from tracing import span
+
+# DBManager's order statements with $n placeholders, taking the same arguments
+CLAIM_IDEMPOTENCY_KEY = _numbered(db_manager.CLAIM_IDEMPOTENCY_KEY)
+REPLAY_IDEMPOTENT_ORDER = _numbered(db_manager.REPLAY_IDEMPOTENT_ORDER)
+RESERVE_ORDER = _numbered(db_manager.RESERVE_ORDER)
+RESERVE_ORDER_FOR_KEY = _numbered(db_manager.RESERVE_ORDER_FOR_KEY)
+CANCEL_ORDER = _numbered(db_manager.CANCEL_ORDER)
+
+
+class AsyncDBManager:
+    """
+    DBManager for aio_server.py: the same methods and rows, as coroutines on
+    asyncpg. asyncpg keeps its own pool of DB_POOL_MIN..DB_POOL_MAX
+    connections, hands them out to waiters in order, closes connections idle
+    for DB_POOL_CHECK_AFTER seconds, and prepares every statement it runs
+    once per connection (its statement cache), like prepared.py does for
+    DBManager.
+
+    Deadlines are enforced around the whole handler (see
+    request_scope.AioDeadlineInterceptor): a call past its deadline is
+    cancelled, which cancels the query running for it.
+    """
+
+    def __init__(self):
+        self.pool = None
+        self.timeout = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+        # rows fetched per round-trip by the cursor behind stream_products
+        self.stream_fetch_size = int(os.getenv("PRODUCT_STREAM_FETCH_SIZE", "1000"))
+
+    async def open_pool(self):
+        self.pool = await asyncpg.create_pool(
+            min_size=int(os.getenv("DB_POOL_MIN", "1")),
+            max_size=int(os.getenv("DB_POOL_MAX", "20")),
+            max_inactive_connection_lifetime=float(os.getenv("DB_POOL_CHECK_AFTER", "30")),
+            user=os.getenv("POSTGRES_USER"),
+            password=os.getenv("POSTGRES_PASSWORD"),
+            host=os.getenv("POSTGRES_HOST", "postgres"),
+            database=os.getenv("POSTGRES_DB"),
+            port=os.getenv("POSTGRES_PORT", "5432"),
+        )
+
+    # --------------------
+    # Internal helpers
+    # --------------------
+    @asynccontextmanager
+    async def _conn(self):
+        """One connection from the pool, for the duration of the block"""
+        started = time.perf_counter()
+        with span("pool checkout"):
+            try:
+                conn = await self.pool.acquire(timeout=self.timeout)
+            except asyncio.TimeoutError:
+                POOL_TIMEOUTS.inc()
+                raise PoolTimeout(f"no connection free within {self.timeout:.3g}s")
+        POOL_WAIT.observe(time.perf_counter() - started)
+        POOL_IN_USE.inc()
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+            POOL_IN_USE.dec()
+
+    @staticmethod
+    async def _fetch(conn, statement, sql, *args):
+        with statement_timer(statement):
+            return await conn.fetch(sql, *args)
+
+    @staticmethod
+    async def _fetchrow(conn, statement, sql, *args):
+        with statement_timer(statement):
+            return await conn.fetchrow(sql, *args)
+
+    # --------------------
+    # Products CRUD
+    # --------------------
+    async def list_products(self):
+        async with self._conn() as conn:
+            return await self._fetch(conn, "list_products", """
+                SELECT id, name, category, price, stock, version
+                FROM products;
+            """)
+
+    async def get_product(self, pid):
+        async with self._conn() as conn:
+            return await self._fetchrow(conn, "get_product", """
+                SELECT id, name, category, price, stock, version
+                FROM products
+                WHERE id = $1;
+            """, pid)
+
+    async def stream_products(self, after_id=0, limit=None):
+        """Async generator; holds a pooled connection until exhausted or closed"""
+        async with self._conn() as conn, conn.transaction(readonly=True):
+            async for row in conn.cursor("""
+                SELECT id, name, category, price, stock, version
+                FROM products
+                WHERE id > $1
+                ORDER BY id
+                LIMIT $2;
+            """, after_id, limit, prefetch=self.stream_fetch_size):
+                yield row
+
+    # --------------------
+    # Users CRUD
+    # --------------------
+    async def create_user(self, username, password_hash):
+        async with self._conn() as conn:
+            try:
+                return await self._fetchrow(conn, "create_user", """
+                    INSERT INTO users (username, password_hash)
+                    VALUES ($1, $2)
+                    RETURNING id, username, active, password_hash;
+                """, username, password_hash)
+            except asyncpg.UniqueViolationError:
+                raise UsernameTaken(username) from None
+
+    async def get_user(self, uid):
+        async with self._conn() as conn:
+            return await self._fetchrow(conn, "get_user", """
+                SELECT id, username, active, password_hash
+                FROM users
+                WHERE id = $1;
+            """, uid)
+
+    async def get_user_by_username(self, username):
+        async with self._conn() as conn:
+            return await self._fetchrow(conn, "get_user_by_username", """
+                SELECT id, username, active, password_hash
+                FROM users
+                WHERE username = $1;
+            """, username)
+
+    async def update_user(self, uid, username, active):
+        async with self._conn() as conn:
+            try:
+                return await self._fetchrow(conn, "update_user", """
+                    UPDATE users
+                    SET username = $1, active = $2
+                    WHERE id = $3
+                    RETURNING id, username, active, password_hash;
+                """, username, active, uid)
+            except asyncpg.UniqueViolationError:
+                raise UsernameTaken(username) from None
+
+    # --------------------
+    # Orders CRUD
+    # --------------------
+    async def create_order(self, user_id, product_id, quantity, idempotency_key=None):
+        async with self._conn() as conn:
+            tr = conn.transaction()
+            await tr.start()
+            try:
+                if idempotency_key:
+                    # claim or lock the key, see DBManager.create_order
+                    claimed = await self._fetchrow(conn, "claim_idempotency_key", CLAIM_IDEMPOTENCY_KEY,
+                                                   user_id, idempotency_key)
+                    if claimed[0] is not None:
+                        row = await self._fetchrow(conn, "replay_idempotent_order",
+                                                   REPLAY_IDEMPOTENT_ORDER, claimed[0])
+                        await tr.rollback()
+                        return row
+
+                # take the stock, insert the order and link the key in one
+                # statement, as DBManager does
+                args = (quantity, product_id, quantity, user_id, quantity, quantity)
+                if idempotency_key:
+                    row = await self._fetchrow(conn, "reserve_order_for_key", RESERVE_ORDER_FOR_KEY,
+                                               *args, user_id, idempotency_key)
+                else:
+                    row = await self._fetchrow(conn, "reserve_order", RESERVE_ORDER, *args)
+                if row is None:
+                    # unknown product or sold out: release the key too
+                    found = await self._fetchrow(conn, "get_stock", """
+                        SELECT stock FROM products WHERE id = $1;
+                    """, product_id)
+                    if found is not None:
+                        # rolled back below
+                        raise OutOfStock()
+                    await tr.rollback()
+                    return None
+
+                await tr.commit()
+                return row
+            except BaseException:
+                await tr.rollback()
+                raise
+
+    async def create_orders(self, orders):
+        """Same contract as DBManager.create_orders"""
+        async with self._conn() as conn, conn.transaction():
+            known = {r[0] for r in await self._fetch(conn, "check_products", """
+                SELECT id FROM products WHERE id = ANY($1::int[]);
+            """, list({o[1] for o in orders}))}
+            missing = [i for i, o in enumerate(orders) if o[1] not in known]
+            if missing:
+                return None, missing
+
+            # the stock of every product at once, in product id order
+            needed = collections.Counter()
+            for _, product_id, quantity in orders:
+                needed[product_id] += quantity
+            product_ids = sorted(needed)
+            reserved = {r[0] for r in await self._fetch(conn, "reserve_stock", """
+                UPDATE products p
+                SET stock = p.stock - v.quantity
+                FROM unnest($1::int[], $2::int[]) AS v(product_id, quantity)
+                WHERE p.id = v.product_id AND p.stock >= v.quantity
+                RETURNING p.id;
+            """, product_ids, [needed[pid] for pid in product_ids])}
+            if len(reserved) < len(product_ids):
+                # raising out of the transaction block rolls it back
+                raise OutOfStock(i for i, o in enumerate(orders) if o[1] not in reserved)
+
+            # one INSERT over the unnested columns; ids are drawn in ORDER BY line
+            # order, so sorting the returned rows by id lines them up with the input
+            rows = await self._fetch(conn, "insert_orders", """
+                INSERT INTO orders (user_id, product_id, quantity, total_price)
+                SELECT v.user_id, v.product_id, v.quantity, p.price * v.quantity
+                FROM unnest($1::int[], $2::int[], $3::int[])
+                     WITH ORDINALITY AS v(user_id, product_id, quantity, line)
+                JOIN products p ON p.id = v.product_id
+                ORDER BY v.line
+                RETURNING id, user_id, product_id, quantity, total_price, canceled;
+            """, *(list(column) for column in zip(*orders)))
+            return sorted(rows, key=lambda r: r[0]), []
+
+    async def get_order(self, order_id):
+        async with self._conn() as conn:
+            return await self._fetchrow(conn, "get_order", """
+                SELECT id, user_id, product_id, quantity, total_price, canceled
+                FROM orders
+                WHERE id = $1;
+            """, order_id)
+
+    async def cancel_order(self, order_id):
+        async with self._conn() as conn:
+            # restocks on the first cancel only, see DBManager.cancel_order
+            return await self._fetchrow(conn, "cancel_order", CANCEL_ORDER, order_id, order_id)
+
+    # --------------------
+    # Clean up
+    # --------------------
+    async def close_pool(self):
+        """Close all opened connections"""
+        await self.pool.close()
@@ -0,0 +1,154 @@
+"""
+db_service on grpc.aio and asyncpg (DB_SERVER_MODE=aio, see server.py).
+
+The same services and answers as server.py, but every RPC is a coroutine on
+one event loop, so the number of RPCs in flight is bounded by the asyncpg
+pool (DB_POOL_MAX) instead of by DB_GRPC_WORKERS threads. Serves Postgres
+only; DB_STORAGE is ignored.
+"""
+import asyncio
+import os
+
+import grpc
+
+import db_pb2_grpc
+
+from aio_manager import AsyncDBManager
+from messages import (
+    EMPTY_BATCH, MAX_QUANTITY, QUANTITY_TOO_LARGE, batch_items, batch_missing, batch_out_of_stock,
+    batch_placed, batch_quantity_errors, order_pb, product_list_pb, product_pb, user_pb,
+)
+from metrics import AioMetricsInterceptor, start_metrics_server
+from request_scope import AioDeadlineInterceptor
+from storage import OutOfStock, UsernameTaken
+from tracing import AioTraceInterceptor
+
+db = AsyncDBManager()
+
+
+# -------------------------
+# Implement Product Service
+# -------------------------
+
+class ProductService(db_pb2_grpc.ProductServiceServicer):
+    async def ListProducts(self, request, context):
+        return product_list_pb(await db.list_products())
+
+    async def GetProduct(self, request, context):
+        r = await db.get_product(request.id)
+        if r is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, "Product not found")
+        return product_pb(r)
+
+    async def StreamProducts(self, request, context):
+        async for r in db.stream_products(request.after_id, request.limit or None):
+            yield product_pb(r)
+
+
+# -------------------------
+# Implement User Service
+# -------------------------
+
+class UserService(db_pb2_grpc.UserServiceServicer):
+    async def CreateUser(self, request, context):
+        try:
+            r = await db.create_user(request.username, request.password_hash)
+        except UsernameTaken:
+            await context.abort(grpc.StatusCode.ALREADY_EXISTS, "Username is taken")
+        return user_pb(r)
+
+    async def GetUser(self, request, context):
+        r = await db.get_user(request.id)
+        if r is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, "User not found")
+        return user_pb(r)
+
+    async def GetUserByUsername(self, request, context):
+        r = await db.get_user_by_username(request.username)
+        if r is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, "User not found")
+        return user_pb(r)
+
+    async def UpdateUser(self, request, context):
+        try:
+            r = await db.update_user(request.id, request.username, request.active)
+        except UsernameTaken:
+            await context.abort(grpc.StatusCode.ALREADY_EXISTS, "Username is taken")
+        return user_pb(r)
+
+
+# -------------------------
+# Implement Order Service
+# -------------------------
+
+class OrderService(db_pb2_grpc.OrderServiceServicer):
+    async def CreateOrder(self, request, context):
+        if request.quantity > MAX_QUANTITY:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, QUANTITY_TOO_LARGE)
+
+        try:
+            r = await db.create_order(
+                request.user_id, request.product_id, request.quantity, request.idempotency_key or None
+            )
+        except OutOfStock:
+            await context.abort(grpc.StatusCode.FAILED_PRECONDITION, "Out of stock")
+        if r is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, "Product not found")
+        return order_pb(r)
+
+    async def CreateOrders(self, request, context):
+        if not request.orders:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, EMPTY_BATCH)
+        rejected = batch_quantity_errors(request.orders)
+        if rejected is not None:
+            return rejected
+
+        try:
+            rows, missing = await db.create_orders(batch_items(request.orders))
+        except OutOfStock as e:
+            return batch_out_of_stock(e)
+        if missing:
+            return batch_missing(missing)
+        return batch_placed(rows)
+
+    async def GetOrder(self, request, context):
+        r = await db.get_order(request.id)
+        if r is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, "Order not found")
+        return order_pb(r)
+
+    async def CancelOrder(self, request, context):
+        r = await db.cancel_order(request.id)
+        if r is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, "Order not found")
+        return order_pb(r)
+
+
+# -------------------------
+# Start gRPC Server
+# -------------------------
+
+async def serve():
+    await db.open_pool()
+    server = grpc.aio.server(
+        interceptors=[AioMetricsInterceptor(), AioTraceInterceptor(), AioDeadlineInterceptor()],
+    )
+
+    db_pb2_grpc.add_ProductServiceServicer_to_server(ProductService(), server)
+    db_pb2_grpc.add_UserServiceServicer_to_server(UserService(), server)
+    db_pb2_grpc.add_OrderServiceServicer_to_server(OrderService(), server)
+
+    port = os.getenv("DB_GRPC_PORT", "50051")
+    server.add_insecure_port(f"[::]:{port}")
+    print(f"DB Service (aio) is running on port {port}...")
+
+    start_metrics_server()
+    await server.start()
+    try:
+        await server.wait_for_termination()
+    finally:
+        await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
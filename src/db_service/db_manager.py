@@ -1,33 +1,152 @@
+import collections
 import os
-import psycopg2
-from psycopg2.pool import SimpleConnectionPool
+from psycopg2.errors import UniqueViolation
+from psycopg2.extensions import QueryCanceledError
+from psycopg2.extras import execute_values
 
+from metrics import execute, statement_timer
+from pool import ConnectionPool, PoolTimeout
+from prepared import PreparingConnection, execute_prepared
+from request_scope import current_scope
+from storage import OutOfStock, Storage, UsernameTaken
+from tracing import span
 
-class DBManager:
+# The order statements AsyncDBManager runs too, numbered for asyncpg there:
+# keep their placeholders in the order of the arguments DBManager passes.
 
-    def __init__(self):
-        # Create the connection pool using environment variables
-        self.pool = SimpleConnectionPool(
-            minconn=1,
-            maxconn=10,
+# returns the order_id the key is linked to, None for a new key
+CLAIM_IDEMPOTENCY_KEY = """
+    INSERT INTO idempotency_keys (user_id, idem_key)
+    VALUES (%s, %s)
+    ON CONFLICT (user_id, idem_key)
+    DO UPDATE SET order_id = idempotency_keys.order_id
+    RETURNING order_id;
+"""
+
+REPLAY_IDEMPOTENT_ORDER = """
+    SELECT id, user_id, product_id, quantity, total_price, canceled
+    FROM orders
+    WHERE id = %s;
+"""
+
+# CreateOrder: take the stock and insert the order only if there was enough
+RESERVE_ORDER = """
+    WITH reserved AS (
+        UPDATE products
+        SET stock = stock - %s
+        WHERE id = %s AND stock >= %s
+        RETURNING id, price
+    )
+    INSERT INTO orders (user_id, product_id, quantity, total_price)
+    SELECT %s, id, %s, price * %s
+    FROM reserved
+    RETURNING id, user_id, product_id, quantity, total_price, canceled;
+"""
+
+# the same, also linking the order to the Idempotency-Key claimed before it
+RESERVE_ORDER_FOR_KEY = """
+    WITH reserved AS (
+        UPDATE products
+        SET stock = stock - %s
+        WHERE id = %s AND stock >= %s
+        RETURNING id, price
+    ), ordered AS (
+        INSERT INTO orders (user_id, product_id, quantity, total_price)
+        SELECT %s, id, %s, price * %s
+        FROM reserved
+        RETURNING id, user_id, product_id, quantity, total_price, canceled
+    ), linked AS (
+        UPDATE idempotency_keys
+        SET order_id = (SELECT id FROM ordered)
+        WHERE user_id = %s AND idem_key = %s
+    )
+    SELECT * FROM ordered;
+"""
+
+# only the cancel that flips the flag puts the quantity back; for an order
+# canceled before, the last SELECT returns it as is
+CANCEL_ORDER = """
+    WITH canceled AS (
+        UPDATE orders
+        SET canceled = TRUE
+        WHERE id = %s AND NOT canceled
+        RETURNING id, user_id, product_id, quantity, total_price, canceled
+    ), restocked AS (
+        UPDATE products p
+        SET stock = p.stock + c.quantity
+        FROM canceled c
+        WHERE p.id = c.product_id
+    )
+    SELECT * FROM canceled
+    UNION ALL
+    SELECT id, user_id, product_id, quantity, total_price, TRUE
+    FROM orders
+    WHERE id = %s AND NOT EXISTS (SELECT 1 FROM canceled);
+"""
+
+
+class DBManager(Storage):
+
+    def __init__(self, maxconn=10):
+        # Create the connection pool using environment variables; maxconn is
+        # the number of gRPC worker threads, so every worker can hold one.
+        # DB_POOL_*: see pool.py
+        self.pool = ConnectionPool(
+            minconn=min(int(os.getenv("DB_POOL_MIN", "1")), maxconn),
+            maxconn=maxconn,
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+            check_after=float(os.getenv("DB_POOL_CHECK_AFTER", "30")),
+            max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+            # hot statements are prepared once per connection, see prepared.py
+            connection_factory=PreparingConnection,
             user=os.getenv("POSTGRES_USER"),
             password=os.getenv("POSTGRES_PASSWORD"),
             host=os.getenv("POSTGRES_HOST", "postgres"),
             database=os.getenv("POSTGRES_DB"),
             port=os.getenv("POSTGRES_PORT", "5432")
         )
-        if not self.pool:
-            raise Exception("Connection pool creation failed!")
+
+        # connection -> RequestScope of the RPC that checked it out
+        self._scopes = {}
+
+        # rows fetched per round-trip by the server-side cursor behind stream_products
+        self.stream_fetch_size = int(os.getenv("PRODUCT_STREAM_FETCH_SIZE", "1000"))
 
     # --------------------
     # Internal helpers
     # --------------------
     def _get_conn(self):
-        """Get one connection from pool"""
-        return self.pool.getconn()
+        """Get one connection from pool, waiting no longer than the calling RPC's deadline"""
+        scope = current_scope.get()
+        timeout = self.pool.timeout
+        if scope is not None:
+            timeout = min(timeout, max(0.0, scope.context.time_remaining()))
+        with span("pool checkout"):
+            try:
+                conn = self.pool.getconn(timeout)
+            except PoolTimeout:
+                if timeout < self.pool.timeout:
+                    raise QueryCanceledError("deadline passed waiting for a connection")
+                raise
+        if scope is None:
+            return conn
+        try:
+            scope.attach(conn)
+            self._scopes[conn] = scope
+            with conn.cursor() as cur:
+                # LOCAL: ends with the transaction, the next checkout sets its own
+                execute(cur, "set_statement_timeout",
+                        "SET LOCAL statement_timeout = %s;", (scope.statement_timeout_ms(),))
+        except Exception:
+            self._put_conn(conn)
+            raise
+        return conn
 
     def _put_conn(self, conn):
-        """Return the connection to pool"""
+        """Return the connection to pool; it rolls back what was left open"""
+        scope = self._scopes.pop(conn, None)
+        if scope is not None:
+            scope.detach(conn)
         self.pool.putconn(conn)
 
     # --------------------
@@ -37,8 +156,8 @@ class DBManager:
         conn = self._get_conn()
         try:
             with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT id, name, category, price, stock
+                execute_prepared(cur, "list_products", """
+                    SELECT id, name, category, price, stock, version
                     FROM products;
                 """)
                 return cur.fetchall()
@@ -49,8 +168,8 @@ class DBManager:
         conn = self._get_conn()
         try:
             with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT id, name, category, price, stock
+                execute_prepared(cur, "get_product", """
+                    SELECT id, name, category, price, stock, version
                     FROM products
                     WHERE id = %s;
                 """, (pid,))
@@ -58,6 +177,30 @@ class DBManager:
         finally:
             self._put_conn(conn)
 
+    def stream_products(self, after_id=0, limit=None):
+        """
+        Generator over products with id > after_id in id order (limit None = all).
+        Reads through a named (server-side) cursor, so only stream_fetch_size rows
+        are in memory at a time. Holds a pooled connection until exhausted or closed.
+        """
+        conn = self._get_conn()
+        try:
+            with conn.cursor(name="stream_products") as cur:
+                cur.itersize = self.stream_fetch_size
+                execute(cur, "stream_products", """
+                    SELECT id, name, category, price, stock, version
+                    FROM products
+                    WHERE id > %s
+                    ORDER BY id
+                    LIMIT %s;
+                """, (after_id, limit))
+                for row in cur:
+                    yield row
+        finally:
+            # the cursor lives in a read-only transaction, end it before reuse
+            conn.rollback()
+            self._put_conn(conn)
+
     # --------------------
     # Users CRUD
     # --------------------
@@ -65,14 +208,17 @@ class DBManager:
         conn = self._get_conn()
         try:
             with conn.cursor() as cur:
-                cur.execute("""
+                execute_prepared(cur, "create_user", """
                     INSERT INTO users (username, password_hash)
                     VALUES (%s, %s)
-                    RETURNING id, username, active;
+                    RETURNING id, username, active, password_hash;
                 """, (username, password_hash))
                 row = cur.fetchone()
                 conn.commit()
                 return row
+        except UniqueViolation:
+            conn.rollback()
+            raise UsernameTaken(username) from None
         finally:
             self._put_conn(conn)
 
@@ -80,8 +226,8 @@ class DBManager:
         conn = self._get_conn()
         try:
             with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT id, username, active
+                execute_prepared(cur, "get_user", """
+                    SELECT id, username, active, password_hash
                     FROM users
                     WHERE id = %s;
                 """, (uid,))
@@ -89,39 +235,141 @@ class DBManager:
         finally:
             self._put_conn(conn)
 
+    def get_user_by_username(self, username):
+        conn = self._get_conn()
+        try:
+            with conn.cursor() as cur:
+                execute_prepared(cur, "get_user_by_username", """
+                    SELECT id, username, active, password_hash
+                    FROM users
+                    WHERE username = %s;
+                """, (username,))
+                return cur.fetchone()
+        finally:
+            self._put_conn(conn)
+
     def update_user(self, uid, username, active):
         conn = self._get_conn()
         try:
             with conn.cursor() as cur:
-                cur.execute("""
+                execute_prepared(cur, "update_user", """
                     UPDATE users
                     SET username = %s, active = %s
                     WHERE id = %s
-                    RETURNING id, username, active;
+                    RETURNING id, username, active, password_hash;
                 """, (username, active, uid))
                 row = cur.fetchone()
                 conn.commit()
                 return row
+        except UniqueViolation:
+            conn.rollback()
+            raise UsernameTaken(username) from None
         finally:
             self._put_conn(conn)
 
     # --------------------
     # Orders CRUD
     # --------------------
-    def create_order(self, user_id, product_id, quantity):
+    def create_order(self, user_id, product_id, quantity, idempotency_key=None):
         conn = self._get_conn()
         try:
             with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO orders (user_id, product_id, quantity, total_price)
-                    SELECT %s, %s, %s, price * %s
-                    FROM products
-                    WHERE id = %s
-                    RETURNING id, user_id, product_id, quantity, total_price, canceled;
-                """, (user_id, product_id, quantity, quantity, product_id))
+                if idempotency_key:
+                    # claim the key, or lock it if it exists; a concurrent claim of
+                    # the same key blocks here until the first transaction ends, then
+                    # gets the order that transaction linked to it
+                    execute_prepared(cur, "claim_idempotency_key", CLAIM_IDEMPOTENCY_KEY,
+                                     (user_id, idempotency_key))
+                    order_id = cur.fetchone()[0]
+                    if order_id is not None:
+                        execute_prepared(cur, "replay_idempotent_order", REPLAY_IDEMPOTENT_ORDER,
+                                         (order_id,))
+                        row = cur.fetchone()
+                        conn.rollback()
+                        return row
+                    # a new key, or one without an order: place it now
+
+                # take the stock, insert the order and link the key in one
+                # statement: the product row stays locked only until the commit
+                args = (quantity, product_id, quantity, user_id, quantity, quantity)
+                if idempotency_key:
+                    execute_prepared(cur, "reserve_order_for_key", RESERVE_ORDER_FOR_KEY,
+                                     args + (user_id, idempotency_key))
+                else:
+                    execute_prepared(cur, "reserve_order", RESERVE_ORDER, args)
                 row = cur.fetchone()
+                if row is None:
+                    # unknown product or sold out: release the key too
+                    execute_prepared(cur, "get_stock", """
+                        SELECT stock FROM products WHERE id = %s;
+                    """, (product_id,))
+                    found = cur.fetchone()
+                    conn.rollback()
+                    if found is None:
+                        return None
+                    raise OutOfStock()
+
                 conn.commit()
                 return row
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._put_conn(conn)
+
+    def create_orders(self, orders):
+        """
+        orders: list of (user_id, product_id, quantity).
+        All-or-nothing in one transaction. Returns (rows, missing): the inserted
+        rows in input order and [], or None and the indexes of the orders whose
+        product does not exist (nothing is inserted then). Raises OutOfStock
+        with the indexes of the orders whose product has too little.
+        """
+        conn = self._get_conn()
+        try:
+            with conn.cursor() as cur:
+                execute_prepared(cur, "check_products", """
+                    SELECT id FROM products WHERE id = ANY(%s);
+                """, (list({o[1] for o in orders}),))
+                known = {r[0] for r in cur.fetchall()}
+                missing = [i for i, o in enumerate(orders) if o[1] not in known]
+                if missing:
+                    conn.rollback()
+                    return None, missing
+
+                # the stock of every product at once, in product id order
+                needed = collections.Counter()
+                for _, product_id, quantity in orders:
+                    needed[product_id] += quantity
+                product_ids = sorted(needed)
+                execute_prepared(cur, "reserve_stock", """
+                    UPDATE products p
+                    SET stock = p.stock - v.quantity
+                    FROM unnest(%s::int[], %s::int[]) AS v(product_id, quantity)
+                    WHERE p.id = v.product_id AND p.stock >= v.quantity
+                    RETURNING p.id;
+                """, (product_ids, [needed[pid] for pid in product_ids]))
+                reserved = {r[0] for r in cur.fetchall()}
+                if len(reserved) < len(product_ids):
+                    conn.rollback()
+                    raise OutOfStock(i for i, o in enumerate(orders) if o[1] not in reserved)
+
+                # one multi-row INSERT; ids are drawn in ORDER BY line order,
+                # so sorting the returned rows by id lines them up with the input
+                with statement_timer("insert_orders"):
+                    rows = execute_values(cur, """
+                        INSERT INTO orders (user_id, product_id, quantity, total_price)
+                        SELECT v.user_id, v.product_id, v.quantity, p.price * v.quantity
+                        FROM (VALUES %s) AS v(line, user_id, product_id, quantity)
+                        JOIN products p ON p.id = v.product_id
+                        ORDER BY v.line
+                        RETURNING id, user_id, product_id, quantity, total_price, canceled;
+                    """, [(i, *o) for i, o in enumerate(orders)], page_size=len(orders), fetch=True)
+                conn.commit()
+                return sorted(rows, key=lambda r: r[0]), []
+        except Exception:
+            conn.rollback()
+            raise
         finally:
             self._put_conn(conn)
 
@@ -129,7 +377,7 @@ class DBManager:
         conn = self._get_conn()
         try:
             with conn.cursor() as cur:
-                cur.execute("""
+                execute_prepared(cur, "get_order", """
                     SELECT id, user_id, product_id, quantity, total_price, canceled
                     FROM orders
                     WHERE id = %s;
@@ -142,12 +390,7 @@ class DBManager:
         conn = self._get_conn()
         try:
             with conn.cursor() as cur:
-                cur.execute("""
-                    UPDATE orders
-                    SET canceled = TRUE
-                    WHERE id = %s
-                    RETURNING id, user_id, product_id, quantity, total_price, canceled;
-                """, (order_id,))
+                execute_prepared(cur, "cancel_order", CANCEL_ORDER, (order_id, order_id))
                 row = cur.fetchone()
                 conn.commit()
                 return row
@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x08\x64\x62.proto\x12\x02\x64\x62\"\x07\n\x05\x45mpty\"\x12\n\x04\x42yId\x12\n\n\x02id\x18\x01 \x01(\x05\"S\n\x07Product\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x10\n\x08\x63\x61tegory\x18\x03 \x01(\t\x12\r\n\x05price\x18\x04 \x01(\x01\x12\r\n\x05stock\x18\x05 \x01(\x05\",\n\x0bProductList\x12\x1d\n\x08products\x18\x01 \x03(\x0b\x32\x0b.db.Product\"K\n\x04User\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x10\n\x08username\x18\x02 \x01(\t\x12\x0e\n\x06\x61\x63tive\x18\x03 \x01(\x08\x12\x15\n\rpassword_hash\x18\x04 \x01(\t\":\n\x0fRegisterRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x15\n\rpassword_hash\x18\x02 \x01(\t\"A\n\x11UpdateUserRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x10\n\x08username\x18\x02 \x01(\t\x12\x0e\n\x06\x61\x63tive\x18\x03 \x01(\x08\"q\n\x05Order\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0f\n\x07user_id\x18\x02 \x01(\x05\x12\x12\n\nproduct_id\x18\x03 \x01(\x05\x12\x10\n\x08quantity\x18\x04 \x01(\x05\x12\x13\n\x0btotal_price\x18\x05 \x01(\x01\x12\x10\n\x08\x63\x61nceled\x18\x06 \x01(\x08\"A\n\x08NewOrder\x12\x0f\n\x07user_id\x18\x01 \x01(\x05\x12\x12\n\nproduct_id\x18\x02 \x01(\x05\x12\x10\n\x08quantity\x18\x03 \x01(\x05\x32\x61\n\x0eProductService\x12*\n\x0cListProducts\x12\t.db.Empty\x1a\x0f.db.ProductList\x12#\n\nGetProduct\x12\x08.db.ById\x1a\x0b.db.Product2\x88\x01\n\x0bUserService\x12+\n\nCreateUser\x12\x13.db.RegisterRequest\x1a\x08.db.User\x12\x1d\n\x07GetUser\x12\x08.db.ById\x1a\x08.db.User\x12-\n\nUpdateUser\x12\x15.db.UpdateUserRequest\x1a\x08.db.User2{\n\x0cOrderService\x12&\n\x0b\x43reateOrder\x12\x0c.db.NewOrder\x1a\t.db.Order\x12\x1f\n\x08GetOrder\x12\x08.db.ById\x1a\t.db.Order\x12\"\n\x0b\x43\x61ncelOrder\x12\x08.db.ById\x1a\t.db.Orderb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x08\x64\x62.proto\x12\x02\x64\x62\"\x07\n\x05\x45mpty\"\x12\n\x04\x42yId\x12\n\n\x02id\x18\x01 \x01(\x05\"\x1e\n\nByUsername\x12\x10\n\x08username\x18\x01 \x01(\t\"d\n\x07Product\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x10\n\x08\x63\x61tegory\x18\x03 \x01(\t\x12\r\n\x05price\x18\x04 \x01(\x01\x12\r\n\x05stock\x18\x05 \x01(\x05\x12\x0f\n\x07version\x18\x06 \x01(\x03\"/\n\x0cProductQuery\x12\x10\n\x08\x61\x66ter_id\x18\x01 \x01(\x05\x12\r\n\x05limit\x18\x02 \x01(\x05\"=\n\x0bProductList\x12\x1d\n\x08products\x18\x01 \x03(\x0b\x32\x0b.db.Product\x12\x0f\n\x07version\x18\x02 \x01(\t\"K\n\x04User\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x10\n\x08username\x18\x02 \x01(\t\x12\x0e\n\x06\x61\x63tive\x18\x03 \x01(\x08\x12\x15\n\rpassword_hash\x18\x04 \x01(\t\":\n\x0fRegisterRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x15\n\rpassword_hash\x18\x02 \x01(\t\"A\n\x11UpdateUserRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x10\n\x08username\x18\x02 \x01(\t\x12\x0e\n\x06\x61\x63tive\x18\x03 \x01(\x08\"q\n\x05Order\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0f\n\x07user_id\x18\x02 \x01(\x05\x12\x12\n\nproduct_id\x18\x03 \x01(\x05\x12\x10\n\x08quantity\x18\x04 \x01(\x05\x12\x13\n\x0btotal_price\x18\x05 \x01(\x01\x12\x10\n\x08\x63\x61nceled\x18\x06 \x01(\x08\"Z\n\x08NewOrder\x12\x0f\n\x07user_id\x18\x01 \x01(\x05\x12\x12\n\nproduct_id\x18\x02 \x01(\x05\x12\x10\n\x08quantity\x18\x03 \x01(\x05\x12\x17\n\x0fidempotency_key\x18\x04 \x01(\t\"-\n\rNewOrderBatch\x12\x1c\n\x06orders\x18\x01 \x03(\x0b\x32\x0c.db.NewOrder\"H\n\x0fOrderLineResult\x12\x0c\n\x04line\x18\x01 \x01(\x05\x12\x18\n\x05order\x18\x02 \x01(\x0b\x32\t.db.Order\x12\r\n\x05\x65rror\x18\x03 \x01(\t\"G\n\x10OrderBatchResult\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\"\n\x05lines\x18\x02 \x03(\x0b\x32\x13.db.OrderLineResult2\x94\x01\n\x0eProductService\x12*\n\x0cListProducts\x12\t.db.Empty\x1a\x0f.db.ProductList\x12#\n\nGetProduct\x12\x08.db.ById\x1a\x0b.db.Product\x12\x31\n\x0eStreamProducts\x12\x10.db.ProductQuery\x1a\x0b.db.Product0\x01\x32\xb7\x01\n\x0bUserService\x12+\n\nCreateUser\x12\x13.db.RegisterRequest\x1a\x08.db.User\x12\x1d\n\x07GetUser\x12\x08.db.ById\x1a\x08.db.User\x12-\n\x11GetUserByUsername\x12\x0e.db.ByUsername\x1a\x08.db.User\x12-\n\nUpdateUser\x12\x15.db.UpdateUserRequest\x1a\x08.db.User2\xb4\x01\n\x0cOrderService\x12&\n\x0b\x43reateOrder\x12\x0c.db.NewOrder\x1a\t.db.Order\x12\x37\n\x0c\x43reateOrders\x12\x11.db.NewOrderBatch\x1a\x14.db.OrderBatchResult\x12\x1f\n\x08GetOrder\x12\x08.db.ById\x1a\t.db.Order\x12\"\n\x0b\x43\x61ncelOrder\x12\x08.db.ById\x1a\t.db.Orderb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -35,24 +35,34 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_EMPTY']._serialized_end=23
   _globals['_BYID']._serialized_start=25
   _globals['_BYID']._serialized_end=43
-  _globals['_PRODUCT']._serialized_start=45
-  _globals['_PRODUCT']._serialized_end=128
-  _globals['_PRODUCTLIST']._serialized_start=130
-  _globals['_PRODUCTLIST']._serialized_end=174
-  _globals['_USER']._serialized_start=176
-  _globals['_USER']._serialized_end=251
-  _globals['_REGISTERREQUEST']._serialized_start=253
-  _globals['_REGISTERREQUEST']._serialized_end=311
-  _globals['_UPDATEUSERREQUEST']._serialized_start=313
-  _globals['_UPDATEUSERREQUEST']._serialized_end=378
-  _globals['_ORDER']._serialized_start=380
-  _globals['_ORDER']._serialized_end=493
-  _globals['_NEWORDER']._serialized_start=495
-  _globals['_NEWORDER']._serialized_end=560
-  _globals['_PRODUCTSERVICE']._serialized_start=562
-  _globals['_PRODUCTSERVICE']._serialized_end=659
-  _globals['_USERSERVICE']._serialized_start=662
-  _globals['_USERSERVICE']._serialized_end=798
-  _globals['_ORDERSERVICE']._serialized_start=800
-  _globals['_ORDERSERVICE']._serialized_end=923
+  _globals['_BYUSERNAME']._serialized_start=45
+  _globals['_BYUSERNAME']._serialized_end=75
+  _globals['_PRODUCT']._serialized_start=77
+  _globals['_PRODUCT']._serialized_end=177
+  _globals['_PRODUCTQUERY']._serialized_start=179
+  _globals['_PRODUCTQUERY']._serialized_end=226
+  _globals['_PRODUCTLIST']._serialized_start=228
+  _globals['_PRODUCTLIST']._serialized_end=289
+  _globals['_USER']._serialized_start=291
+  _globals['_USER']._serialized_end=366
+  _globals['_REGISTERREQUEST']._serialized_start=368
+  _globals['_REGISTERREQUEST']._serialized_end=426
+  _globals['_UPDATEUSERREQUEST']._serialized_start=428
+  _globals['_UPDATEUSERREQUEST']._serialized_end=493
+  _globals['_ORDER']._serialized_start=495
+  _globals['_ORDER']._serialized_end=608
+  _globals['_NEWORDER']._serialized_start=610
+  _globals['_NEWORDER']._serialized_end=700
+  _globals['_NEWORDERBATCH']._serialized_start=702
+  _globals['_NEWORDERBATCH']._serialized_end=747
+  _globals['_ORDERLINERESULT']._serialized_start=749
+  _globals['_ORDERLINERESULT']._serialized_end=821
+  _globals['_ORDERBATCHRESULT']._serialized_start=823
+  _globals['_ORDERBATCHRESULT']._serialized_end=894
+  _globals['_PRODUCTSERVICE']._serialized_start=897
+  _globals['_PRODUCTSERVICE']._serialized_end=1045
+  _globals['_USERSERVICE']._serialized_start=1048
+  _globals['_USERSERVICE']._serialized_end=1231
+  _globals['_ORDERSERVICE']._serialized_start=1234
+  _globals['_ORDERSERVICE']._serialized_end=1414
 # @@protoc_insertion_point(module_scope)
@@ -44,6 +44,11 @@ class ProductServiceStub(object):
                 request_serializer=db__pb2.ById.SerializeToString,
                 response_deserializer=db__pb2.Product.FromString,
                 _registered_method=True)
+        self.StreamProducts = channel.unary_stream(
+                '/db.ProductService/StreamProducts',
+                request_serializer=db__pb2.ProductQuery.SerializeToString,
+                response_deserializer=db__pb2.Product.FromString,
+                _registered_method=True)
 
 
 class ProductServiceServicer(object):
@@ -61,6 +66,12 @@ class ProductServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamProducts(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_ProductServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -74,6 +85,11 @@ def add_ProductServiceServicer_to_server(servicer, server):
                     request_deserializer=db__pb2.ById.FromString,
                     response_serializer=db__pb2.Product.SerializeToString,
             ),
+            'StreamProducts': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamProducts,
+                    request_deserializer=db__pb2.ProductQuery.FromString,
+                    response_serializer=db__pb2.Product.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'db.ProductService', rpc_method_handlers)
@@ -139,6 +155,33 @@ class ProductService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def StreamProducts(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/db.ProductService/StreamProducts',
+            db__pb2.ProductQuery.SerializeToString,
+            db__pb2.Product.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
 
 class UserServiceStub(object):
     """Missing associated documentation comment in .proto file."""
@@ -159,6 +202,11 @@ class UserServiceStub(object):
                 request_serializer=db__pb2.ById.SerializeToString,
                 response_deserializer=db__pb2.User.FromString,
                 _registered_method=True)
+        self.GetUserByUsername = channel.unary_unary(
+                '/db.UserService/GetUserByUsername',
+                request_serializer=db__pb2.ByUsername.SerializeToString,
+                response_deserializer=db__pb2.User.FromString,
+                _registered_method=True)
         self.UpdateUser = channel.unary_unary(
                 '/db.UserService/UpdateUser',
                 request_serializer=db__pb2.UpdateUserRequest.SerializeToString,
@@ -181,6 +229,12 @@ class UserServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetUserByUsername(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def UpdateUser(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -200,6 +254,11 @@ def add_UserServiceServicer_to_server(servicer, server):
                     request_deserializer=db__pb2.ById.FromString,
                     response_serializer=db__pb2.User.SerializeToString,
             ),
+            'GetUserByUsername': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetUserByUsername,
+                    request_deserializer=db__pb2.ByUsername.FromString,
+                    response_serializer=db__pb2.User.SerializeToString,
+            ),
             'UpdateUser': grpc.unary_unary_rpc_method_handler(
                     servicer.UpdateUser,
                     request_deserializer=db__pb2.UpdateUserRequest.FromString,
@@ -270,6 +329,33 @@ class UserService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def GetUserByUsername(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/db.UserService/GetUserByUsername',
+            db__pb2.ByUsername.SerializeToString,
+            db__pb2.User.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def UpdateUser(request,
             target,
@@ -312,6 +398,11 @@ class OrderServiceStub(object):
                 request_serializer=db__pb2.NewOrder.SerializeToString,
                 response_deserializer=db__pb2.Order.FromString,
                 _registered_method=True)
+        self.CreateOrders = channel.unary_unary(
+                '/db.OrderService/CreateOrders',
+                request_serializer=db__pb2.NewOrderBatch.SerializeToString,
+                response_deserializer=db__pb2.OrderBatchResult.FromString,
+                _registered_method=True)
         self.GetOrder = channel.unary_unary(
                 '/db.OrderService/GetOrder',
                 request_serializer=db__pb2.ById.SerializeToString,
@@ -333,6 +424,12 @@ class OrderServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def CreateOrders(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def GetOrder(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -353,6 +450,11 @@ def add_OrderServiceServicer_to_server(servicer, server):
                     request_deserializer=db__pb2.NewOrder.FromString,
                     response_serializer=db__pb2.Order.SerializeToString,
             ),
+            'CreateOrders': grpc.unary_unary_rpc_method_handler(
+                    servicer.CreateOrders,
+                    request_deserializer=db__pb2.NewOrderBatch.FromString,
+                    response_serializer=db__pb2.OrderBatchResult.SerializeToString,
+            ),
             'GetOrder': grpc.unary_unary_rpc_method_handler(
                     servicer.GetOrder,
                     request_deserializer=db__pb2.ById.FromString,
@@ -401,6 +503,33 @@ class OrderService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def CreateOrders(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/db.OrderService/CreateOrders',
+            db__pb2.NewOrderBatch.SerializeToString,
+            db__pb2.OrderBatchResult.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def GetOrder(request,
             target,
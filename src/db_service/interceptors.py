@@ -0,0 +1,35 @@
+"""
+The plumbing the server interceptors (metrics, tracing, request_scope) share
+between server.py and aio_server.py. Each interceptor only supplies what it
+wraps around a unary and a server-streaming behavior; wrap_handler() puts
+those wrappers into a new method handler, for grpc and grpc.aio alike (an aio
+handler's behaviors are coroutine and async generator functions).
+"""
+import grpc
+
+
+def method_name(handler_call_details) -> str:
+    """The RPC without its service: CreateOrder for /db.OrderService/CreateOrder"""
+    return handler_call_details.method.rsplit("/", 1)[-1]
+
+
+def wrap_handler(handler, unary, stream):
+    """
+    `handler` with its behavior replaced by unary(behavior) or stream(behavior);
+    None and the kinds db_service does not serve (client streaming) pass as they are.
+    """
+    if handler is None:
+        return None
+    if handler.unary_unary:
+        return grpc.unary_unary_rpc_method_handler(
+            unary(handler.unary_unary),
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
+    if handler.unary_stream:
+        return grpc.unary_stream_rpc_method_handler(
+            stream(handler.unary_stream),
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
+    return handler
@@ -0,0 +1,153 @@
+import collections
+import itertools
+import threading
+
+from storage import SEED_PRODUCTS, OutOfStock, Storage, UsernameTaken
+
+
+class MemoryDBManager(Storage):
+    """
+    Storage kept in process memory (DB_STORAGE=memory), for local load tests.
+    It starts from the products of db-init/init.sql; nothing outlives the
+    process. Tables are dicts keyed by id, plus a username index.
+
+    One lock covers every table, as a transaction would.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = itertools.count(1)
+
+        # id -> [id, name, category, price, stock, version]
+        self._products = {}
+        # id -> [id, username, active, password_hash], and username -> id
+        self._users = {}
+        self._user_ids = {}
+        # id -> [id, user_id, product_id, quantity, total_price, canceled]
+        self._orders = {}
+        # (user_id, key) -> order id
+        self._idempotency_keys = {}
+
+        self._next_user_id = itertools.count(1)
+        self._next_order_id = itertools.count(1)
+        for pid, (name, category, price, stock) in enumerate(SEED_PRODUCTS, start=1):
+            self._products[pid] = [pid, name, category, price, stock, next(self._versions)]
+
+    # --------------------
+    # Products CRUD
+    # --------------------
+    def list_products(self):
+        with self._lock:
+            return [tuple(p) for p in self._products.values()]
+
+    def get_product(self, pid):
+        with self._lock:
+            p = self._products.get(pid)
+            return tuple(p) if p else None
+
+    def stream_products(self, after_id=0, limit=None):
+        with self._lock:
+            rows = sorted(tuple(p) for p in self._products.values() if p[0] > after_id)
+        yield from rows[:limit]
+
+    # --------------------
+    # Users CRUD
+    # --------------------
+    def create_user(self, username, password_hash):
+        with self._lock:
+            if username in self._user_ids:
+                raise UsernameTaken(username)
+            uid = next(self._next_user_id)
+            self._users[uid] = [uid, username, True, password_hash]
+            self._user_ids[username] = uid
+            return tuple(self._users[uid])
+
+    def get_user(self, uid):
+        with self._lock:
+            u = self._users.get(uid)
+            return tuple(u) if u else None
+
+    def get_user_by_username(self, username):
+        with self._lock:
+            uid = self._user_ids.get(username)
+            return tuple(self._users[uid]) if uid is not None else None
+
+    def update_user(self, uid, username, active):
+        with self._lock:
+            u = self._users.get(uid)
+            if u is None:
+                return None
+            if username != u[1]:
+                if username in self._user_ids:
+                    raise UsernameTaken(username)
+                del self._user_ids[u[1]]
+                self._user_ids[username] = uid
+            u[1], u[2] = username, active
+            return tuple(u)
+
+    # --------------------
+    # Orders CRUD
+    # --------------------
+    def _take_stock(self, product_id, quantity):
+        product = self._products[product_id]
+        product[4] -= quantity
+        product[5] = next(self._versions)
+
+    def _insert_order(self, user_id, product_id, quantity):
+        product = self._products[product_id]
+        oid = next(self._next_order_id)
+        self._orders[oid] = [oid, user_id, product_id, quantity, product[3] * quantity, False]
+        return tuple(self._orders[oid])
+
+    def create_order(self, user_id, product_id, quantity, idempotency_key=None):
+        with self._lock:
+            if idempotency_key:
+                oid = self._idempotency_keys.get((user_id, idempotency_key))
+                if oid is not None:
+                    return tuple(self._orders[oid])
+            if product_id not in self._products:
+                return None
+            if self._products[product_id][4] < quantity:
+                raise OutOfStock()
+            self._take_stock(product_id, quantity)
+            row = self._insert_order(user_id, product_id, quantity)
+            if idempotency_key:
+                self._idempotency_keys[(user_id, idempotency_key)] = row[0]
+            return row
+
+    def create_orders(self, orders):
+        """Same contract as DBManager.create_orders"""
+        with self._lock:
+            missing = [i for i, o in enumerate(orders) if o[1] not in self._products]
+            if missing:
+                return None, missing
+            needed = collections.Counter()
+            for _, product_id, quantity in orders:
+                needed[product_id] += quantity
+            short = {pid for pid, n in needed.items() if self._products[pid][4] < n}
+            if short:
+                raise OutOfStock(i for i, o in enumerate(orders) if o[1] in short)
+            for product_id, quantity in needed.items():
+                self._take_stock(product_id, quantity)
+            return [self._insert_order(*o) for o in orders], []
+
+    def get_order(self, order_id):
+        with self._lock:
+            o = self._orders.get(order_id)
+            return tuple(o) if o else None
+
+    def cancel_order(self, order_id):
+        with self._lock:
+            o = self._orders.get(order_id)
+            if o is None:
+                return None
+            if not o[5]:
+                o[5] = True
+                self._take_stock(o[2], -o[3])
+            return tuple(o)
+
+    # --------------------
+    # Clean up
+    # --------------------
+    def close_pool(self):
+        pass
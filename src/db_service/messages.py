@@ -0,0 +1,78 @@
+"""
+db_pb2 messages built from storage rows, and the checks on requests, shared by
+the servicers of server.py and aio_server.py so both answer alike.
+"""
+import db_pb2
+
+MAX_QUANTITY = 3
+
+QUANTITY_TOO_LARGE = f"Quantity cannot exceed {MAX_QUANTITY}"
+EMPTY_BATCH = "Batch is empty"
+
+
+# -------------------------
+# Rows
+# -------------------------
+
+def product_pb(r):
+    return db_pb2.Product(
+        id=r[0], name=r[1], category=r[2], price=float(r[3]), stock=r[4], version=r[5]
+    )
+
+
+def product_list_pb(rows):
+    # every update gives a row a larger version, so the sum moves on any change
+    version = f"{len(rows)}-{sum(r[5] for r in rows)}"
+    return db_pb2.ProductList(products=[product_pb(r) for r in rows], version=version)
+
+
+def user_pb(r):
+    return db_pb2.User(id=r[0], username=r[1], active=r[2], password_hash=r[3])
+
+
+def order_pb(r):
+    return db_pb2.Order(
+        id=r[0], user_id=r[1], product_id=r[2],
+        quantity=r[3], total_price=float(r[4]), canceled=r[5]
+    )
+
+
+# -------------------------
+# CreateOrders
+# -------------------------
+
+def batch_items(orders):
+    """The (user_id, product_id, quantity) Storage.create_orders takes"""
+    return [(o.user_id, o.product_id, o.quantity) for o in orders]
+
+
+def batch_quantity_errors(orders):
+    """The failed OrderBatchResult for a batch with quantities out of range, or None"""
+    errors = [
+        db_pb2.OrderLineResult(line=i, error=f"Quantity must be between 1 and {MAX_QUANTITY}")
+        for i, o in enumerate(orders)
+        if o.quantity <= 0 or o.quantity > MAX_QUANTITY
+    ]
+    return db_pb2.OrderBatchResult(success=False, lines=errors) if errors else None
+
+
+def batch_out_of_stock(e):
+    """The failed OrderBatchResult for an OutOfStock from create_orders"""
+    return _batch_failed(e.lines, "Out of stock")
+
+
+def batch_missing(missing):
+    """The failed OrderBatchResult for create_orders' missing products"""
+    return _batch_failed(missing, "Product not found")
+
+
+def batch_placed(rows):
+    return db_pb2.OrderBatchResult(success=True, lines=[
+        db_pb2.OrderLineResult(line=i, order=order_pb(r)) for i, r in enumerate(rows)
+    ])
+
+
+def _batch_failed(lines, error):
+    return db_pb2.OrderBatchResult(success=False, lines=[
+        db_pb2.OrderLineResult(line=i, error=error) for i in lines
+    ])
@@ -0,0 +1,173 @@
+"""
+Latency histograms and counters of db_service, served in the Prometheus text
+format on DB_METRICS_PORT (0 disables it).
+
+- grpc_server_duration_seconds{method}       handler time, per RPC
+- grpc_server_handled_total{method, code}
+- db_statement_duration_seconds{statement}   one round-trip to Postgres, by the
+                                             name DBManager gives the statement
+- db_statement_errors_total{statement}
+- db_pool_wait_seconds                       time to check a connection out
+- db_pool_connections_in_use
+- db_pool_connections_open
+- db_pool_waiters                            threads waiting for a connection
+- db_pool_timeouts_total                     checkouts that gave up waiting
+- db_pool_connections_closed_total{reason}   broken, expired or closed
+"""
+import os
+import time
+from contextlib import contextmanager
+from functools import partial
+
+import grpc
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from interceptors import method_name, wrap_handler
+from tracing import latency_buckets, span
+
+METRICS_PORT = int(os.getenv("DB_METRICS_PORT", "9101"))
+
+LATENCY_BUCKETS = latency_buckets()
+
+GRPC_SERVER_DURATION = Histogram(
+    "grpc_server_duration_seconds", "Time spent handling an RPC",
+    ["method"], buckets=LATENCY_BUCKETS,
+)
+GRPC_SERVER_HANDLED = Counter(
+    "grpc_server_handled_total", "RPCs handled, by outcome",
+    ["method", "code"],
+)
+STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds", "Time to execute one SQL statement",
+    ["statement"], buckets=LATENCY_BUCKETS,
+)
+STATEMENT_ERRORS = Counter(
+    "db_statement_errors_total", "SQL statements that raised",
+    ["statement"],
+)
+POOL_WAIT = Histogram(
+    "db_pool_wait_seconds", "Time to get a connection from the pool",
+    buckets=LATENCY_BUCKETS,
+)
+POOL_IN_USE = Gauge("db_pool_connections_in_use", "Connections checked out of the pool")
+POOL_OPEN = Gauge("db_pool_connections_open", "Connections the pool holds open")
+POOL_WAITERS = Gauge("db_pool_waiters", "Threads waiting for a free connection")
+POOL_TIMEOUTS = Counter("db_pool_timeouts_total", "Checkouts that timed out waiting")
+POOL_CLOSED = Counter(
+    "db_pool_connections_closed_total", "Connections the pool closed, by reason",
+    ["reason"],
+)
+
+
+def start_metrics_server():
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        print(f"Metrics on port {METRICS_PORT}")
+
+
+@contextmanager
+def statement_timer(statement: str):
+    """Times the block, and traces it as a "sql <statement>" span"""
+    started = time.perf_counter()
+    try:
+        with span(f"sql {statement}"):
+            yield
+    except Exception:
+        STATEMENT_ERRORS.labels(statement).inc()
+        raise
+    finally:
+        STATEMENT_DURATION.labels(statement).observe(time.perf_counter() - started)
+
+
+def execute(cur, statement: str, sql: str, args=None):
+    """cur.execute(sql, args), timed and traced under the name `statement`"""
+    with statement_timer(statement):
+        cur.execute(sql, args)
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """Times every RPC; put it first so the time includes the other interceptors"""
+
+    def intercept_service(self, continuation, handler_call_details):
+        method = method_name(handler_call_details)
+        return wrap_handler(
+            continuation(handler_call_details),
+            partial(_unary, method), partial(_stream, method),
+        )
+
+
+class AioMetricsInterceptor(grpc.aio.ServerInterceptor):
+    """MetricsInterceptor for the grpc.aio server (aio_server.py)"""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        method = method_name(handler_call_details)
+        return wrap_handler(
+            await continuation(handler_call_details),
+            partial(_aio_unary, method), partial(_aio_stream, method),
+        )
+
+
+def _record(method, context, started, failed, cancelled):
+    """
+    cancelled: whether the RPC was over before the handler was (a stream the
+    client stopped reading), for a handler that did not set a code itself
+    """
+    code = context.code()
+    if code is None and not failed:
+        code = grpc.StatusCode.OK
+    elif code is None:
+        # cancelled, or an exception other than context.abort()
+        code = grpc.StatusCode.CANCELLED if cancelled else grpc.StatusCode.UNKNOWN
+    GRPC_SERVER_DURATION.labels(method).observe(time.perf_counter() - started)
+    GRPC_SERVER_HANDLED.labels(method, code.name).inc()
+
+
+def _unary(method, behavior):
+    def handler(request, context):
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = behavior(request, context)
+            failed = False
+            return response
+        finally:
+            _record(method, context, started, failed, not context.is_active())
+    return handler
+
+
+def _stream(method, behavior):
+    def handler(request, context):
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield from behavior(request, context)
+            failed = False
+        finally:
+            _record(method, context, started, failed, not context.is_active())
+    return handler
+
+
+def _aio_unary(method, behavior):
+    async def handler(request, context):
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = await behavior(request, context)
+            failed = False
+            return response
+        finally:
+            _record(method, context, started, failed, context.cancelled())
+    return handler
+
+
+def _aio_stream(method, behavior):
+    async def handler(request, context):
+        started = time.perf_counter()
+        failed = True
+        try:
+            async for response in behavior(request, context):
+                yield response
+            failed = False
+        finally:
+            _record(method, context, started, failed, context.cancelled())
+    return handler
@@ -0,0 +1,223 @@
+"""
+Postgres connection pool of DBManager.
+
+psycopg2's SimpleConnectionPool is not safe to share between the gRPC worker
+threads and raises as soon as it is exhausted. ConnectionPool instead:
+
+- blocks in getconn() until a connection is free, at most `timeout` seconds,
+  then raises PoolTimeout. Waiters are served first come, first served: a
+  returned connection goes to the longest waiter, never to a newcomer
+- opens `minconn` connections up front and more on demand, up to `maxconn`
+- tests a connection idle for more than `check_after` seconds with SELECT 1
+  before handing it out, and replaces it if it is dead
+- closes connections older than `max_lifetime` seconds when they come back
+  or are about to be handed out, so none lives forever on the server side,
+  idle ones included (0 keeps them)
+- exports its size, use, waiters and wait times (see metrics.py); stats()
+  returns the same numbers
+"""
+import collections
+import threading
+import time
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+from psycopg2.pool import PoolError
+
+from metrics import POOL_CLOSED, POOL_IN_USE, POOL_OPEN, POOL_TIMEOUTS, POOL_WAIT, POOL_WAITERS
+
+
+class PoolTimeout(PoolError):
+    """No connection became free in time"""
+
+
+class _Waiter:
+
+    __slots__ = ("event", "conn", "idle_since")
+
+    def __init__(self):
+        self.event = threading.Event()
+        # the connection handed over, or None for the right to open a new one
+        self.conn = None
+        self.idle_since = None
+
+
+class ConnectionPool:
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float = 5.0,
+                 check_after: float = 30.0, max_lifetime: float = 1800.0, **dsn):
+        if maxconn < 1 or not 0 <= minconn <= maxconn:
+            raise ValueError(f"need 0 <= minconn <= maxconn and maxconn >= 1, got {minconn}, {maxconn}")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_lifetime = max_lifetime
+        self._dsn = dsn
+
+        self._lock = threading.Lock()
+        # (connection, idle since), the most recently returned last
+        self._idle = collections.deque()
+        self._waiters = collections.deque()
+        # open connections plus those being opened; never above maxconn
+        self._size = 0
+        self._in_use = 0
+        # connection -> when it was opened
+        self._opened = {}
+        self._closed = False
+
+        for _ in range(minconn):
+            self._size += 1
+            self._idle.append((self._connect(), time.monotonic()))
+
+    # --------------------
+    # Internal helpers
+    # --------------------
+    def _connect(self):
+        conn = psycopg2.connect(**self._dsn)
+        self._opened[conn] = time.monotonic()
+        POOL_OPEN.inc()
+        return conn
+
+    def _discard(self, conn, reason: str):
+        """Close a connection; its slot stays taken, see _release_slot"""
+        if self._opened.pop(conn, None) is not None:
+            POOL_OPEN.dec()
+            POOL_CLOSED.labels(reason).inc()
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _release_slot(self):
+        """Give up the slot of a discarded connection, to the next waiter if any (lock held)"""
+        if self._waiters:
+            self._hand_over(None, None)
+        else:
+            self._size -= 1
+
+    def _hand_over(self, conn, idle_since):
+        # called with the lock held
+        waiter = self._waiters.popleft()
+        POOL_WAITERS.dec()
+        waiter.conn, waiter.idle_since = conn, idle_since
+        waiter.event.set()
+
+    def _checkout(self, timeout: float):
+        """(connection, idle since), or (None, None) for a slot to open one in"""
+        with self._lock:
+            if self._closed:
+                raise PoolError("connection pool is closed")
+            if not self._waiters:
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.maxconn:
+                    self._size += 1
+                    return None, None
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+            POOL_WAITERS.inc()
+
+        if not waiter.event.wait(timeout):
+            with self._lock:
+                # a hand-over may have come in just after the wait gave up
+                if not waiter.event.is_set():
+                    self._waiters.remove(waiter)
+                    POOL_WAITERS.dec()
+                    POOL_TIMEOUTS.inc()
+                    raise PoolTimeout(f"no connection free within {timeout:.3g}s "
+                                      f"({self.maxconn} in use, {len(self._waiters)} waiting)")
+        return waiter.conn, waiter.idle_since
+
+    def _expired(self, conn) -> bool:
+        opened = self._opened.get(conn)
+        return bool(self.max_lifetime) and opened is not None and \
+            time.monotonic() - opened > self.max_lifetime
+
+    @staticmethod
+    def _alive(conn) -> bool:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    # --------------------
+    # Checkout and return
+    # --------------------
+    def getconn(self, timeout: float = None):
+        """A connection for this thread alone; `timeout` overrides the pool's"""
+        started = time.perf_counter()
+        conn, idle_since = self._checkout(self.timeout if timeout is None else timeout)
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif conn.closed:
+                self._discard(conn, "broken")
+                conn = self._connect()
+            elif self._expired(conn):
+                self._discard(conn, "expired")
+                conn = self._connect()
+            elif time.monotonic() - idle_since > self.check_after and not self._alive(conn):
+                self._discard(conn, "broken")
+                conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._release_slot()
+            raise
+        with self._lock:
+            self._in_use += 1
+        POOL_IN_USE.inc()
+        POOL_WAIT.observe(time.perf_counter() - started)
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        """Return a connection; an open transaction is rolled back"""
+        reason = "closed" if close else None
+        if not close:
+            status = TRANSACTION_STATUS_UNKNOWN if conn.closed else conn.info.transaction_status
+            if status == TRANSACTION_STATUS_UNKNOWN:
+                reason = "broken"
+            elif status != TRANSACTION_STATUS_IDLE:
+                # e.g. a read that never committed, or a failed statement
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    reason = "broken"
+        if reason is None and self._expired(conn):
+            reason = "expired"
+
+        if reason is not None:
+            self._discard(conn, reason)
+        with self._lock:
+            self._in_use -= 1
+            if reason is not None:
+                self._release_slot()
+            elif self._waiters:
+                self._hand_over(conn, time.monotonic())
+            else:
+                self._idle.append((conn, time.monotonic()))
+        POOL_IN_USE.dec()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open": len(self._opened),
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "waiting": len(self._waiters),
+                "max": self.maxconn,
+            }
+
+    # --------------------
+    # Clean up
+    # --------------------
+    def closeall(self):
+        """Close every connection, idle or checked out; later getconn() calls fail"""
+        with self._lock:
+            self._closed = True
+            self._idle.clear()
+        for conn in list(self._opened):
+            self._discard(conn, "closed")
@@ -0,0 +1,54 @@
+"""
+Server-side prepared statements for DBManager's hot queries.
+
+execute_prepared() sends `PREPARE <statement> AS <sql>` the first time a
+connection runs a statement, and only `EXECUTE <statement> (<args>)` after
+that, so Postgres parses and plans each query once per connection instead of
+once per call. Prepared statements belong to the database session, and a
+connection remembers what it has prepared (PreparingConnection.prepared): a
+connection the pool reopens starts empty and prepares again on first use.
+
+The SQL keeps psycopg2's %s placeholders, numbered $1, $2, ... for PREPARE.
+DB_PREPARED_STATEMENTS=0 sends the plain SQL every time instead, for
+comparison (benchmarks/prepared_bench.py).
+
+Statements are per session, so this needs session pooling between
+db_service and Postgres (a direct connection or pgbouncer pool_mode=session).
+"""
+import itertools
+import os
+import re
+
+import psycopg2.extensions
+
+from metrics import execute
+
+ENABLED = os.getenv("DB_PREPARED_STATEMENTS", "1") != "0"
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that tracks the statements prepared in its session"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def _numbered(sql: str) -> str:
+    """sql with $1, $2, ... in place of its %s placeholders"""
+    counter = itertools.count(1)
+    return re.sub(r"%s", lambda _: f"${next(counter)}", sql)
+
+
+def execute_prepared(cur, statement: str, sql: str, args=()):
+    """Like metrics.execute, through a prepared statement named `statement`"""
+    prepared = getattr(cur.connection, "prepared", None)
+    if not ENABLED or prepared is None:
+        execute(cur, statement, sql, args)
+        return
+    if statement not in prepared:
+        execute(cur, "prepare", f"PREPARE {statement} AS {_numbered(sql.strip().rstrip(';'))};")
+        # not undone by a rollback: the statement lives as long as the session
+        prepared.add(statement)
+    params = f" ({', '.join(['%s'] * len(args))})" if args else ""
+    execute(cur, statement, f"EXECUTE {statement}{params};", args)
@@ -0,0 +1,184 @@
+"""
+Deadlines and cancellation for db_service RPCs.
+
+DeadlineInterceptor runs every handler inside a RequestScope bound to its gRPC
+context, and DBManager picks the scope up whenever it checks out a connection:
+
+- the transaction gets SET LOCAL statement_timeout from the time the caller has
+  left, capped by DB_MAX_STATEMENT_TIMEOUT (which also covers callers that send
+  no deadline at all)
+- when the RPC ends early (deadline passed, client cancelled or gone) the query
+  still running on that connection is cancelled
+
+Either way the handler sees QueryCanceledError, which is answered with
+DEADLINE_EXCEEDED. So is a deadline that passes while waiting for a pooled
+connection; a wait that outlasts DB_POOL_TIMEOUT is RESOURCE_EXHAUSTED.
+
+AioDeadlineInterceptor does the same for aio_server.py, where asyncpg has no
+per-transaction statement_timeout: a unary handler is cancelled when the time
+runs out, and cancelling it cancels the query it is waiting for.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+
+import asyncpg
+import grpc
+from psycopg2.extensions import QueryCanceledError
+
+from interceptors import wrap_handler
+from pool import PoolTimeout
+
+# seconds; 0 disables the cap
+MAX_STATEMENT_TIMEOUT = float(os.getenv("DB_MAX_STATEMENT_TIMEOUT", "30"))
+
+PG_MAX_TIMEOUT_MS = 2**31 - 1
+
+current_scope = contextvars.ContextVar("request_scope", default=None)
+
+
+class RequestScope:
+
+    def __init__(self, context):
+        self.context = context
+        self.cancelled = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def statement_timeout_ms(self) -> int:
+        """Postgres statement_timeout for the next statement (0 = no limit)"""
+        budget = _budget(self.context.time_remaining())
+        if budget is None:
+            return 0
+        ms = int(budget * 1000)
+        # without a deadline grpc reports a remaining time far past what Postgres takes
+        if ms > PG_MAX_TIMEOUT_MS:
+            return 0
+        # 0 would mean "no limit", so an exhausted budget still gets 1ms
+        return max(1, ms)
+
+    def attach(self, conn):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCanceledError("RPC ended before the query started")
+            self._conn = conn
+
+    def detach(self, conn):
+        with self._lock:
+            if self._conn is conn:
+                self._conn = None
+
+    def cancel(self):
+        """RPC termination callback; a no-op once the handler is done with its connection"""
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                self._conn.cancel()
+
+
+_LATE = (grpc.StatusCode.DEADLINE_EXCEEDED, "Deadline exceeded before the call started")
+
+# what each server's handlers raise when the query was cancelled or the pool had no connection
+_ABORTED = (QueryCanceledError, PoolTimeout)
+_AIO_ABORTED = (asyncio.TimeoutError, asyncpg.QueryCanceledError, PoolTimeout)
+
+
+def _budget(remaining):
+    """Seconds a handler may run with `remaining` left of the caller's deadline, or None"""
+    limits = [t for t in (remaining, MAX_STATEMENT_TIMEOUT or None) if t is not None]
+    return min(limits) if limits else None
+
+
+def _late(context):
+    """Whether the caller's deadline passed before the handler started"""
+    remaining = context.time_remaining()
+    return remaining is not None and remaining <= 0
+
+
+def _status(e):
+    """(code, details) answering a handler that ran out of time (or of connections, PoolTimeout)"""
+    if isinstance(e, PoolTimeout):
+        return grpc.StatusCode.RESOURCE_EXHAUSTED, "No database connection free"
+    return grpc.StatusCode.DEADLINE_EXCEEDED, "Query cancelled"
+
+
+class DeadlineInterceptor(grpc.ServerInterceptor):
+
+    def intercept_service(self, continuation, handler_call_details):
+        return wrap_handler(continuation(handler_call_details), _unary, _stream)
+
+
+class AioDeadlineInterceptor(grpc.aio.ServerInterceptor):
+
+    async def intercept_service(self, continuation, handler_call_details):
+        return wrap_handler(await continuation(handler_call_details), _aio_unary, _aio_stream)
+
+
+def _enter(context):
+    if _late(context):
+        context.abort(*_LATE)
+    scope = RequestScope(context)
+    context.add_callback(scope.cancel)
+    return scope
+
+
+def _unary(behavior):
+    def handler(request, context):
+        token = current_scope.set(_enter(context))
+        try:
+            return behavior(request, context)
+        except _ABORTED as e:
+            context.abort(*_status(e))
+        finally:
+            current_scope.reset(token)
+    return handler
+
+
+def _stream(behavior):
+    def handler(request, context):
+        scope = _enter(context)
+        responses = behavior(request, context)
+        try:
+            while True:
+                # set only while the servicer runs: grpc may resume this generator
+                # from another thread, or close it from the garbage collector
+                token = current_scope.set(scope)
+                try:
+                    response = next(responses)
+                except StopIteration:
+                    return
+                except _ABORTED as e:
+                    context.abort(*_status(e))
+                finally:
+                    current_scope.reset(token)
+                yield response
+        finally:
+            responses.close()
+    return handler
+
+
+def _aio_unary(behavior):
+    async def handler(request, context):
+        if _late(context):
+            await context.abort(*_LATE)
+        try:
+            return await asyncio.wait_for(
+                behavior(request, context), _budget(context.time_remaining())
+            )
+        except _AIO_ABORTED as e:
+            await context.abort(*_status(e))
+    return handler
+
+
+def _aio_stream(behavior):
+    # no budget: a stream ends with its RPC, which grpc cancels at the deadline
+    async def handler(request, context):
+        if _late(context):
+            await context.abort(*_LATE)
+        try:
+            async for response in behavior(request, context):
+                yield response
+        except _AIO_ABORTED as e:
+            await context.abort(*_status(e))
+    return handler
@@ -1,14 +1,27 @@
 import grpc
+import os
 from concurrent import futures
 
 import db_pb2, db_pb2_grpc
 # from grpc_generated import db_pb2, db_pb2_grpc
 
-from db_manager import DBManager
+from messages import (
+    EMPTY_BATCH, MAX_QUANTITY, QUANTITY_TOO_LARGE, batch_items, batch_missing, batch_out_of_stock,
+    batch_placed, batch_quantity_errors, order_pb, product_list_pb, product_pb, user_pb,
+)
+from metrics import MetricsInterceptor, start_metrics_server
+from request_scope import DeadlineInterceptor
+from storage import OutOfStock, UsernameTaken, open_storage
+from tracing import TraceInterceptor
 
 
-# 初始化数据库管理器
-db = DBManager()
+# gRPC worker threads; the Postgres pool gets as many connections, so RPCs
+# beyond that wait in the executor's queue instead of failing at the pool
+WORKERS = int(os.getenv("DB_GRPC_WORKERS", "10"))
+
+# 初始化数据库管理器 (in serve())
+# DB_STORAGE: postgres (default), sqlite or memory, see storage.py
+db = None
 
 
 # -------------------------
@@ -17,22 +30,17 @@ db = DBManager()
 
 class ProductService(db_pb2_grpc.ProductServiceServicer):
     def ListProducts(self, request, context):
-        rows = db.list_products()
-        products = [
-            db_pb2.Product(
-                id=r[0], name=r[1], category=r[2], price=float(r[3]), stock=r[4]
-            )
-            for r in rows
-        ]
-        return db_pb2.ProductList(products=products)
+        return product_list_pb(db.list_products())
 
     def GetProduct(self, request, context):
         r = db.get_product(request.id)
         if r is None:
             context.abort(grpc.StatusCode.NOT_FOUND, "Product not found")
-        return db_pb2.Product(
-            id=r[0], name=r[1], category=r[2], price=float(r[3]), stock=r[4]
-        )
+        return product_pb(r)
+
+    def StreamProducts(self, request, context):
+        for r in db.stream_products(request.after_id, request.limit or None):
+            yield product_pb(r)
 
 
 # -------------------------
@@ -41,18 +49,30 @@ class ProductService(db_pb2_grpc.ProductServiceServicer):
 
 class UserService(db_pb2_grpc.UserServiceServicer):
     def CreateUser(self, request, context):
-        r = db.create_user(request.username, request.password_hash)
-        return db_pb2.User(id=r[0],username=r[1],active=r[2],password_hash=r[3])
+        try:
+            r = db.create_user(request.username, request.password_hash)
+        except UsernameTaken:
+            context.abort(grpc.StatusCode.ALREADY_EXISTS, "Username is taken")
+        return user_pb(r)
 
     def GetUser(self, request, context):
         r = db.get_user(request.id)
         if r is None:
             context.abort(grpc.StatusCode.NOT_FOUND, "User not found")
-        return db_pb2.User(id=r[0],username=r[1],active=r[2],password_hash=r[3])
+        return user_pb(r)
+
+    def GetUserByUsername(self, request, context):
+        r = db.get_user_by_username(request.username)
+        if r is None:
+            context.abort(grpc.StatusCode.NOT_FOUND, "User not found")
+        return user_pb(r)
 
     def UpdateUser(self, request, context):
-        r = db.update_user(request.id, request.username, request.active)
-        return db_pb2.User(id=r[0],username=r[1],active=r[2],password_hash=r[3])
+        try:
+            r = db.update_user(request.id, request.username, request.active)
+        except UsernameTaken:
+            context.abort(grpc.StatusCode.ALREADY_EXISTS, "Username is taken")
+        return user_pb(r)
 
 
 # -------------------------
@@ -62,30 +82,45 @@ class UserService(db_pb2_grpc.UserServiceServicer):
 class OrderService(db_pb2_grpc.OrderServiceServicer):
     def CreateOrder(self, request, context):
         # 参数校验
-        if request.quantity > 3:
-            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Quantity cannot exceed 3")
+        if request.quantity > MAX_QUANTITY:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, QUANTITY_TOO_LARGE)
 
-        r = db.create_order(request.user_id, request.product_id, request.quantity)
-        return db_pb2.Order(
-            id=r[0], user_id=r[1], product_id=r[2],
-            quantity=r[3], total_price=float(r[4]), canceled=r[5]
-        )
+        try:
+            r = db.create_order(
+                request.user_id, request.product_id, request.quantity, request.idempotency_key or None
+            )
+        except OutOfStock:
+            context.abort(grpc.StatusCode.FAILED_PRECONDITION, "Out of stock")
+        if r is None:
+            context.abort(grpc.StatusCode.NOT_FOUND, "Product not found")
+        return order_pb(r)
+
+    def CreateOrders(self, request, context):
+        if not request.orders:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, EMPTY_BATCH)
+        rejected = batch_quantity_errors(request.orders)
+        if rejected is not None:
+            return rejected
+
+        try:
+            rows, missing = db.create_orders(batch_items(request.orders))
+        except OutOfStock as e:
+            return batch_out_of_stock(e)
+        if missing:
+            return batch_missing(missing)
+        return batch_placed(rows)
 
     def GetOrder(self, request, context):
         r = db.get_order(request.id)
         if r is None:
             context.abort(grpc.StatusCode.NOT_FOUND, "Order not found")
-        return db_pb2.Order(
-            id=r[0], user_id=r[1], product_id=r[2],
-            quantity=r[3], total_price=float(r[4]), canceled=r[5]
-        )
+        return order_pb(r)
 
     def CancelOrder(self, request, context):
         r = db.cancel_order(request.id)
-        return db_pb2.Order(
-            id=r[0], user_id=r[1], product_id=r[2],
-            quantity=r[3], total_price=float(r[4]), canceled=r[5]
-        )
+        if r is None:
+            context.abort(grpc.StatusCode.NOT_FOUND, "Order not found")
+        return order_pb(r)
 
 
 # -------------------------
@@ -93,18 +128,32 @@ class OrderService(db_pb2_grpc.OrderServiceServicer):
 # -------------------------
 
 def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    global db
+    db = open_storage(os.getenv("DB_STORAGE", "postgres"), WORKERS)
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=WORKERS),
+        interceptors=[MetricsInterceptor(), TraceInterceptor(), DeadlineInterceptor()],
+    )
 
     db_pb2_grpc.add_ProductServiceServicer_to_server(ProductService(), server)
     db_pb2_grpc.add_UserServiceServicer_to_server(UserService(), server)
     db_pb2_grpc.add_OrderServiceServicer_to_server(OrderService(), server)
 
-    server.add_insecure_port("[::]:50051")
-    print("DB Service is running on port 50051...")
+    # DB_GRPC_PORT lets several replicas run side by side on one host
+    port = os.getenv("DB_GRPC_PORT", "50051")
+    server.add_insecure_port(f"[::]:{port}")
+    print(f"DB Service is running on port {port}...")
 
+    start_metrics_server()
     server.start()
     server.wait_for_termination()
 
 
 if __name__ == "__main__":
-    serve()
+    # DB_SERVER_MODE=aio serves on grpc.aio and asyncpg instead, see aio_server.py
+    if os.getenv("DB_SERVER_MODE", "sync") == "aio":
+        import asyncio
+        import aio_server
+        asyncio.run(aio_server.serve())
+    else:
+        serve()
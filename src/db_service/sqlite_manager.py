@@ -0,0 +1,351 @@
+import collections
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from metrics import execute
+from storage import SEED_PRODUCTS, OutOfStock, Storage, UsernameTaken
+
+# db-init/init.sql cut down to the columns the servicers read. The triggers
+# play the part of product_version_seq: writes are serialized in SQLite, so
+# MAX(version) + 1 is always a fresh number.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+  id INTEGER PRIMARY KEY,
+  name TEXT NOT NULL,
+  category TEXT,
+  price REAL NOT NULL,
+  stock INTEGER NOT NULL DEFAULT 500,
+  version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TRIGGER IF NOT EXISTS products_version_on_insert AFTER INSERT ON products
+BEGIN
+  UPDATE products SET version = (SELECT MAX(version) + 1 FROM products) WHERE id = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS products_version_on_update
+  AFTER UPDATE OF name, category, price, stock ON products
+BEGIN
+  UPDATE products SET version = (SELECT MAX(version) + 1 FROM products) WHERE id = NEW.id;
+END;
+CREATE TABLE IF NOT EXISTS users (
+  id INTEGER PRIMARY KEY,
+  username TEXT UNIQUE NOT NULL,
+  password_hash TEXT NOT NULL,
+  active INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS orders (
+  id INTEGER PRIMARY KEY,
+  user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+  product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
+  quantity INTEGER CHECK (quantity > 0 AND quantity <= 3),
+  total_price REAL NOT NULL,
+  canceled INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  user_id INTEGER NOT NULL,
+  idem_key TEXT NOT NULL,
+  order_id INTEGER REFERENCES orders(id) ON DELETE CASCADE,
+  PRIMARY KEY (user_id, idem_key)
+);
+"""
+
+
+class SQLiteDBManager(Storage):
+    """
+    Storage in a SQLite file (DB_STORAGE=sqlite): the same statements as
+    DBManager without a database server, for local runs and load tests.
+    The schema is created, and seeded with the products of db-init/init.sql,
+    on first use of the file.
+
+    Each gRPC worker thread gets its own connection in WAL mode, so reads run
+    side by side; writes take the file's write lock with BEGIN IMMEDIATE.
+    Booleans come back as 0/1 and prices as floats, which the servicers
+    convert like Postgres' booleans and Decimals.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conns = []
+        self._conns_lock = threading.Lock()
+
+        # rows read per query by stream_products
+        self.stream_fetch_size = int(os.getenv("PRODUCT_STREAM_FETCH_SIZE", "1000"))
+
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        with self._transaction() as cur:
+            cur.execute("SELECT COUNT(*) FROM products;")
+            if cur.fetchone()[0] == 0:
+                cur.executemany("""
+                    INSERT INTO products (name, category, price, stock)
+                    VALUES (?, ?, ?, ?);
+                """, [(n, c, float(p), s) for n, c, p, s in SEED_PRODUCTS])
+
+    # --------------------
+    # Internal helpers
+    # --------------------
+    def _conn(self):
+        """This thread's connection, opened on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit; writes open their transaction themselves
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL;")
+            conn.execute("PRAGMA synchronous = NORMAL;")
+            conn.execute("PRAGMA foreign_keys = ON;")
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """A cursor inside BEGIN IMMEDIATE, committed unless the block raises"""
+        conn = self._conn()
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE;")
+        try:
+            yield cur
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            cur.close()
+
+    @staticmethod
+    @contextmanager
+    def _unique_username(username):
+        """Turns the violation of users.username's UNIQUE into UsernameTaken"""
+        try:
+            yield
+        except sqlite3.IntegrityError as e:
+            if "users.username" not in str(e):
+                raise
+            raise UsernameTaken(username) from None
+
+    def _fetchone(self, statement, sql, args):
+        cur = self._conn().cursor()
+        try:
+            execute(cur, statement, sql, args)
+            return cur.fetchone()
+        finally:
+            cur.close()
+
+    # --------------------
+    # Products CRUD
+    # --------------------
+    def list_products(self):
+        cur = self._conn().cursor()
+        try:
+            execute(cur, "list_products", """
+                SELECT id, name, category, price, stock, version
+                FROM products;
+            """, ())
+            return cur.fetchall()
+        finally:
+            cur.close()
+
+    def get_product(self, pid):
+        return self._fetchone("get_product", """
+            SELECT id, name, category, price, stock, version
+            FROM products
+            WHERE id = ?;
+        """, (pid,))
+
+    def stream_products(self, after_id=0, limit=None):
+        """
+        Reads stream_fetch_size rows per query, continuing after the last id sent.
+        No cursor stays open between chunks: gRPC may resume this generator on
+        another worker thread, which must use its own connection.
+        """
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = self.stream_fetch_size if remaining is None else min(remaining, self.stream_fetch_size)
+            cur = self._conn().cursor()
+            try:
+                execute(cur, "stream_products", """
+                    SELECT id, name, category, price, stock, version
+                    FROM products
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?;
+                """, (after_id, size))
+                rows = cur.fetchall()
+            finally:
+                cur.close()
+            yield from rows
+            if len(rows) < size:
+                return
+            after_id = rows[-1][0]
+            if remaining is not None:
+                remaining -= len(rows)
+
+    # --------------------
+    # Users CRUD
+    # --------------------
+    def create_user(self, username, password_hash):
+        with self._unique_username(username), self._transaction() as cur:
+            execute(cur, "create_user", """
+                INSERT INTO users (username, password_hash)
+                VALUES (?, ?)
+                RETURNING id, username, active, password_hash;
+            """, (username, password_hash))
+            return cur.fetchone()
+
+    def get_user(self, uid):
+        return self._fetchone("get_user", """
+            SELECT id, username, active, password_hash
+            FROM users
+            WHERE id = ?;
+        """, (uid,))
+
+    def get_user_by_username(self, username):
+        return self._fetchone("get_user_by_username", """
+            SELECT id, username, active, password_hash
+            FROM users
+            WHERE username = ?;
+        """, (username,))
+
+    def update_user(self, uid, username, active):
+        with self._unique_username(username), self._transaction() as cur:
+            execute(cur, "update_user", """
+                UPDATE users
+                SET username = ?, active = ?
+                WHERE id = ?
+                RETURNING id, username, active, password_hash;
+            """, (username, active, uid))
+            return cur.fetchone()
+
+    # --------------------
+    # Orders CRUD
+    # --------------------
+    def create_order(self, user_id, product_id, quantity, idempotency_key=None):
+        with self._transaction() as cur:
+            if idempotency_key:
+                # the write lock is already held, so a plain lookup cannot race
+                execute(cur, "replay_idempotent_order", """
+                    SELECT o.id, o.user_id, o.product_id, o.quantity, o.total_price, o.canceled
+                    FROM idempotency_keys k
+                    JOIN orders o ON o.id = k.order_id
+                    WHERE k.user_id = ? AND k.idem_key = ?;
+                """, (user_id, idempotency_key))
+                row = cur.fetchone()
+                if row is not None:
+                    return row
+
+            # no UPDATE inside WITH in SQLite: two statements, under the write lock
+            execute(cur, "reserve_stock", """
+                UPDATE products
+                SET stock = stock - ?
+                WHERE id = ? AND stock >= ?
+                RETURNING price;
+            """, (quantity, product_id, quantity))
+            reserved = cur.fetchone()
+            if reserved is None:
+                execute(cur, "get_stock", """
+                    SELECT stock FROM products WHERE id = ?;
+                """, (product_id,))
+                if cur.fetchone() is None:
+                    return None
+                raise OutOfStock()
+
+            execute(cur, "insert_order", """
+                INSERT INTO orders (user_id, product_id, quantity, total_price)
+                VALUES (?, ?, ?, ROUND(? * ?, 2))
+                RETURNING id, user_id, product_id, quantity, total_price, canceled;
+            """, (user_id, product_id, quantity, reserved[0], quantity))
+            row = cur.fetchone()
+
+            if idempotency_key:
+                # replaces a key left without an order
+                execute(cur, "link_idempotency_key", """
+                    INSERT INTO idempotency_keys (user_id, idem_key, order_id)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (user_id, idem_key) DO UPDATE SET order_id = excluded.order_id;
+                """, (user_id, idempotency_key, row[0]))
+            return row
+
+    def create_orders(self, orders):
+        """Same contract as DBManager.create_orders"""
+        with self._transaction() as cur:
+            product_ids = list({o[1] for o in orders})
+            execute(cur, "check_products", f"""
+                SELECT id FROM products WHERE id IN ({", ".join("?" * len(product_ids))});
+            """, product_ids)
+            known = {r[0] for r in cur.fetchall()}
+            missing = [i for i, o in enumerate(orders) if o[1] not in known]
+            if missing:
+                return None, missing
+
+            needed = collections.Counter()
+            for _, product_id, quantity in orders:
+                needed[product_id] += quantity
+            short = set()
+            for product_id in sorted(needed):
+                execute(cur, "reserve_stock", """
+                    UPDATE products
+                    SET stock = stock - ?
+                    WHERE id = ? AND stock >= ?
+                    RETURNING price;
+                """, (needed[product_id], product_id, needed[product_id]))
+                if cur.fetchone() is None:
+                    short.add(product_id)
+            if short:
+                # raising rolls back the stock taken so far
+                raise OutOfStock(i for i, o in enumerate(orders) if o[1] in short)
+
+            rows = []
+            for user_id, product_id, quantity in orders:
+                execute(cur, "insert_order", """
+                    INSERT INTO orders (user_id, product_id, quantity, total_price)
+                    SELECT ?, ?, ?, ROUND(price * ?, 2)
+                    FROM products
+                    WHERE id = ?
+                    RETURNING id, user_id, product_id, quantity, total_price, canceled;
+                """, (user_id, product_id, quantity, quantity, product_id))
+                rows.append(cur.fetchone())
+            return rows, []
+
+    def get_order(self, order_id):
+        return self._fetchone("get_order", """
+            SELECT id, user_id, product_id, quantity, total_price, canceled
+            FROM orders
+            WHERE id = ?;
+        """, (order_id,))
+
+    def cancel_order(self, order_id):
+        with self._transaction() as cur:
+            execute(cur, "cancel_order", """
+                UPDATE orders
+                SET canceled = 1
+                WHERE id = ? AND NOT canceled
+                RETURNING id, user_id, product_id, quantity, total_price, canceled;
+            """, (order_id,))
+            row = cur.fetchone()
+            if row is None:
+                # unknown, or canceled before: nothing to put back
+                execute(cur, "get_order", """
+                    SELECT id, user_id, product_id, quantity, total_price, canceled
+                    FROM orders
+                    WHERE id = ?;
+                """, (order_id,))
+                return cur.fetchone()
+            execute(cur, "restock", """
+                UPDATE products SET stock = stock + ? WHERE id = ?;
+            """, (row[3], row[2]))
+            return row
+
+    # --------------------
+    # Clean up
+    # --------------------
+    def close_pool(self):
+        """Close the connections of all threads"""
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
@@ -0,0 +1,134 @@
+"""
+Storage engines behind the servicers, picked with DB_STORAGE:
+
+- postgres (default): DBManager, the real database
+- sqlite:             SQLiteDBManager, a SQLite file at DB_SQLITE_PATH
+- memory:             MemoryDBManager, indexed dicts in this process
+
+All three implement Storage and return the same rows, so servicer and gRPC
+overhead can be measured without SQL (memory), or with SQL but without a
+database server (sqlite). Request deadlines only reach Postgres: the other
+engines finish a call even when its caller has given up.
+"""
+import os
+from abc import ABC, abstractmethod
+from decimal import Decimal
+
+# the rows db-init/init.sql starts Postgres with: (name, category, price, stock)
+SEED_PRODUCTS = [
+    ("SUSTech Hoodie", "Apparel", Decimal("49.99"), 500),
+    ("SUSTech Water Bottle", "Drinkware", Decimal("19.98"), 500),
+    ("SUSTech Notebook", "Stationery", Decimal("9.97"), 500),
+]
+
+
+class OutOfStock(Exception):
+    """Not enough stock for an order; `lines` are the batch lines short of it"""
+
+    def __init__(self, lines=()):
+        super().__init__("Out of stock")
+        self.lines = list(lines)
+
+
+class UsernameTaken(Exception):
+    """create_user or update_user with a username another user already has"""
+
+    def __init__(self, username):
+        super().__init__(f"username {username!r} is taken")
+        self.username = username
+
+
+class Storage(ABC):
+    """
+    Rows are tuples:
+
+    - product: (id, name, category, price, stock, version)
+    - user:    (id, username, active, password_hash)
+    - order:   (id, user_id, product_id, quantity, total_price, canceled)
+
+    Lookups of a missing id return None. A username another user has raises
+    UsernameTaken, whatever the engine's own error for it is.
+    """
+
+    # --------------------
+    # Products
+    # --------------------
+    @abstractmethod
+    def list_products(self) -> list:
+        ...
+
+    @abstractmethod
+    def get_product(self, pid):
+        ...
+
+    @abstractmethod
+    def stream_products(self, after_id=0, limit=None):
+        """Generator over products with id > after_id in id order (limit None = all)"""
+
+    # --------------------
+    # Users
+    # --------------------
+    @abstractmethod
+    def create_user(self, username, password_hash):
+        ...
+
+    @abstractmethod
+    def get_user(self, uid):
+        ...
+
+    @abstractmethod
+    def get_user_by_username(self, username):
+        ...
+
+    @abstractmethod
+    def update_user(self, uid, username, active):
+        ...
+
+    # --------------------
+    # Orders
+    # --------------------
+    @abstractmethod
+    def create_order(self, user_id, product_id, quantity, idempotency_key=None):
+        """
+        The new order, or None if the product does not exist; takes `quantity`
+        off the product's stock in the same transaction, or raises OutOfStock.
+        An idempotency_key this user already sent returns the order that key
+        created instead.
+        """
+
+    @abstractmethod
+    def create_orders(self, orders):
+        """
+        orders: list of (user_id, product_id, quantity), all-or-nothing.
+        Returns (rows, []) with the rows in input order, or (None, missing)
+        with the indexes of the orders whose product does not exist. Raises
+        OutOfStock with the indexes of the orders whose product has too little.
+        """
+
+    @abstractmethod
+    def get_order(self, order_id):
+        ...
+
+    @abstractmethod
+    def cancel_order(self, order_id):
+        """The canceled order, or None; the first cancel puts its quantity back in stock"""
+
+    # --------------------
+    # Clean up
+    # --------------------
+    def close_pool(self):
+        """Release connections or files"""
+
+
+def open_storage(engine: str, workers: int = 10) -> Storage:
+    """The engine named by DB_STORAGE, for `workers` gRPC worker threads"""
+    if engine == "memory":
+        from memory_manager import MemoryDBManager
+        return MemoryDBManager()
+    if engine == "sqlite":
+        from sqlite_manager import SQLiteDBManager
+        return SQLiteDBManager(os.getenv("DB_SQLITE_PATH", "/tmp/db_service.sqlite3"))
+    if engine == "postgres":
+        from db_manager import DBManager
+        return DBManager(maxconn=workers)
+    raise ValueError(f"unknown DB_STORAGE {engine!r}, expected postgres, sqlite or memory")
@@ -0,0 +1,229 @@
+"""
+ConnectionPool against a fake psycopg2.connect, so no Postgres is needed:
+
+    python -m pytest src/db_service/tests
+"""
+import os
+import sys
+import threading
+import time
+
+import psycopg2
+import pytest
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pool
+from pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, args=None):
+        if not self.conn.alive:
+            raise psycopg2.OperationalError("server closed the connection")
+
+
+class FakeInfo:
+    transaction_status = TRANSACTION_STATUS_IDLE
+
+
+class FakeConnection:
+
+    def __init__(self, number):
+        self.number = number
+        self.closed = 0
+        self.alive = True
+        self.info = FakeInfo()
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeConnect:
+    """psycopg2.connect; `conns` are the connections opened, in order"""
+
+    def __init__(self):
+        self.conns = []
+        # called before each connect when set, to make it slow or raise
+        self.fail = None
+
+    def __call__(self, **dsn):
+        if self.fail is not None:
+            self.fail()
+        conn = FakeConnection(len(self.conns))
+        self.conns.append(conn)
+        return conn
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    fake = FakeConnect()
+    monkeypatch.setattr(pool.psycopg2, "connect", fake)
+    return fake
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.001)
+
+
+def start(target):
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_waiters_are_served_first_come_first_served(connect):
+    p = ConnectionPool(0, 1, timeout=2)
+    held = p.getconn()
+    served = []
+
+    def waiter(i):
+        conn = p.getconn()
+        served.append(i)
+        p.putconn(conn)
+
+    threads = []
+    for i in range(5):
+        threads.append(start(lambda i=i: waiter(i)))
+        # queue them in a known order
+        wait_until(lambda: p.stats()["waiting"] == i + 1)
+
+    p.putconn(held)
+    for thread in threads:
+        thread.join(2)
+    assert served == [0, 1, 2, 3, 4]
+    assert len(connect.conns) == 1
+
+
+def test_returned_connection_skips_newcomers_while_others_wait(connect):
+    p = ConnectionPool(0, 1, timeout=2)
+    held = p.getconn()
+    got = []
+    thread = start(lambda: got.append(p.getconn()))
+    wait_until(lambda: p.stats()["waiting"] == 1)
+
+    p.putconn(held)
+    thread.join(2)
+    # handed to the waiter, not left idle for whoever asks next
+    assert got == [held]
+    with pytest.raises(PoolTimeout):
+        p.getconn(timeout=0.05)
+
+
+def test_getconn_times_out_and_leaves_no_waiter(connect):
+    p = ConnectionPool(0, 1, timeout=0.05)
+    held = p.getconn()
+
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        p.getconn()
+    assert time.monotonic() - started >= 0.05
+    assert p.stats()["waiting"] == 0
+
+    # the abandoned wait must not swallow the next hand-over
+    p.putconn(held)
+    assert p.getconn(timeout=0.05) is held
+
+
+def test_failed_connect_releases_its_slot(connect):
+    p = ConnectionPool(0, 1, timeout=0.1)
+
+    def refuse():
+        raise psycopg2.OperationalError("connection refused")
+
+    connect.fail = refuse
+    with pytest.raises(psycopg2.OperationalError):
+        p.getconn()
+
+    connect.fail = None
+    conn = p.getconn()
+    assert conn is connect.conns[0]
+    assert p.stats()["open"] == 1
+
+
+def test_failed_connect_hands_its_slot_to_a_waiter(connect):
+    p = ConnectionPool(0, 1, timeout=2)
+    connecting = threading.Event()
+    proceed = threading.Event()
+
+    def slow_refusal():
+        connecting.set()
+        proceed.wait(2)
+        raise psycopg2.OperationalError("connection refused")
+
+    connect.fail = slow_refusal
+    errors = []
+
+    def first():
+        try:
+            p.getconn()
+        except psycopg2.OperationalError as e:
+            errors.append(e)
+
+    first_thread = start(first)
+    assert connecting.wait(2)
+    # the only slot is taken by the connect in progress
+    got = []
+    second_thread = start(lambda: got.append(p.getconn()))
+    wait_until(lambda: p.stats()["waiting"] == 1)
+
+    connect.fail = None
+    proceed.set()
+    first_thread.join(2)
+    second_thread.join(2)
+    assert len(errors) == 1
+    assert got == connect.conns
+    assert p.stats() == {"open": 1, "idle": 0, "in_use": 1, "waiting": 0, "max": 1}
+
+
+def test_idle_connection_past_max_lifetime_is_replaced_on_checkout(connect):
+    p = ConnectionPool(1, 1, max_lifetime=0.05)
+    old = connect.conns[0]
+    time.sleep(0.1)
+
+    conn = p.getconn()
+    assert conn is not old
+    assert old.closed
+    assert p.stats()["open"] == 1
+
+
+def test_connection_past_max_lifetime_is_closed_on_return(connect):
+    p = ConnectionPool(0, 1, max_lifetime=0.05)
+    conn = p.getconn()
+    time.sleep(0.1)
+
+    p.putconn(conn)
+    assert conn.closed
+    assert p.stats()["open"] == 0
+    assert p.getconn() is not conn
+
+
+def test_dead_idle_connection_is_replaced(connect):
+    p = ConnectionPool(1, 1, check_after=0)
+    dead = connect.conns[0]
+    dead.alive = False
+
+    conn = p.getconn()
+    assert conn is not dead
+    assert dead.closed
@@ -0,0 +1,143 @@
+"""
+Spans of db_service, joined to the caller's trace.
+
+TraceInterceptor continues the trace whose context the API sent in the
+`traceparent` gRPC metadata key (or starts one, for callers that sent none)
+and runs each handler in a "handle <method>" span; DBManager adds spans for
+the pool checkout and for each SQL statement (see metrics.execute).
+
+Spans, sampling and export are protos_shared/telemetry.py, shared with the
+other services: the caller's decision is kept, new traces are sampled with
+TRACE_SAMPLE_RATE, and sampled spans are written as JSON lines to TRACE_FILE
+(stdout when empty).
+"""
+import os
+import sys
+from functools import partial
+
+import grpc
+
+from interceptors import method_name, wrap_handler
+
+# telemetry.py lives in protos_shared: /app/protos_shared in the images,
+# src/protos_shared when run from the source tree. The metrics module takes
+# latency_buckets from here too, so the path is set up in one place
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "protos_shared")
+for path in ("/app/protos_shared", SHARED_DIR):
+    if os.path.isdir(path) and path not in sys.path:
+        sys.path.append(path)
+
+from telemetry import current_span, latency_buckets, set_service, span, start_span, traceparent_of
+
+# latency_buckets and span are re-exported for metrics.py and the storage engines
+__all__ = ["AioTraceInterceptor", "TraceInterceptor", "latency_buckets", "span"]
+
+set_service("db_service")
+
+
+def _start(method, context):
+    return start_span(f"handle {method}", traceparent_of(context))
+
+
+def _error(context, e):
+    code = context.code()
+    return code.name if code is not None else repr(e)
+
+
+class TraceInterceptor(grpc.ServerInterceptor):
+
+    def intercept_service(self, continuation, handler_call_details):
+        method = method_name(handler_call_details)
+        return wrap_handler(
+            continuation(handler_call_details),
+            partial(_unary, method), partial(_stream, method),
+        )
+
+
+class AioTraceInterceptor(grpc.aio.ServerInterceptor):
+    """TraceInterceptor for the grpc.aio server (aio_server.py)"""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        method = method_name(handler_call_details)
+        return wrap_handler(
+            await continuation(handler_call_details),
+            partial(_aio_unary, method), partial(_aio_stream, method),
+        )
+
+
+def _unary(method, behavior):
+    def handler(request, context):
+        s = _start(method, context)
+        token = current_span.set(s)
+        try:
+            return behavior(request, context)
+        except Exception as e:
+            s.error = _error(context, e)
+            raise
+        finally:
+            current_span.reset(token)
+            s.end()
+    return handler
+
+
+def _stream(method, behavior):
+    def handler(request, context):
+        s = _start(method, context)
+        responses = behavior(request, context)
+        try:
+            while True:
+                # current only while the servicer runs, as in request_scope._stream
+                token = current_span.set(s)
+                try:
+                    response = next(responses)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    s.error = _error(context, e)
+                    raise
+                finally:
+                    current_span.reset(token)
+                yield response
+        finally:
+            responses.close()
+            s.end()
+    return handler
+
+
+def _aio_unary(method, behavior):
+    async def handler(request, context):
+        s = _start(method, context)
+        token = current_span.set(s)
+        try:
+            return await behavior(request, context)
+        except Exception as e:
+            s.error = _error(context, e)
+            raise
+        finally:
+            current_span.reset(token)
+            s.end()
+    return handler
+
+
+def _aio_stream(method, behavior):
+    async def handler(request, context):
+        s = _start(method, context)
+        responses = behavior(request, context)
+        try:
+            while True:
+                # current only while the servicer runs, as in _stream
+                token = current_span.set(s)
+                try:
+                    response = await responses.__anext__()
+                except StopAsyncIteration:
+                    return
+                except Exception as e:
+                    s.error = _error(context, e)
+                    raise
+                finally:
+                    current_span.reset(token)
+                yield response
+        finally:
+            await responses.aclose()
+            s.end()
+    return handler
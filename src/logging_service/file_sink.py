@@ -0,0 +1,23 @@
+import os
+import threading
+
+
+class FileLogger:
+    """
+    Stand-in for KafkaLogger (LOGGING_SINK=file): appends each message to a
+    local file as "<key>\\t<value>" lines instead of producing to Kafka, so the
+    service runs without a broker, e.g. in local load tests.
+    """
+
+    def __init__(self):
+        self.path = os.getenv("LOGGING_SINK_PATH", "/tmp/logging_service.log")
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def send_log(self, key: str, value: str):
+        with self._lock:
+            self._file.write(f"{key}\t{value}\n")
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
@@ -0,0 +1,72 @@
+"""
+Latency histograms and counters of logging_service, served in the Prometheus
+text format on LOGGING_METRICS_PORT (0 disables it).
+
+- grpc_server_duration_seconds{method}   handler time, per RPC
+- grpc_server_handled_total{method, code}
+- log_messages_total                     messages received and handed to Kafka
+- kafka_flush_duration_seconds           the wait for Kafka at the end of each PushLog
+"""
+import os
+import time
+
+import grpc
+from prometheus_client import Counter, Histogram, start_http_server
+
+from tracing import latency_buckets
+
+METRICS_PORT = int(os.getenv("LOGGING_METRICS_PORT", "9102"))
+
+LATENCY_BUCKETS = latency_buckets()
+
+GRPC_SERVER_DURATION = Histogram(
+    "grpc_server_duration_seconds", "Time spent handling an RPC",
+    ["method"], buckets=LATENCY_BUCKETS,
+)
+GRPC_SERVER_HANDLED = Counter(
+    "grpc_server_handled_total", "RPCs handled, by outcome",
+    ["method", "code"],
+)
+LOG_MESSAGES = Counter("log_messages_total", "Log messages received")
+KAFKA_FLUSH = Histogram(
+    "kafka_flush_duration_seconds", "Time to flush the Kafka producer",
+    buckets=LATENCY_BUCKETS,
+)
+
+
+def start_metrics_server():
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        print(f"Metrics on port {METRICS_PORT}")
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """Times every client-streaming RPC (PushLog), from first read to response"""
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or not handler.stream_unary:
+            return handler
+        method = handler_call_details.method.rsplit("/", 1)[-1]
+        return grpc.stream_unary_rpc_method_handler(
+            _stream_unary(method, handler.stream_unary),
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
+
+
+def _stream_unary(method, behavior):
+    def handler(request_iterator, context):
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = behavior(request_iterator, context)
+            failed = False
+            return response
+        finally:
+            code = context.code()
+            if code is None:
+                code = grpc.StatusCode.UNKNOWN if failed else grpc.StatusCode.OK
+            GRPC_SERVER_DURATION.labels(method).observe(time.perf_counter() - started)
+            GRPC_SERVER_HANDLED.labels(method, code.name).inc()
+    return handler
@@ -13,7 +13,14 @@ if GRPC_DIR not in sys.path:
 import logging_pb2
 import logging_pb2_grpc
 
-from kafka_producer import KafkaLogger
+from metrics import KAFKA_FLUSH, LOG_MESSAGES, MetricsInterceptor, start_metrics_server
+from tracing import TraceInterceptor, span
+
+# LOGGING_SINK=file writes to LOGGING_SINK_PATH instead of Kafka (local load tests)
+if os.getenv("LOGGING_SINK", "kafka") == "file":
+    from file_sink import FileLogger as KafkaLogger
+else:
+    from kafka_producer import KafkaLogger
 
 
 class LoggingService(logging_pb2_grpc.LoggingServiceServicer):
@@ -33,20 +40,26 @@ class LoggingService(logging_pb2_grpc.LoggingServiceServicer):
             print(f"Received log: {text}")
             self.kafka_logger.send_log(key=log_msg.service_name, value=text)
             count += 1
+        LOG_MESSAGES.inc(count)
 
         # flush producer at the end
-        self.kafka_logger.flush()
+        with KAFKA_FLUSH.time(), span("kafka flush"):
+            self.kafka_logger.flush()
 
         return logging_pb2.PushLogStatus(success=True, count=count)
 
 
 def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=10),
+        interceptors=[MetricsInterceptor(), TraceInterceptor()],
+    )
     logging_pb2_grpc.add_LoggingServiceServicer_to_server(LoggingService(), server)
 
     port = os.getenv("LOGGING_SERVICE_PORT", "50052")
     server.add_insecure_port(f"[::]:{port}")
     print(f"Logging Service is running on port {port}...")
+    start_metrics_server()
     server.start()
     server.wait_for_termination()
 
@@ -0,0 +1,61 @@
+"""
+Spans of logging_service, joined to the caller's trace.
+
+TraceInterceptor continues the trace whose context the API sent in the
+`traceparent` gRPC metadata key and runs each PushLog in a "handle PushLog"
+span, with the Kafka flush as a child span.
+
+Spans, sampling and export are protos_shared/telemetry.py, shared with the
+other services: the caller's decision is kept, new traces are sampled with
+TRACE_SAMPLE_RATE, and sampled spans are written as JSON lines to TRACE_FILE
+(stdout when empty).
+"""
+import os
+import sys
+
+import grpc
+
+# telemetry.py lives in protos_shared: /app/protos_shared in the images,
+# src/protos_shared when run from the source tree. The metrics module takes
+# latency_buckets from here too, so the path is set up in one place
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "protos_shared")
+for path in ("/app/protos_shared", SHARED_DIR):
+    if os.path.isdir(path) and path not in sys.path:
+        sys.path.append(path)
+
+from telemetry import current_span, latency_buckets, set_service, span, start_span, traceparent_of
+
+# latency_buckets and span are re-exported for metrics.py and server.py
+__all__ = ["TraceInterceptor", "latency_buckets", "span"]
+
+set_service("logging_service")
+
+
+class TraceInterceptor(grpc.ServerInterceptor):
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or not handler.stream_unary:
+            return handler
+        method = handler_call_details.method.rsplit("/", 1)[-1]
+        return grpc.stream_unary_rpc_method_handler(
+            _stream_unary(method, handler.stream_unary),
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
+
+
+def _stream_unary(method, behavior):
+    def handler(request_iterator, context):
+        s = start_span(f"handle {method}", traceparent_of(context))
+        token = current_span.set(s)
+        try:
+            return behavior(request_iterator, context)
+        except Exception as e:
+            code = context.code()
+            s.error = code.name if code is not None else repr(e)
+            raise
+        finally:
+            current_span.reset(token)
+            s.end()
+    return handler
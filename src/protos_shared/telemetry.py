@@ -0,0 +1,166 @@
+"""
+Tracing and metrics helpers shared by api_service, db_service and
+logging_service; each service names itself once with set_service().
+
+Tracing: each HTTP request starts a trace, or joins the caller's if it sends
+a W3C `traceparent` header. The trace context travels to db_service and
+logging_service in the `traceparent` gRPC metadata key, where their own spans
+(pool checkout, SQL statements, the Kafka flush) are added to the same trace.
+
+Whether a trace is recorded is decided once, where it starts, with probability
+TRACE_SAMPLE_RATE, and that decision travels with the context: a trace is kept
+by every service or by none. Spans of unsampled traces are never exported.
+
+Finished spans are written as JSON lines to TRACE_FILE (stdout when empty);
+benchmarks/show_traces.py merges the files of all services into trees.
+"""
+import contextvars
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import grpc
+
+SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+
+current_span = contextvars.ContextVar("current_span", default=None)
+
+_service = None
+_out = None
+_out_lock = threading.Lock()
+
+
+def set_service(name: str):
+    """The service name written on every span of this process"""
+    global _service
+    _service = name
+
+
+# --------------------
+# Tracing
+# --------------------
+def _export(record: dict):
+    global _out
+    line = json.dumps(record, default=str)
+    with _out_lock:
+        if _out is None:
+            _out = open(TRACE_FILE, "a", buffering=1) if TRACE_FILE else sys.stdout
+        _out.write(line + "\n")
+
+
+def parse_traceparent(value):
+    """(trace_id, parent span id, sampled) from "00-<trace id>-<span id>-<flags>", or None"""
+    parts = (value or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def traceparent_of(context):
+    """The `traceparent` a gRPC caller sent, or None"""
+    for key, value in context.invocation_metadata():
+        if key == "traceparent":
+            return value
+    return None
+
+
+class Span:
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled",
+                 "attributes", "error", "_start", "_started")
+
+    def __init__(self, name: str, trace_id: str, parent_id, sampled: bool):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.error = None
+        if sampled:
+            # unsampled spans only carry the context on
+            self.attributes = {}
+            self._start = time.time()
+            self._started = time.perf_counter()
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def metadata(self):
+        """gRPC metadata carrying this span as the parent of the callee's spans"""
+        return (("traceparent", self.traceparent()),)
+
+    def set(self, key: str, value):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def end(self):
+        if not self.sampled:
+            return
+        _export({
+            "service": _service,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self._start,
+            "duration_ms": round((time.perf_counter() - self._started) * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        })
+
+
+def start_span(name: str, traceparent: str = None) -> Span:
+    """
+    A child of the current span; without one, a child of `traceparent`
+    (the caller's context), or else the root of a new trace.
+    The span is not made current: see span() for that.
+    """
+    parent = current_span.get()
+    if parent is not None:
+        return Span(name, parent.trace_id, parent.span_id, parent.sampled)
+    remote = parse_traceparent(traceparent)
+    if remote is not None:
+        return Span(name, *remote)
+    return Span(name, f"{random.getrandbits(128):032x}", None, random.random() < SAMPLE_RATE)
+
+
+@contextmanager
+def span(name: str, traceparent: str = None):
+    """Runs the block as a new current span"""
+    s = start_span(name, traceparent)
+    token = current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = e.code().name if isinstance(e, grpc.RpcError) else repr(e)
+        raise
+    finally:
+        current_span.reset(token)
+        s.end()
+
+
+# --------------------
+# Metrics
+# --------------------
+def latency_buckets(low: float = 0.0001, high: float = 60.0, per_decade: int = 5):
+    """
+    Log-spaced bucket bounds from `low` to `high` seconds. Like an HDR histogram,
+    each bucket is a constant factor wider than the previous one, so a percentile
+    read from them is off by the same relative amount at 200us as at 20s.
+    """
+    bounds = []
+    step = round(math.log10(low) * per_decade)
+    while not bounds or bounds[-1] < high:
+        bounds.append(float(f"{10 ** (step / per_decade):.2g}"))
+        step += 1
+    return tuple(bounds)